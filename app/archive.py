@@ -0,0 +1,507 @@
+"""
+寄件備份
+--------
+保存每封寄出郵件的線路格式內容（含 DKIM 簽章），可隨時還原成與寄出時逐位元組相同的 .eml：
+- 郵件拆成標頭、內文與各附件，各段以內容雜湊（BLAKE2b）為鍵、zstd 壓縮後存放，
+  週期性排程重複寄出的同一份附件或內文只存一份
+- base64 附件先解碼成原始位元組再壓縮，還原時依記錄的行寬重新編碼；
+  只有重新編碼能完全重現原文時才這樣存，否則存原文
+- MIME 分隔線與各部分的標頭等小片段直接寫在每封郵件的組裝清單（recipe）中
+- 以 SQLite 建立 Message-ID 與寄出時間的索引，可依時間範圍列出或刪除舊郵件；
+  刪除後不再被任何郵件引用的片段一併移除
+
+資料表：
+    messages(id, message_id, sent_at, sender, recipients, subject, size, recipe)
+    blobs(hash, size, codec, data)      codec：zstd / raw（壓縮後沒有變小時）
+    refs(message, hash)                 郵件引用的片段，刪除郵件時用來回收片段
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Optional
+
+from app import config
+from app.log_service import log_error
+
+# 小於此大小的葉節點內容直接寫入組裝清單，不另建片段
+_INLINE_MAX = 256
+# 多層 multipart 的遞迴上限（超過時整段視為單一片段）
+_MAX_DEPTH = 16
+# 記住最近幾個 base64 片段的解碼結果，重複寄出的附件只需計算一次雜湊
+_B64_CACHE_SIZE = 4096
+
+_CONTENT_TYPE_RE = re.compile(rb"(?im)^content-type:[ \t]*((?:.*\r?\n[ \t].*)*.*)$")
+_CTE_RE = re.compile(rb"(?im)^content-transfer-encoding:[ \t]*([\w-]+)")
+_BOUNDARY_RE = re.compile(rb'(?i)boundary[ \t]*=[ \t]*(?:"([^"]+)"|([^;\s]+))')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    message_id TEXT NOT NULL,
+    sent_at REAL NOT NULL,
+    sender TEXT NOT NULL,
+    recipients TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    recipe BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_mid ON messages(message_id);
+CREATE INDEX IF NOT EXISTS messages_sent_at ON messages(sent_at);
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    codec TEXT NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS refs (
+    message INTEGER NOT NULL,
+    hash TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS refs_message ON refs(message);
+CREATE INDEX IF NOT EXISTS refs_hash ON refs(hash);
+"""
+
+
+@dataclass
+class ArchivedMessage:
+    """備份索引中的一封郵件（不含內容）。"""
+
+    id: int
+    message_id: str
+    sent_at: float
+    sender: str
+    recipients: list[str]
+    subject: str
+    size: int
+
+
+# ----------------------------------------------------------
+# 拆解：把線路格式切成連續的片段，串接後與原文完全相同
+# ----------------------------------------------------------
+def _header_end(data: bytes, start: int, end: int) -> int:
+    """回傳標頭區結束（空行之後）的位置；沒有空行時整段視為標頭。"""
+    if data.startswith(b"\r\n", start):
+        return start + 2
+    if data.startswith(b"\n", start):
+        return start + 1
+    i = data.find(b"\r\n\r\n", start, end)
+    if i != -1:
+        return i + 4
+    i = data.find(b"\n\n", start, end)
+    return i + 2 if i != -1 else end
+
+
+def _boundary(headers: bytes) -> Optional[bytes]:
+    m = _CONTENT_TYPE_RE.search(headers)
+    if m is None or not m.group(1).lower().lstrip().startswith(b"multipart/"):
+        return None
+    b = _BOUNDARY_RE.search(m.group(1))
+    return (b.group(1) or b.group(2)) if b else None
+
+
+def _b64_layout(raw: bytes) -> Optional[tuple[bytes, int, str, bool]]:
+    """
+    raw 為標準 base64（固定行寬）時回傳 (解碼內容, 行寬, 換行字元, 最後一行是否有換行)，
+    且保證以這些參數重新編碼會得到與 raw 相同的位元組；否則回傳 None。
+    """
+    nl = b"\r\n" if b"\r\n" in raw else b"\n"
+    first = raw.find(nl)
+    width = first if first != -1 else len(raw)
+    if width <= 0:
+        return None
+    try:
+        decoded = base64.b64decode(raw)
+    except (binascii.Error, ValueError):
+        return None
+    trailing = raw.endswith(nl)
+    if _b64_encode(decoded, width, nl, trailing) != raw:
+        return None
+    return decoded, width, nl.decode(), trailing
+
+
+def _b64_encode(data: bytes, width: int, nl: bytes, trailing: bool) -> bytes:
+    encoded = base64.b64encode(data)
+    out = nl.join(encoded[i : i + width] for i in range(0, len(encoded), width))
+    return out + nl if trailing and out else out
+
+
+def _split(data: bytes) -> list[tuple]:
+    """
+    將郵件切成組裝項目：
+        ("L", bytes)                       直接寫入組裝清單的小片段
+        ("R", bytes)                       以原文存放的片段
+        ("B", bytes)                       base64 編碼的片段，存放前嘗試解碼
+    """
+    items: list[tuple] = []
+    head_end = _header_end(data, 0, len(data))
+    # 最外層標頭獨立存成一個片段
+    items.append(("R", data[:head_end]))
+    _split_body(data, data[:head_end], head_end, len(data), items, 0)
+    return items
+
+
+def _split_part(data: bytes, start: int, end: int, items: list[tuple], depth: int) -> None:
+    head_end = _header_end(data, start, end)
+    if head_end > start:
+        items.append(("L", data[start:head_end]))
+    _split_body(data, data[start:head_end], head_end, end, items, depth)
+
+
+def _split_body(data: bytes, headers: bytes, start: int, end: int, items: list[tuple], depth: int) -> None:
+    if start >= end:
+        return
+    boundary = _boundary(headers) if depth < _MAX_DEPTH else None
+    if boundary is None:
+        _leaf(data[start:end], headers, items)
+        return
+
+    delimiter = b"--" + boundary
+    pos = start
+    part_start = None
+    while True:
+        i = data.find(delimiter, pos, end)
+        # 分隔線必須位於行首，且不是較長的其他 boundary 的開頭
+        while i != -1 and not _is_delimiter(data, i, start, len(delimiter)):
+            i = data.find(delimiter, i + 1, end)
+        if i == -1:
+            break
+        # 分隔線前的換行屬於分隔線（RFC 2046）；不可切到前一條分隔線之前
+        cut = i - 2 if data[i - 2 : i] == b"\r\n" else i - 1
+        cut = max(cut, part_start if part_start is not None else start)
+        if part_start is None:
+            if cut > start:
+                items.append(("L", data[start:cut]))  # preamble
+        else:
+            _split_part(data, part_start, cut, items, depth + 1)
+        line_end = data.find(b"\n", i, end)
+        line_end = end if line_end == -1 else line_end + 1
+        items.append(("L", data[cut:line_end]))
+        if data.startswith(b"--", i + len(delimiter)):
+            # 結束分隔線之後為 epilogue
+            if line_end < end:
+                items.append(("L", data[line_end:end]))
+            return
+        part_start = pos = line_end
+    # 沒有結束分隔線：剩餘內容原樣保存
+    rest = part_start if part_start is not None else start
+    if rest < end:
+        items.append(("R", data[rest:end]))
+
+
+def _is_delimiter(data: bytes, i: int, start: int, length: int) -> bool:
+    if i != start and data[i - 1 : i] != b"\n":
+        return False
+    after = data[i + length : i + length + 2]
+    return after == b"--" or after[:1] in (b"", b"\r", b"\n", b" ", b"\t")
+
+
+def _leaf(body: bytes, headers: bytes, items: list[tuple]) -> None:
+    if len(body) <= _INLINE_MAX:
+        items.append(("L", body))
+        return
+    cte = _CTE_RE.search(headers)
+    is_b64 = cte is not None and cte.group(1).lower() == b"base64"
+    items.append(("B" if is_b64 else "R", body))
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+# ----------------------------------------------------------
+# 備份
+# ----------------------------------------------------------
+class SentArchive:
+    """寄件備份，可跨執行緒共用（寫入以鎖序列化）。"""
+
+    def __init__(self, path: Path | str, *, level: int | None = None):
+        import zstandard
+
+        self.path = Path(path)
+        self.level = config.ARCHIVE_ZSTD_LEVEL if level is None else level
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # base64 原文雜湊 → 組裝項目（解碼內容雜湊、行寬、換行、結尾換行）
+        self._b64_cache: dict[str, list] = {}
+        self._decompressor = zstandard.ZstdDecompressor
+        self._compressor = zstandard.ZstdCompressor
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    # -- 寫入 -------------------------------------------------------------
+    def _zstd(self):
+        # ZstdCompressor 不可跨執行緒共用
+        comp = getattr(self._local, "compressor", None)
+        if comp is None:
+            comp = self._local.compressor = self._compressor(level=self.level)
+        return comp
+
+    def _compress(self, data: bytes) -> tuple[str, bytes]:
+        packed = self._zstd().compress(data)
+        return ("zstd", packed) if len(packed) < len(data) else ("raw", data)
+
+    def store(
+        self,
+        data: bytes,
+        *,
+        message_id: str,
+        sender: str = "",
+        recipients: Iterable[str] = (),
+        subject: str = "",
+        sent_at: float | None = None,
+    ) -> int:
+        """
+        備份一封郵件（線路格式），回傳備份 ID。已存在的片段只計算雜湊，不重新壓縮。
+
+        片段是否存在先在交易外檢查（新片段在鎖外壓縮），寫入時於 BEGIN IMMEDIATE 交易內再確認一次：
+        檢查之後被 prune（本行程或其他行程）刪除的片段會在同一個交易內補回，不會留下缺片段的郵件。
+        """
+        recipe: list = []
+        new_blobs: dict[str, tuple[int, str, bytes]] = {}
+        # 每個引用片段的內容來源：(是否為尚未解碼的 base64 原文, 內容)，供交易內補回遺失的片段
+        sources: dict[str, tuple[bool, bytes]] = {}
+        for kind, content in _split(data):
+            if kind == "L":
+                recipe.append(["L", content.decode("latin-1")])
+                continue
+            if kind == "B":
+                entry, decoded = self._b64_entry(content)
+                if entry is not None:
+                    recipe.append(entry)
+                    if decoded is not None:
+                        sources[entry[1]] = (False, decoded)
+                        self._add_blob(new_blobs, entry[1], decoded)
+                    else:
+                        sources.setdefault(entry[1], (True, content))
+                    continue
+            digest = _digest(content)
+            recipe.append(["R", digest])
+            sources[digest] = (False, content)
+            self._add_blob(new_blobs, digest, content)
+        packed_recipe = self._zstd().compress(json.dumps(recipe, separators=(",", ":")).encode("utf-8"))
+
+        with self._lock:
+            # IMMEDIATE：交易開始即取得寫入鎖，確認片段存在到寫入引用之間其他行程無法 prune
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO blobs(hash, size, codec, data) VALUES (?, ?, ?, ?)",
+                    [(h, size, codec, blob) for h, (size, codec, blob) in new_blobs.items()],
+                )
+                missing = self._missing_blobs(sources.keys() - new_blobs.keys())
+                for digest in missing:
+                    is_b64, content = sources[digest]
+                    if is_b64:
+                        content = base64.b64decode(content)
+                    self._db.execute(
+                        "INSERT INTO blobs(hash, size, codec, data) VALUES (?, ?, ?, ?)",
+                        (digest, len(content), *self._compress(content)),
+                    )
+                cur = self._db.execute(
+                    "INSERT INTO messages(message_id, sent_at, sender, recipients, subject, size, recipe)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        message_id,
+                        time.time() if sent_at is None else sent_at,
+                        sender,
+                        "\n".join(recipients),
+                        subject,
+                        len(data),
+                        packed_recipe,
+                    ),
+                )
+                rowid = cur.lastrowid
+                self._db.executemany("INSERT INTO refs(message, hash) VALUES (?, ?)", [(rowid, h) for h in sources])
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return rowid
+
+    def _b64_entry(self, raw: bytes) -> tuple[Optional[list], Optional[bytes]]:
+        """
+        回傳 base64 片段的組裝項目與解碼內容；片段已存在時解碼內容為 None（不需再存），
+        無法以解碼後重新編碼的方式還原時回傳 (None, None)。
+        """
+        raw_digest = _digest(raw)
+        with self._lock:
+            entry = self._b64_cache.get(raw_digest)
+        if entry is not None and self._has_blob(entry[1]):
+            return entry, None
+        layout = _b64_layout(raw)
+        if layout is None:
+            return None, None
+        decoded, width, nl, trailing = layout
+        entry = ["B", _digest(decoded), width, nl, trailing]
+        with self._lock:
+            if len(self._b64_cache) >= _B64_CACHE_SIZE:
+                self._b64_cache.pop(next(iter(self._b64_cache)))
+            self._b64_cache[raw_digest] = entry
+        return entry, decoded
+
+    def _add_blob(self, new_blobs: dict, digest: str, content: bytes) -> None:
+        if digest not in new_blobs and not self._has_blob(digest):
+            new_blobs[digest] = (len(content), *self._compress(content))
+
+    def _has_blob(self, digest: str) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM blobs WHERE hash = ?", (digest,)).fetchone() is not None
+
+    def _missing_blobs(self, digests: Iterable[str]) -> list[str]:
+        """回傳不在 blobs 中的雜湊；呼叫端需持有 self._lock。"""
+        digests = list(digests)
+        found = set()
+        # SQLite 的參數數量有上限，分批查詢
+        for i in range(0, len(digests), 500):
+            chunk = digests[i : i + 500]
+            sql = f"SELECT hash FROM blobs WHERE hash IN ({','.join('?' * len(chunk))})"
+            found.update(r[0] for r in self._db.execute(sql, chunk))
+        return [d for d in digests if d not in found]
+
+    # -- 查詢與還原 -------------------------------------------------------
+    def find(
+        self,
+        *,
+        message_id: str | None = None,
+        since: float | None = None,
+        until: float | None = None,
+        limit: int | None = None,
+    ) -> list[ArchivedMessage]:
+        """依 Message-ID 或寄出時間範圍（epoch 秒）列出郵件，新的在前。"""
+        where, args = [], []
+        if message_id is not None:
+            where.append("message_id = ?")
+            args.append(message_id)
+        if since is not None:
+            where.append("sent_at >= ?")
+            args.append(since)
+        if until is not None:
+            where.append("sent_at < ?")
+            args.append(until)
+        sql = "SELECT id, message_id, sent_at, sender, recipients, subject, size FROM messages"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY sent_at DESC, id DESC"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+        return [
+            ArchivedMessage(rid, mid, ts, sender, rcpts.split("\n") if rcpts else [], subject, size)
+            for rid, mid, ts, sender, rcpts, subject, size in rows
+        ]
+
+    def get(self, message_id: str) -> Optional[bytes]:
+        """還原指定 Message-ID 最近一次寄出的郵件，找不到時回傳 None。"""
+        found = self.find(message_id=message_id, limit=1)
+        return self.rebuild(found[0].id) if found else None
+
+    def rebuild(self, archive_id: int) -> bytes:
+        """依備份 ID 還原郵件原文（與寄出時逐位元組相同）。"""
+        with self._lock:
+            row = self._db.execute("SELECT recipe, size FROM messages WHERE id = ?", (archive_id,)).fetchone()
+        if row is None:
+            raise KeyError(archive_id)
+        dctx = self._decompressor()
+        packed, size = row
+        recipe = json.loads(dctx.decompress(packed))
+        out = []
+        for item in recipe:
+            kind = item[0]
+            if kind == "L":
+                out.append(item[1].encode("latin-1"))
+                continue
+            content = self._blob(item[1], dctx)
+            if kind == "B":
+                content = _b64_encode(content, item[2], item[3].encode(), item[4])
+            out.append(content)
+        data = b"".join(out)
+        if len(data) != size:
+            raise ValueError(f"備份 {archive_id} 還原後大小不符（{len(data)} ≠ {size}）")
+        return data
+
+    def _blob(self, digest: str, dctx) -> bytes:
+        with self._lock:
+            row = self._db.execute("SELECT size, codec, data FROM blobs WHERE hash = ?", (digest,)).fetchone()
+        if row is None:
+            raise ValueError(f"備份片段遺失：{digest}")
+        size, codec, data = row
+        return dctx.decompress(data, max_output_size=size) if codec == "zstd" else data
+
+    # -- 維護 -------------------------------------------------------------
+    def prune(self, before: float) -> int:
+        """刪除 before（epoch 秒）之前寄出的郵件與不再被引用的片段，回傳刪除的郵件數。"""
+        with self._lock:
+            # 被刪除的片段可能仍在 base64 快取中，清空以免之後的備份引用不存在的片段
+            self._b64_cache.clear()
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                ids = [r[0] for r in self._db.execute("SELECT id FROM messages WHERE sent_at < ?", (before,))]
+                self._db.executemany("DELETE FROM refs WHERE message = ?", [(i,) for i in ids])
+                self._db.execute("DELETE FROM messages WHERE sent_at < ?", (before,))
+                self._db.execute("DELETE FROM blobs WHERE hash NOT IN (SELECT hash FROM refs)")
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return len(ids)
+
+    def vacuum(self) -> None:
+        """回收刪除後的檔案空間。"""
+        with self._lock:
+            self._db.execute("VACUUM")
+
+    def stats(self) -> dict:
+        """郵件數、原始大小、片段數與實際占用空間（位元組）。"""
+        with self._lock:
+            messages, raw = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM messages").fetchone()
+            blobs, blob_bytes = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM blobs"
+            ).fetchone()
+            recipes = self._db.execute("SELECT COALESCE(SUM(LENGTH(recipe)), 0) FROM messages").fetchone()[0]
+        return {
+            "messages": messages,
+            "raw_bytes": raw,
+            "blobs": blobs,
+            "stored_bytes": blob_bytes + recipes,
+        }
+
+
+# ----------------------------------------------------------
+# 共用實例
+# ----------------------------------------------------------
+_shared: Optional[SentArchive] = None
+_shared_lock = threading.Lock()
+
+
+def get_archive() -> Optional[SentArchive]:
+    """回傳依 ARCHIVE_FILE 開啟的共用備份；未設定或無法開啟時回傳 None（不備份）。"""
+    global _shared
+    if not config.ARCHIVE_FILE:
+        return None
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                try:
+                    _shared = SentArchive(config.ARCHIVE_FILE)
+                except (OSError, sqlite3.Error) as exc:
+                    log_error(f"無法開啟寄件備份：{exc}")
+                    return None
+    return _shared
@@ -0,0 +1,97 @@
+"""
+寄件備份命令列
+--------------
+    python -m app.archive_cli list --since 2025-09-01
+    python -m app.archive_cli show "<id@example.com>" -o message.eml
+    python -m app.archive_cli stats
+    python -m app.archive_cli prune --older-than 365
+
+show 輸出的內容與寄出時逐位元組相同（含 DKIM 簽章），可直接以郵件程式開啟。
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from app import config
+from app.archive import SentArchive
+
+
+def _parse_time(value: str) -> float:
+    return datetime.fromisoformat(value).timestamp()
+
+
+def _cmd_list(archive: SentArchive, args) -> None:
+    since = args.since
+    if args.days is not None:
+        since = time.time() - args.days * 86400
+    for m in archive.find(message_id=args.mid, since=since, until=args.until, limit=args.limit):
+        rcpts = ", ".join(m.recipients[:3]) + (f" 等 {len(m.recipients)} 位" if len(m.recipients) > 3 else "")
+        print(f"{datetime.fromtimestamp(m.sent_at):%Y-%m-%d %H:%M:%S}\t{m.message_id}\t{rcpts}\t{m.subject}")
+
+
+def _cmd_show(archive: SentArchive, args) -> None:
+    data = archive.get(args.mid)
+    if data is None:
+        sys.exit(f"找不到 {args.mid}")
+    if args.output == "-":
+        sys.stdout.buffer.write(data)
+    else:
+        Path(args.output).write_bytes(data)
+        print(f"已寫入 {args.output}（{len(data):,} 位元組）", file=sys.stderr)
+
+
+def _cmd_stats(archive: SentArchive, args) -> None:
+    s = archive.stats()
+    ratio = s["raw_bytes"] / s["stored_bytes"] if s["stored_bytes"] else 0
+    print(f"郵件 {s['messages']:,} 封，原始 {s['raw_bytes'] / 1e6:,.1f} MB")
+    print(f"片段 {s['blobs']:,} 個，實際占用 {s['stored_bytes'] / 1e6:,.1f} MB（{ratio:.1f}x）")
+
+
+def _cmd_prune(archive: SentArchive, args) -> None:
+    removed = archive.prune(time.time() - args.older_than * 86400)
+    archive.vacuum()
+    print(f"已刪除 {removed:,} 封郵件")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.archive_cli", description="SimpleMailGUI 寄件備份")
+    parser.add_argument("--file", type=Path, default=config.ARCHIVE_FILE, help="備份檔案（預設為 ARCHIVE_FILE）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("list", help="依 Message-ID 或寄出時間列出郵件（新的在前）")
+    p.add_argument("--mid", help="Message-ID")
+    p.add_argument("--since", type=_parse_time, help="起始時間，例如 2025-09-01 或 2025-09-01T09:00")
+    p.add_argument("--until", type=_parse_time, help="結束時間")
+    p.add_argument("--days", type=int, help="最近 N 天")
+    p.add_argument("-n", "--limit", type=int, default=50)
+    p.set_defaults(func=_cmd_list)
+
+    p = sub.add_parser("show", help="還原郵件原文（.eml）")
+    p.add_argument("mid", help="Message-ID（含角括號）")
+    p.add_argument("-o", "--output", default="-")
+    p.set_defaults(func=_cmd_show)
+
+    p = sub.add_parser("stats", help="郵件數與去重、壓縮後的占用空間")
+    p.set_defaults(func=_cmd_stats)
+
+    p = sub.add_parser("prune", help="刪除舊郵件與不再被引用的片段")
+    p.add_argument("--older-than", type=int, required=True, help="刪除幾天前寄出的郵件")
+    p.set_defaults(func=_cmd_prune)
+
+    args = parser.parse_args(argv)
+    if not args.file:
+        parser.error("未設定 ARCHIVE_FILE，請以 --file 指定備份檔案")
+    archive = SentArchive(args.file)
+    try:
+        args.func(archive, args)
+    finally:
+        archive.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+自適應 SMTP 連線數
+------------------
+依中繼伺服器當下的狀況以 AIMD（加法增加、乘法減少）調整同時寄送的連線數：
+- 從 SMTP_MIN_SESSIONS 開始，讓第一個視窗在低負載下量到基準延遲
+- 每收集一個視窗的寄送延遲樣本評估一次：期間有寄送因連線數已滿而等待、
+  且延遲中位數未超過基準的 ADAPTIVE_LATENCY_TOLERANCE 倍時增加上限；
+  第一次減少之前每次加倍（slow start），之後每次加 1
+- 延遲中位數超過基準的容許倍數（伺服器開始排隊）時，上限乘以 ADAPTIVE_BACKOFF
+- 收到 421 / 4xx 回覆、連線被拒或中斷時立即乘以 ADAPTIVE_BACKOFF；使用中的連線降到新上限以內之前
+  的錯誤通常來自同一次限流，不重複減少；視窗內有這類錯誤時也不增加上限
+- 基準延遲為最近 _BASELINE_WINDOWS 個視窗中位數的最小值，伺服器長期變慢後基準會跟著更新
+- 減少上限後，使用中的連線降到新上限以下之前的交易仍是舊負載下的延遲，不計入之後的視窗
+
+上限介於 SMTP_MIN_SESSIONS 與 SMTP_MAX_SESSIONS 之間，目前上限與調整紀錄由 stats() 提供。
+"""
+
+from __future__ import annotations
+
+import smtplib
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from app import config
+from app.log_service import log_info
+
+# 每次評估至少需要的延遲樣本數（實際為 max(此值, 目前上限 × 2)）
+_MIN_WINDOW = 8
+# 基準延遲取最近幾個視窗中位數的最小值
+_BASELINE_WINDOWS = 30
+# 保留的上限調整紀錄筆數
+_HISTORY_SIZE = 100
+
+
+def throttle_reason(exc: BaseException) -> Optional[str]:
+    """
+    回傳代表伺服器限流或過載的錯誤類別（"421" / "4xx" / "disconnect"），
+    一般的永久失敗（5xx、收件者不存在、郵件格式錯誤）回傳 None。
+    """
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in exc.recipients.values()]
+        temporary = [code for code in codes if 400 <= code < 500]
+        if not temporary:
+            return None
+        return "421" if 421 in temporary else "4xx"
+    if isinstance(exc, smtplib.SMTPResponseException):
+        if exc.smtp_code == 421:
+            return "421"
+        return "4xx" if 400 <= exc.smtp_code < 500 else None
+    if isinstance(exc, smtplib.SMTPServerDisconnected):
+        return "disconnect"
+    if isinstance(exc, smtplib.SMTPException):
+        return None
+    return "disconnect" if isinstance(exc, OSError) else None
+
+
+class AdaptiveLimiter:
+    """可動態調整上限的號誌，依 record_success / record_error 的結果調整上限。"""
+
+    def __init__(
+        self,
+        min_limit: int,
+        max_limit: int,
+        *,
+        initial: int | None = None,
+        tolerance: float | None = None,
+        backoff: float | None = None,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.tolerance = config.ADAPTIVE_LATENCY_TOLERANCE if tolerance is None else tolerance
+        self.backoff = config.ADAPTIVE_BACKOFF if backoff is None else backoff
+        start = self.min_limit if initial is None else initial
+        self._limit = float(min(self.max_limit, max(self.min_limit, start)))
+        # 尚未因過載減少過上限時以加倍的速度增加
+        self._slow_start = True
+        self._cond = threading.Condition()
+        self._in_use = 0
+        self._waiting = 0
+        # 本視窗內是否有寄送因上限已滿而等待（有需求才增加上限）
+        self._saturated = False
+        # 本視窗內是否有限流錯誤
+        self._errored = False
+        self._samples: list[float] = []
+        self._medians: deque[float] = deque(maxlen=_BASELINE_WINDOWS)
+        # 最近一次減少上限後，使用中的連線降到上限以內的時間（尚未降到時為 None）
+        self._stable_since: Optional[float] = 0.0
+        self._throttled = 0
+        self.history: deque[dict] = deque(maxlen=_HISTORY_SIZE)
+        self._log_change(self.limit, "start")
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    # -- 號誌 -------------------------------------------------------------
+    def acquire(self) -> None:
+        """取得一個連線名額，已達上限時等待。"""
+        with self._cond:
+            if self._in_use >= self.limit:
+                self._saturated = True
+                self._waiting += 1
+                try:
+                    while self._in_use >= self.limit:
+                        self._cond.wait()
+                finally:
+                    self._waiting -= 1
+            self._in_use += 1
+
+    def release(self) -> None:
+        with self._cond:
+            self._in_use -= 1
+            self._settle()
+            self._cond.notify()
+
+    def over_limit(self) -> bool:
+        """使用中的連線是否超過目前上限（上限剛減少時）。"""
+        return self._in_use > self.limit
+
+    def yield_slot(self) -> None:
+        """超過上限時先交回名額，等待低於上限後再取回；供長時間占用連線的批次在每封之間呼叫。"""
+        with self._cond:
+            if self._in_use <= self.limit:
+                return
+            self._in_use -= 1
+            self._settle()
+            self._cond.notify()
+            while self._in_use >= self.limit:
+                self._cond.wait()
+            self._in_use += 1
+
+    # -- 訊號 -------------------------------------------------------------
+    def record_success(self, latency: float) -> None:
+        """記錄一封成功寄出郵件的 SMTP 交易時間（秒），收滿一個視窗後評估是否調整上限。"""
+        with self._cond:
+            if self._stable_since is None or time.monotonic() - latency < self._stable_since:
+                return
+            self._samples.append(latency)
+            if len(self._samples) < max(_MIN_WINDOW, self.limit * 2):
+                return
+            median = statistics.median(self._samples)
+            self._samples = []
+            saturated = (self._saturated or self._waiting > 0) and not self._errored
+            self._saturated = self._errored = False
+            baseline = min(self._medians, default=median)
+            self._medians.append(median)
+            if median > baseline * self.tolerance:
+                self._decrease(f"latency {median * 1000:.0f}ms > {baseline * 1000:.0f}ms × {self.tolerance:g}")
+                return
+            if saturated and self.limit < self.max_limit:
+                if self._slow_start:
+                    self._set_limit(self._limit * 2, "slow start")
+                else:
+                    self._set_limit(self._limit + 1, "healthy")
+
+    def record_error(self, exc: BaseException) -> Optional[str]:
+        """記錄一次寄送失敗；屬於限流或過載時減少上限並回傳錯誤類別。"""
+        reason = throttle_reason(exc)
+        if reason is None:
+            return None
+        with self._cond:
+            self._throttled += 1
+            self._errored = True
+            if self._stable_since is not None:
+                self._decrease(reason)
+        return reason
+
+    # -- 內部 -------------------------------------------------------------
+    def _decrease(self, reason: str) -> None:
+        self._slow_start = False
+        # 減少後重新收集樣本，避免同一段高延遲重複扣減
+        self._samples = []
+        self._saturated = False
+        self._set_limit(max(self.min_limit, self._limit * self.backoff), reason)
+        self._stable_since = None
+        self._settle()
+
+    def _settle(self) -> None:
+        if self._stable_since is None and self._in_use <= self.limit:
+            self._stable_since = time.monotonic()
+
+    def _set_limit(self, value: float, reason: str) -> None:
+        old = self.limit
+        self._limit = float(min(self.max_limit, max(self.min_limit, value)))
+        if self.limit != old:
+            self._log_change(self.limit, reason)
+            log_info(f"⚙️ SMTP 連線上限 {old} → {self.limit}（{reason}）")
+            self._cond.notify_all()
+
+    def _log_change(self, limit: int, reason: str) -> None:
+        self.history.append({"time": round(time.time(), 3), "limit": limit, "reason": reason})
+
+    def stats(self) -> dict:
+        """目前上限、使用中的連線、基準延遲（毫秒）、限流錯誤數與最近的調整紀錄。"""
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "min": self.min_limit,
+                "max": self.max_limit,
+                "in_use": self._in_use,
+                "waiting": self._waiting,
+                "baseline_ms": round(min(self._medians) * 1000, 1) if self._medians else None,
+                "throttled": self._throttled,
+                "history": list(self.history),
+            }
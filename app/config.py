@@ -16,3 +16,103 @@ SMTP_SECURITY = os.getenv("SMTP_SECURITY", "STARTTLS").upper()
 SMTP_USER = os.getenv("SMTP_USER")
 # 寄件者密碼或應用程式密碼
 SMTP_PASS = os.getenv("SMTP_PASS")
+
+# 排程合併寄送：同一時間窗（秒）內觸發的任務會共用 SMTP 連線
+COALESCE_WINDOW = float(os.getenv("COALESCE_WINDOW", 2.0))
+# 單一連線最多連續寄送的郵件數，超過則另開連線
+SMTP_MAX_PER_SESSION = int(os.getenv("SMTP_MAX_PER_SESSION", 50))
+# 同時開啟的 SMTP 連線上限
+SMTP_MAX_SESSIONS = int(os.getenv("SMTP_MAX_SESSIONS", 2))
+# 優先順序：手動寄送（interactive）、排程（scheduled）、API 大量提交（bulk）依權重輪流取用連線
+DISPATCH_LANE_WEIGHTS = os.getenv("DISPATCH_LANE_WEIGHTS", "interactive=8,scheduled=3,bulk=1")
+# 另外保留給手動寄送的連線數（不計入 SMTP_MAX_SESSIONS），大量寄送進行中也能立即寄出
+INTERACTIVE_SESSIONS = int(os.getenv("INTERACTIVE_SESSIONS", 1))
+# 自適應連線數（app/concurrency.py）：依延遲與 421 / 4xx 回覆在 SMTP_MIN_SESSIONS 與 SMTP_MAX_SESSIONS 之間調整；
+# 設為 0 時固定使用 SMTP_MAX_SESSIONS 條連線
+ADAPTIVE_SESSIONS = os.getenv("ADAPTIVE_SESSIONS", "1").lower() in ("1", "true", "yes")
+SMTP_MIN_SESSIONS = int(os.getenv("SMTP_MIN_SESSIONS", 1))
+# 延遲中位數超過基準的幾倍時視為伺服器過載
+ADAPTIVE_LATENCY_TOLERANCE = float(os.getenv("ADAPTIVE_LATENCY_TOLERANCE", 2.0))
+# 過載或限流時上限乘以此比例
+ADAPTIVE_BACKOFF = float(os.getenv("ADAPTIVE_BACKOFF", 0.5))
+
+# 無介面常駐程式（daemon.py）的本機 IPC 位址，GUI 透過此位址建立與列出排程
+DAEMON_HOST = os.getenv("DAEMON_HOST", "127.0.0.1")
+DAEMON_PORT = int(os.getenv("DAEMON_PORT", 8765))
+# IPC 驗證金鑰；未設定時由 daemon 於專案根目錄產生 .daemon_key 並與 GUI 共用
+DAEMON_AUTHKEY = os.getenv("DAEMON_AUTHKEY", "")
+# 寄送佇列長度上限（0 為不限制），佇列滿時本機提交 API 會回傳 429
+DISPATCH_QUEUE_SIZE = int(os.getenv("DISPATCH_QUEUE_SIZE", 10000))
+
+# 本機提交 API（由 daemon.py 啟動）：設定 SUBMIT_SOCKET 時改用 Unix domain socket
+SUBMIT_ENABLED = os.getenv("SUBMIT_ENABLED", "0").lower() in ("1", "true", "yes")
+SUBMIT_HOST = os.getenv("SUBMIT_HOST", "127.0.0.1")
+SUBMIT_PORT = int(os.getenv("SUBMIT_PORT", 8766))
+SUBMIT_SOCKET = os.getenv("SUBMIT_SOCKET", "")
+# Bearer token，每個請求都需附上 Authorization 標頭；未設定時提交 API 不會啟動
+SUBMIT_TOKEN = os.getenv("SUBMIT_TOKEN", "")
+# 提交 API 只接受位於此目錄內的附件（相對路徑以此目錄為基準），設為空字串則不接受附件
+SUBMIT_UPLOAD_DIR = os.getenv(
+    "SUBMIT_UPLOAD_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "uploads"),
+)
+
+# 效能剖析（app/profiling.py）：預設關閉，也可由 GUI 開關切換
+PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "0").lower() in ("1", "true", "yes")
+# 取樣率（0~1），1 代表每次寄信 / 排程都剖析
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 1.0))
+# 被剖析區段的累計耗時上限（佔啟用後經過時間的比例），超過時暫停取樣
+PROFILE_OVERHEAD_BUDGET = float(os.getenv("PROFILE_OVERHEAD_BUDGET", 0.05))
+# 是否同時以 tracemalloc 記錄記憶體配置（額外成本較高）
+PROFILE_MEMORY = os.getenv("PROFILE_MEMORY", "0").lower() in ("1", "true", "yes")
+PROFILE_DIR = os.getenv(
+    "PROFILE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs", "profiles")
+)
+# 剖析輸出目錄大小上限（位元組），超過時刪除最舊的檔案
+PROFILE_MAX_BYTES = int(os.getenv("PROFILE_MAX_BYTES", 50 * 1024 * 1024))
+
+# 停止寄送名單（app/suppression.py）主檔路徑，設為空字串可停用；新增的位址另寫入同名 .journal 檔
+SUPPRESSION_FILE = os.getenv(
+    "SUPPRESSION_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "suppression.bin"),
+)
+
+# 常見格式的郵件直接序列化（app/fast_mime.py），略過 EmailMessage；設為 0 時一律使用 EmailMessage
+FAST_SERIALIZER = os.getenv("FAST_SERIALIZER", "1").lower() in ("1", "true", "yes")
+
+# DKIM 簽章（app/dkim_signer.py）：三者皆設定時才簽章；私鑰為未加密的 RSA PEM 檔
+DKIM_DOMAIN = os.getenv("DKIM_DOMAIN", "")
+DKIM_SELECTOR = os.getenv("DKIM_SELECTOR", "")
+DKIM_PRIVATE_KEY = os.getenv("DKIM_PRIVATE_KEY", "")
+# 要簽署的標頭（逗號分隔），留空使用預設清單
+DKIM_HEADERS = os.getenv("DKIM_HEADERS", "")
+# 標頭 / 內文正規化方式：simple 或 relaxed
+DKIM_CANONICALIZATION = os.getenv("DKIM_CANONICALIZATION", "relaxed/relaxed")
+# 內文雜湊快取筆數（以內文與附件的路徑、大小、修改時間為鍵，重複寄送相同內容時不需重新計算），0 為停用
+DKIM_BODY_CACHE_SIZE = int(os.getenv("DKIM_BODY_CACHE_SIZE", 1024))
+
+# 冪等寄送紀錄（app/idempotency.py）路徑，設為空字串可停用；已寄出的冪等鍵在到期前不會重複寄送
+IDEMPOTENCY_FILE = os.getenv(
+    "IDEMPOTENCY_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "idempotency.ledger"),
+)
+# 排程與 API 寄送的冪等鍵保留秒數（預設 7 天）
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", 7 * 24 * 3600))
+# 手動寄送（內容雜湊）的冪等鍵保留秒數，過後可刻意重寄相同內容
+IDEMPOTENCY_MANUAL_TTL = float(os.getenv("IDEMPOTENCY_MANUAL_TTL", 600))
+
+# 收件者自動完成（app/contacts.py）的通訊錄檔案，設為空字串可停用；不存在時由寄信日誌建立
+CONTACTS_FILE = os.getenv(
+    "CONTACTS_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "contacts.tsv"),
+)
+# 建議排序的半衰期（天）：越久沒寄送的位址排序越後面
+CONTACTS_HALF_LIFE_DAYS = float(os.getenv("CONTACTS_HALF_LIFE_DAYS", 30))
+
+# 寄件備份（app/archive.py）的 SQLite 檔案，設為空字串可停用；附件與內文以內容雜湊去重並以 zstd 壓縮
+ARCHIVE_FILE = os.getenv(
+    "ARCHIVE_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "archive.sqlite"),
+)
+# 備份片段的 zstd 壓縮等級（1–22），越高越省空間但第一次寄出新附件時越耗 CPU
+ARCHIVE_ZSTD_LEVEL = int(os.getenv("ARCHIVE_ZSTD_LEVEL", 6))
@@ -0,0 +1,428 @@
+"""
+收件者自動完成
+--------------
+依寄送紀錄與匯入的通訊錄，在輸入收件者時即時建議位址：
+- 前綴索引為排序陣列 + bisect，鍵為位址與顯示名稱（整個名稱及其中每個字），不分大小寫
+- 依使用頻率與最近使用時間排序：每次寄送加 1 分、分數每 CONTACTS_HALF_LIFE_DAYS 天減半
+  （以 log2 儲存，不需定期衰減即可直接比較）
+- 符合筆數很多的短前綴（例如單一字母）在建立索引時預先算好前幾名，
+  每次查詢最多掃描 _HOT_RANGE 筆，數萬筆通訊錄也能在一毫秒內完成
+- 索引建立後新寄送的位址放在記憶體中的小型清單，與索引結果合併排序，累積到一定數量才重建
+- 紀錄檔在背景執行緒讀取，GUI 啟動不需等待；第一次使用時由既有的寄信日誌建立
+- 附加與重寫紀錄檔都在跨行程鎖（同名 .lock 檔）內進行，重寫前重新讀取檔案，
+  不會抹除 contacts_cli 或 daemon 同時寫入的聯絡人
+
+紀錄檔格式（每行一筆，後寫入的覆蓋先寫入的）：
+    位址 \\t 顯示名稱 \\t 寄送次數 \\t 最後寄送時間（epoch 秒）\\t 排序分數（log2）
+"""
+
+from __future__ import annotations
+
+import bisect
+import csv
+import heapq
+import math
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from app import config
+from app.file_lock import FileLock
+from app.log_service import log_error, log_info
+from app.recipients import _format, parse_address, split_addresses
+
+# 預設建議筆數上限
+SUGGEST_LIMIT = 8
+# 符合筆數超過此值的前綴在建立索引時預先算好前幾名
+_HOT_RANGE = 256
+# 新寄送的位址累積超過此數量時在背景重建索引
+_REBUILD_AFTER = 512
+_NAME_SPLIT_RE = re.compile(r"[\s,.;()\"'<>_-]+")
+# 寄信日誌中成功紀錄的格式（見 mail_service.deliver）
+_SENT_RECORD_RE = re.compile(r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)\S* \[INFO\] 寄信成功 → To:(.*?) Cc:(.*?) Rcpt:")
+
+
+@dataclass
+class Contact:
+    address: str
+    name: str = ""
+    count: int = 0
+    last_used: float = 0.0
+    # log2(Σ 2^(寄送時間 / 半衰期))；從未寄送過為 -inf
+    rank: float = -math.inf
+
+    @property
+    def display(self) -> str:
+        """填入收件者欄位用的格式，例如 "Doe, Jane" <jane@example.com>。"""
+        return _format(self.name, self.address)
+
+    def use(self, ts: float, half_life: float) -> None:
+        self.count += 1
+        self.last_used = max(self.last_used, ts)
+        x = ts / half_life
+        if self.rank == -math.inf:
+            self.rank = x
+        else:
+            # log2(2^rank + 2^x)
+            hi, lo = max(self.rank, x), min(self.rank, x)
+            self.rank = hi + math.log2(1 + 2 ** (lo - hi))
+
+
+def _keys(contact: Contact) -> set[str]:
+    """索引鍵：位址、完整顯示名稱與名稱中的每個字（皆為小寫）。"""
+    keys = {contact.address.lower()}
+    name = contact.name.strip().lower()
+    if name:
+        keys.add(name)
+        keys.update(w for w in _NAME_SPLIT_RE.split(name) if w)
+    return keys
+
+
+def _normalize_prefix(prefix: str) -> str:
+    return prefix.strip().lstrip("\"'<").lower()
+
+
+def _rank_key(contact: Contact) -> tuple[float, int]:
+    return contact.rank, contact.count
+
+
+# ----------------------------------------------------------
+# 前綴索引
+# ----------------------------------------------------------
+class PrefixIndex:
+    """排序後的 (鍵, 聯絡人) 陣列；建立後不再修改，更新時整個重建。"""
+
+    def __init__(self, contacts: Iterable[Contact], top_k: int = SUGGEST_LIMIT):
+        self.contacts = list(contacts)
+        pairs = sorted((key, i) for i, c in enumerate(self.contacts) for key in _keys(c))
+        self.keys = [k for k, _ in pairs]
+        self.ids = [i for _, i in pairs]
+        self.top_k = top_k
+        self._hot: dict[str, list[int]] = {}
+        self._precompute()
+
+    def __len__(self) -> int:
+        return len(self.contacts)
+
+    def _top(self, lo: int, hi: int, k: int) -> list[int]:
+        return heapq.nlargest(k, set(self.ids[lo:hi]), key=lambda i: _rank_key(self.contacts[i]))
+
+    def _precompute(self) -> None:
+        """
+        為符合筆數超過 _HOT_RANGE 的每個前綴預先算好前 top_k 名。
+        依下一個字元逐層切分區間，只深入仍然過大的區間。
+        """
+        keys = self.keys
+        stack = [(0, len(keys), 0)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if hi - lo <= _HOT_RANGE:
+                continue
+            prefix = keys[lo][:depth]
+            self._hot[prefix] = self._top(lo, hi, self.top_k)
+            # 長度剛好等於 depth 的鍵排在區間最前面，不再細分
+            start = lo
+            while start < hi and len(keys[start]) == depth:
+                start += 1
+            while start < hi:
+                child = keys[start][: depth + 1]
+                end = bisect.bisect_left(keys, child + "\U0010ffff", start, hi)
+                stack.append((start, end, depth + 1))
+                start = end
+
+    def lookup(self, prefix: str, limit: int = SUGGEST_LIMIT) -> list[Contact]:
+        """回傳鍵以 prefix（已正規化）開頭的聯絡人，依排序分數由高到低。"""
+        ids = self._hot.get(prefix) if limit <= self.top_k else None
+        if ids is None:
+            lo = bisect.bisect_left(self.keys, prefix)
+            hi = bisect.bisect_left(self.keys, prefix + "\U0010ffff", lo)
+            ids = self._top(lo, hi, limit)
+        return [self.contacts[i] for i in ids[:limit]]
+
+
+# ----------------------------------------------------------
+# 通訊錄：紀錄檔 + 索引
+# ----------------------------------------------------------
+class ContactBook:
+    """寄送紀錄與匯入聯絡人組成的通訊錄，可跨執行緒共用（查詢在 Tk 執行緒，紀錄在寄信執行緒）。"""
+
+    def __init__(self, path: Path | str, *, half_life_days: float | None = None):
+        self.path = Path(path)
+        days = config.CONTACTS_HALF_LIFE_DAYS if half_life_days is None else half_life_days
+        self.half_life = max(days, 0.01) * 86400
+        self.ready = threading.Event()
+        self._lock = threading.Lock()
+        # 與其他行程（GUI / daemon / contacts_cli）的附加與重寫互斥
+        self._file_lock = FileLock(self.path.with_name(self.path.name + ".lock"))
+        self._contacts: dict[str, Contact] = {}
+        self._index: Optional[PrefixIndex] = None
+        # 索引建立後新增或更新的聯絡人（查詢時與索引結果合併）
+        self._recent: dict[str, Contact] = {}
+        self._pending: dict[str, Contact] = {}
+        self._lines = 0
+        self._rebuilding = False
+
+    # -- 載入 -------------------------------------------------------------
+    def load_async(self) -> threading.Thread:
+        """在背景執行緒讀取紀錄並建立索引，完成後 ready 會被設定。"""
+        t = threading.Thread(target=self.load, name="contacts-loader", daemon=True)
+        t.start()
+        return t
+
+    def load(self) -> None:
+        try:
+            start = time.perf_counter()
+            if self.path.is_file():
+                self._read_file()
+            else:
+                self._seed_from_logs()
+            with self._lock:
+                index = PrefixIndex(self._contacts.values())
+                self._index = index
+                self._recent.clear()
+                if self._lines > 2 * len(self._contacts) + 1000:
+                    self._compact()
+            log_info(f"📇 已載入 {len(index):,} 位聯絡人（{(time.perf_counter() - start) * 1000:.0f} ms）")
+        except (OSError, ValueError) as exc:
+            log_error(f"無法載入聯絡人：{exc}")
+        finally:
+            self.ready.set()
+
+    def _read_file(self) -> None:
+        self._contacts, self._lines = _read(self.path)
+
+    def _seed_from_logs(self) -> None:
+        """第一次使用：由寄信日誌中的成功紀錄建立寄送歷史。"""
+        from app.log_index import LogReader
+
+        sender = (config.SMTP_USER or "").lower()
+        for record in LogReader().search(level="INFO", text="寄信成功"):
+            m = _SENT_RECORD_RE.match(record)
+            if m is None:
+                continue
+            ts = datetime.strptime(m.group(1), "%Y-%m-%d %H:%M:%S").timestamp()
+            for token in split_addresses(m.group(2)) + split_addresses(m.group(3)):
+                parsed = parse_address(token)
+                if parsed is not None and parsed[1].lower() != sender:
+                    self._touch(*parsed, ts)
+        # 即使沒有任何紀錄也寫出檔案，之後啟動不再重新掃描日誌
+        with self._lock:
+            self._compact()
+
+    # -- 查詢 -------------------------------------------------------------
+    def __len__(self) -> int:
+        return len(self._contacts)
+
+    def __iter__(self) -> Iterator[Contact]:
+        with self._lock:
+            return iter(list(self._contacts.values()))
+
+    def suggest(self, prefix: str, limit: int = SUGGEST_LIMIT) -> list[Contact]:
+        """回傳符合前綴的聯絡人（索引尚未載入完成時回傳空清單）。"""
+        prefix = _normalize_prefix(prefix)
+        index = self._index
+        if not prefix or index is None:
+            return []
+        found = {c.address.lower(): c for c in index.lookup(prefix, limit)}
+        if self._recent or self._pending:
+            with self._lock:
+                recent = [*self._pending.values(), *self._recent.values()]
+            for c in recent:
+                if any(k.startswith(prefix) for k in _keys(c)):
+                    found[c.address.lower()] = c
+        return heapq.nlargest(limit, found.values(), key=_rank_key)
+
+    # -- 更新 -------------------------------------------------------------
+    def record(self, recipients: Iterable[str], ts: float | None = None) -> None:
+        """記錄一次成功寄送（或建立排程）的收件者，提高其排序分數。"""
+        ts = time.time() if ts is None else ts
+        updated = []
+        with self._lock:
+            for token in recipients:
+                parsed = parse_address(token)
+                if parsed is not None:
+                    updated.append(self._touch(*parsed, ts))
+            self._append(updated)
+        self._maybe_rebuild()
+
+    def add(self, entries: Iterable[tuple[str, str]]) -> int:
+        """加入 (顯示名稱, 位址) 聯絡人（不計為寄送），回傳新增筆數。"""
+        added = []
+        with self._lock:
+            for name, addr in entries:
+                key = addr.lower()
+                contact = self._contacts.get(key)
+                if contact is None:
+                    contact = self._contacts[key] = Contact(addr, name)
+                elif name and not contact.name:
+                    contact.name = name
+                else:
+                    continue
+                self._recent[key] = contact
+                added.append(contact)
+            self._append(added)
+        self._maybe_rebuild()
+        return len(added)
+
+    def _touch(self, name: str, addr: str, ts: float) -> Contact:
+        """更新一位聯絡人的寄送紀錄（呼叫端需持有鎖或尚未公開索引）。"""
+        key = addr.lower()
+        contact = self._contacts.get(key)
+        if contact is None:
+            contact = self._contacts[key] = Contact(addr, name)
+        elif name:
+            contact.name = name
+        contact.use(ts, self.half_life)
+        if self._index is not None:
+            self._recent[key] = contact
+        return contact
+
+    def _append(self, contacts: list[Contact]) -> None:
+        if not contacts:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self._file_lock, open(self.path, "a", encoding="utf-8") as f:
+                f.writelines(_line(c) for c in contacts)
+            self._lines += len(contacts)
+        except OSError as exc:
+            log_error(f"聯絡人紀錄寫入失敗：{exc}")
+
+    def _maybe_rebuild(self) -> None:
+        with self._lock:
+            if len(self._recent) <= _REBUILD_AFTER or self._rebuilding or self._index is None:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild, name="contacts-rebuild", daemon=True).start()
+
+    def _rebuild(self) -> None:
+        try:
+            with self._lock:
+                contacts = list(self._contacts.values())
+                # 重建期間的更新寫入新的 _recent，舊清單在新索引生效前仍參與查詢
+                self._pending, self._recent = self._recent, {}
+            index = PrefixIndex(contacts)
+            with self._lock:
+                self._index = index
+                self._pending = {}
+                if self._lines > 2 * len(self._contacts) + 1000:
+                    self._compact()
+        except OSError as exc:
+            log_error(f"聯絡人紀錄壓縮失敗：{exc}")
+        finally:
+            self._rebuilding = False
+
+    def _compact(self) -> None:
+        """
+        重寫紀錄檔（呼叫端需持有鎖）。在跨行程鎖內重新讀取檔案：
+        檔案中每個位址的最後一筆為準，再加上只存在記憶體中的聯絡人；
+        其他行程新增的聯絡人同時併入本行程的通訊錄。
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._file_lock:
+            merged, _ = _read(self.path)
+            for key, contact in self._contacts.items():
+                merged.setdefault(key, contact)
+            for key, contact in merged.items():
+                if key not in self._contacts:
+                    self._contacts[key] = contact
+                    if self._index is not None:
+                        self._recent[key] = contact
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.writelines(_line(c) for c in merged.values())
+            os.replace(tmp, self.path)
+        self._lines = len(merged)
+
+
+def _read(path: Path) -> tuple[dict[str, Contact], int]:
+    """讀取紀錄檔，回傳 ({小寫位址: 聯絡人}, 行數)；檔案不存在時皆為空。"""
+    contacts: dict[str, Contact] = {}
+    lines = 0
+    try:
+        f = open(path, "r", encoding="utf-8")
+    except FileNotFoundError:
+        return contacts, lines
+    with f:
+        for line in f:
+            lines += 1
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) != 5 or not parts[0]:
+                continue
+            addr, name, count, last_used, rank = parts
+            try:
+                contact = Contact(addr, name, int(count), float(last_used), float(rank))
+            except ValueError:
+                continue
+            contacts[addr.lower()] = contact
+    return contacts, lines
+
+
+def _line(contact: Contact) -> str:
+    name = " ".join(contact.name.replace("\t", " ").split())
+    return f"{contact.address}\t{name}\t{contact.count}\t{contact.last_used:.0f}\t{contact.rank!r}\n"
+
+
+# ----------------------------------------------------------
+# 匯入
+# ----------------------------------------------------------
+def read_contacts_file(path: str) -> Iterator[tuple[str, str]]:
+    """
+    讀取通訊錄檔案，產生 (顯示名稱, 位址)：
+    - vCard（.vcf）：取 FN 與每個 EMAIL
+    - 其他視為 CSV / 文字檔：含 @ 的欄位為位址（可為 Name <addr> 格式），
+      同列第一個不含 @ 的欄位為顯示名稱；標題列與無法解析的列會被略過
+    """
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith(".vcf"):
+            name = ""
+            for line in f:
+                field, _, value = line.strip().partition(":")
+                field = field.split(";", 1)[0].upper()
+                if field == "BEGIN":
+                    name = ""
+                elif field == "FN":
+                    name = value.strip()
+                elif field == "EMAIL":
+                    parsed = parse_address(value)
+                    if parsed is not None:
+                        yield name, parsed[1]
+            return
+        for row in csv.reader(f):
+            if not row or row[0].lstrip().startswith("#"):
+                continue
+            name = next((cell.strip() for cell in row if cell.strip() and "@" not in cell), "")
+            for cell in row:
+                if "@" not in cell:
+                    continue
+                parsed = parse_address(cell)
+                if parsed is not None:
+                    yield parsed[0] or name, parsed[1]
+
+
+# ----------------------------------------------------------
+# 共用實例
+# ----------------------------------------------------------
+_shared: Optional[ContactBook] = None
+_shared_lock = threading.Lock()
+
+
+def get_contact_book() -> Optional[ContactBook]:
+    """
+    回傳依 CONTACTS_FILE 建立的共用通訊錄，第一次呼叫時開始在背景載入；
+    未設定時回傳 None（不提供自動完成）。
+    """
+    global _shared
+    if not config.CONTACTS_FILE:
+        return None
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = ContactBook(config.CONTACTS_FILE)
+                _shared.load_async()
+    return _shared
@@ -0,0 +1,76 @@
+"""
+通訊錄命令列
+------------
+    python -m app.contacts_cli import contacts.csv people.vcf
+    python -m app.contacts_cli search jan
+    python -m app.contacts_cli export > contacts.txt
+
+匯入檔可為 vCard（.vcf）、CSV（含 @ 的欄位為位址，第一個其他欄位為顯示名稱）
+或每行一個位址的文字檔；GUI 執行中匯入的聯絡人需重新開啟 GUI 後才會出現。
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from app import config
+from app.contacts import ContactBook, read_contacts_file
+
+
+def _cmd_import(book: ContactBook, args) -> None:
+    added = sum(book.add(read_contacts_file(path)) for path in args.files)
+    print(f"通訊錄共 {len(book):,} 位（新增 {added:,} 位）")
+
+
+def _cmd_search(book: ContactBook, args) -> None:
+    start = time.perf_counter()
+    found = book.suggest(args.prefix, args.limit)
+    elapsed = (time.perf_counter() - start) * 1e6
+    for c in found:
+        last = f"{datetime.fromtimestamp(c.last_used):%Y-%m-%d}" if c.count else "-"
+        print(f"{c.display}\t寄送 {c.count} 次\t最後 {last}")
+    print(f"（{len(found)} 筆，{elapsed:.0f} µs）", file=sys.stderr)
+
+
+def _cmd_export(book: ContactBook, args) -> None:
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        for c in sorted(book, key=lambda c: c.address.lower()):
+            out.write(c.display + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.contacts_cli", description="SimpleMailGUI 通訊錄")
+    parser.add_argument("--file", type=Path, default=config.CONTACTS_FILE, help="通訊錄檔案（預設為 CONTACTS_FILE）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("import", help="匯入聯絡人（vCard、CSV 或文字檔）")
+    p.add_argument("files", nargs="+")
+    p.set_defaults(func=_cmd_import)
+
+    p = sub.add_parser("search", help="以前綴查詢建議（與 GUI 自動完成相同排序）")
+    p.add_argument("prefix")
+    p.add_argument("-n", "--limit", type=int, default=10)
+    p.set_defaults(func=_cmd_search)
+
+    p = sub.add_parser("export", help="匯出所有聯絡人，每行一個")
+    p.add_argument("-o", "--output", default="-")
+    p.set_defaults(func=_cmd_export)
+
+    args = parser.parse_args(argv)
+    if not args.file:
+        parser.error("未設定 CONTACTS_FILE，請以 --file 指定通訊錄檔案")
+    book = ContactBook(args.file)
+    book.load()
+    args.func(book, args)
+
+
+if __name__ == "__main__":
+    main()
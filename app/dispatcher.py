@@ -0,0 +1,436 @@
+"""
+Send Dispatcher
+---------------
+合併在短時間窗內觸發的寄信任務，透過少量共用的 SMTP 連線依序寄出：
+- 同一時間觸發的排程不再各自建立連線，避免瞬間連線數過高被伺服器限流
+- 單一連線最多寄送 SMTP_MAX_PER_SESSION 封，同時最多 SMTP_MAX_SESSIONS 條連線
+- 每個任務各自擁有 Future 與日誌，單封失敗不影響同批其他郵件
+- 佇列長度上限為 DISPATCH_QUEUE_SIZE，非阻塞提交時佇列已滿會拋出 queue.Full（背壓）
+- 任務分為 interactive（手動寄送）、scheduled（排程）、bulk（API 大量提交）三種優先順序，
+  依 DISPATCH_LANE_WEIGHTS 的權重以 stride scheduling 輪流取出；另有 INTERACTIVE_SESSIONS 條
+  只處理 interactive 的連線，大量寄送進行中手動寄送也不必排隊；各優先順序分別統計等待與完成延遲
+- ADAPTIVE_SESSIONS 開啟時，scheduled / bulk 同時使用的連線數由 app.concurrency 依延遲與
+  421 / 4xx 回覆在 SMTP_MIN_SESSIONS 與 SMTP_MAX_SESSIONS 之間調整（保留給手動寄送的連線不受限制）
+"""
+
+from __future__ import annotations
+
+import queue
+import smtplib
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from app import config
+from app.concurrency import AdaptiveLimiter
+from app.idempotency import DuplicateSend, get_ledger
+from app.log_service import log_error, log_info
+from app.mail_service import AmbiguousDelivery, close_session, deliver, open_session, prepare_email
+from app.profiling import profile_section
+
+# payload 中可傳給 prepare_email 的欄位
+_PAYLOAD_KEYS = ("as_html", "cc", "bcc", "reply_to", "attachments")
+
+# 優先順序（lane）：權重相同時依此順序優先
+LANE_INTERACTIVE = "interactive"
+LANE_SCHEDULED = "scheduled"
+LANE_BULK = "bulk"
+LANES = (LANE_INTERACTIVE, LANE_SCHEDULED, LANE_BULK)
+# 每個優先順序保留最近幾筆延遲樣本計算百分位數
+_LATENCY_SAMPLES = 1024
+
+
+def parse_lane_weights(spec: str) -> dict[str, float]:
+    """解析 "interactive=8,scheduled=3,bulk=1" 格式的權重，未列出的優先順序權重為 1。"""
+    weights = dict.fromkeys(LANES, 1.0)
+    for item in spec.split(","):
+        name, _, value = item.partition("=")
+        name = name.strip().lower()
+        if not name:
+            continue
+        if name not in weights:
+            raise ValueError(f"未知的優先順序：{name}（可用：{', '.join(LANES)}）")
+        weights[name] = max(float(value), 0.01)
+    return weights
+
+
+@dataclass
+class SendJob:
+    """排入寄送佇列的一封郵件。"""
+
+    payload: dict
+    desc: str = ""
+    lane: str = LANE_BULK
+    # 寄出後以郵件大小（位元組）呼叫，供 GUI 顯示傳輸速率
+    on_sent: Optional[Callable[[int], None]] = None
+    future: Future = field(default_factory=Future)
+    submitted_at: float = field(default_factory=time.monotonic)
+    started_at: float = 0.0
+
+
+class LaneQueue:
+    """
+    各優先順序各自的 FIFO，以 stride scheduling 依權重輪流取出：
+    每取出一個任務，該優先順序的 pass 增加 1/權重，下次取出 pass 最小且有任務的優先順序。
+    長度上限只限制 scheduled 與 bulk，手動寄送永遠可以排入。
+    """
+
+    def __init__(self, weights: dict[str, float], max_size: int = 0):
+        self.max_size = max_size
+        self._queues: dict[str, deque[SendJob]] = {lane: deque() for lane in LANES}
+        self._stride = {lane: 1.0 / weights[lane] for lane in LANES}
+        self._pass = dict.fromkeys(LANES, 0.0)
+        # 最近一次取出時的 pass，閒置後重新有任務的優先順序從這裡開始，不累積過去的額度
+        self._vtime = 0.0
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def qsize(self, lane: str | None = None) -> int:
+        if lane is not None:
+            return len(self._queues[lane])
+        return sum(len(q) for q in self._queues.values())
+
+    def bounded_size(self) -> int:
+        """受長度上限限制的任務數（scheduled + bulk）。"""
+        return len(self._queues[LANE_SCHEDULED]) + len(self._queues[LANE_BULK])
+
+    def put(self, job: SendJob, block: bool = True) -> None:
+        with self._cond:
+            if job.lane != LANE_INTERACTIVE and self.max_size > 0:
+                while self.bounded_size() >= self.max_size:
+                    if not block:
+                        raise queue.Full
+                    self._cond.wait()
+            q = self._queues[job.lane]
+            if not q:
+                self._pass[job.lane] = max(self._pass[job.lane], self._vtime)
+            q.append(job)
+            self._cond.notify_all()
+
+    def get(self, lanes: tuple[str, ...] = LANES, timeout: float | None = None) -> Optional[SendJob]:
+        """
+        依權重從 lanes 取出下一個任務。
+        timeout 到期、或已關閉且 lanes 中沒有任務時回傳 None。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                ready = [lane for lane in lanes if self._queues[lane]]
+                if ready:
+                    lane = min(ready, key=self._pass.__getitem__)
+                    self._vtime = self._pass[lane]
+                    self._pass[lane] += self._stride[lane]
+                    job = self._queues[lane].popleft()
+                    # 喚醒因佇列已滿而等待的提交端
+                    self._cond.notify_all()
+                    return job
+                if self._closed:
+                    return None
+                if deadline is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    self._cond.wait(remaining)
+
+    def close(self) -> None:
+        """不再等待新任務；已排入的任務仍可取出。"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class _LaneStats:
+    """單一優先順序的寄送數與延遲樣本（秒）。"""
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.waits: deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+        self.latencies: deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+
+
+def _percentiles(samples) -> dict:
+    """回傳 p50 / p95 / max（毫秒），沒有樣本時皆為 None。"""
+    if not samples:
+        return {"p50": None, "p95": None, "max": None}
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000, 1)  # noqa: E731
+    return {"p50": pick(0.5), "p95": pick(0.95), "max": round(ordered[-1] * 1000, 1)}
+
+
+def _is_session_error(exc: Exception) -> bool:
+    """
+    判斷例外是否代表連線已失效（需重建連線），
+    而非單封郵件被拒（連線仍可繼續使用）。
+    """
+    if isinstance(exc, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        # RCPT 收到 421 時連線已關閉，拋出的是收件者被拒而非回應例外
+        return any(code == 421 for code, _ in exc.recipients.values())
+    if isinstance(exc, smtplib.SMTPResponseException):
+        # 421：伺服器即將關閉連線
+        return exc.smtp_code == 421
+    if isinstance(exc, smtplib.SMTPException):
+        return False
+    return isinstance(exc, OSError)
+
+
+class SendDispatcher:
+    """以固定數量的工作執行緒收集任務，並以共用連線批次寄出。"""
+
+    def __init__(
+        self,
+        *,
+        window: float | None = None,
+        max_per_session: int | None = None,
+        max_sessions: int | None = None,
+        max_queue: int | None = None,
+        interactive_sessions: int | None = None,
+        lane_weights: dict[str, float] | None = None,
+        adaptive: bool | None = None,
+        session_factory: Callable[[], smtplib.SMTP] = open_session,
+    ):
+        self.window = config.COALESCE_WINDOW if window is None else window
+        self.max_per_session = max(1, max_per_session or config.SMTP_MAX_PER_SESSION)
+        self.max_sessions = max(1, max_sessions or config.SMTP_MAX_SESSIONS)
+        self.interactive_sessions = max(
+            0, config.INTERACTIVE_SESSIONS if interactive_sessions is None else interactive_sessions
+        )
+        self._session_factory = session_factory
+        self.max_queue = config.DISPATCH_QUEUE_SIZE if max_queue is None else max_queue
+        self.lane_weights = lane_weights or parse_lane_weights(config.DISPATCH_LANE_WEIGHTS)
+        self._queue = LaneQueue(self.lane_weights, self.max_queue)
+        adaptive = config.ADAPTIVE_SESSIONS if adaptive is None else adaptive
+        self.limiter = AdaptiveLimiter(config.SMTP_MIN_SESSIONS, self.max_sessions) if adaptive else None
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self._in_flight = 0
+        self._sent = 0
+        self._failed = 0
+        self._lane_stats = {lane: _LaneStats() for lane in LANES}
+        # 一般連線依權重處理所有優先順序；保留連線只處理手動寄送
+        self._workers = [
+            threading.Thread(target=self._worker, args=(LANES,), name=f"send-dispatcher-{i}", daemon=True)
+            for i in range(self.max_sessions)
+        ] + [
+            threading.Thread(
+                target=self._worker, args=((LANE_INTERACTIVE,),), name=f"send-interactive-{i}", daemon=True
+            )
+            for i in range(self.interactive_sessions)
+        ]
+        for t in self._workers:
+            t.start()
+
+    # -- 對外 API --------------------------------------------------------
+    def submit(
+        self,
+        payload: dict,
+        desc: str = "",
+        *,
+        lane: str = LANE_BULK,
+        block: bool = True,
+        on_sent: Optional[Callable[[int], None]] = None,
+    ) -> Future:
+        """
+        排入一封郵件，回傳完成時帶有 Message-ID 的 Future。
+        lane 為優先順序（interactive / scheduled / bulk）。
+        block=False 且佇列已滿時拋出 queue.Full，由呼叫端決定重試或回報忙碌（interactive 不受限制）。
+        """
+
+        if self._closed:
+            raise RuntimeError("SendDispatcher 已關閉")
+        if lane not in LANES:
+            raise ValueError(f"未知的優先順序：{lane}")
+        job = SendJob(payload=payload, desc=desc, lane=lane, on_sent=on_sent)
+        self._queue.put(job, block=block)
+        return job.future
+
+    def free_capacity(self) -> int:
+        """scheduled / bulk 佇列剩餘空間（max_queue 為 0 代表不限制）。"""
+
+        if self.max_queue <= 0:
+            return 1 << 30
+        return max(0, self.max_queue - self._queue.bounded_size())
+
+    def stats(self) -> dict:
+        """回傳目前佇列與寄送統計，lanes 為各優先順序的佇列長度、寄送數與延遲（毫秒）。"""
+
+        with self._stats_lock:
+            lanes = {
+                lane: {
+                    "weight": self.lane_weights[lane],
+                    "queued": self._queue.qsize(lane),
+                    "sent": st.sent,
+                    "failed": st.failed,
+                    # 排入佇列到開始寄送
+                    "wait_ms": _percentiles(st.waits),
+                    # 排入佇列到寄送完成
+                    "latency_ms": _percentiles(st.latencies),
+                }
+                for lane, st in self._lane_stats.items()
+            }
+            return {
+                "queued": self._queue.qsize(),
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "sent": self._sent,
+                "failed": self._failed,
+                "sessions": self.max_sessions,
+                "interactive_sessions": self.interactive_sessions,
+                "lanes": lanes,
+                "concurrency": None if self.limiter is None else self.limiter.stats(),
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """停止接收新任務；已排入的任務會寄完後才結束工作執行緒。"""
+
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.close()
+        if wait:
+            for t in self._workers:
+                t.join()
+
+    # -- 內部 -------------------------------------------------------------
+    def _worker(self, lanes: tuple[str, ...]) -> None:
+        while True:
+            first = self._queue.get(lanes)
+            if first is None:
+                return
+            self._take()
+            batch = self._gather(first)
+            # 手動寄送不受自適應上限限制，避免被大量寄送占住名額
+            gated = self.limiter is not None and first.lane != LANE_INTERACTIVE
+            if gated:
+                self.limiter.acquire()
+            try:
+                self._deliver_batch(batch, gated)
+            finally:
+                if gated:
+                    self.limiter.release()
+
+    def _take(self) -> None:
+        """任務離開佇列即計入 in_flight，收集中的任務才不會在統計中消失。"""
+
+        with self._stats_lock:
+            self._in_flight += 1
+
+    def _gather(self, first: SendJob) -> list[SendJob]:
+        """
+        從第一個任務的提交時間起，於時間窗內盡量收集同一優先順序的任務。
+        手動寄送不等待時間窗，只順便帶走已排入的手動任務。
+        """
+
+        batch = [first]
+        window = 0.0 if first.lane == LANE_INTERACTIVE else self.window
+        deadline = first.submitted_at + window
+        while len(batch) < self.max_per_session:
+            job = self._queue.get((first.lane,), timeout=max(0.0, deadline - time.monotonic()))
+            if job is None:
+                break
+            self._take()
+            batch.append(job)
+        return batch
+
+    def _deliver_batch(self, batch: list[SendJob], gated: bool = False) -> None:
+        """
+        以同一條連線依序寄出整批郵件，連線中斷時重建並重試該封一次。
+        gated 時每封之前檢查自適應上限，上限已減少就先關閉連線、等到有名額再繼續。
+        """
+
+        if len(batch) > 1:
+            log_info(f"📦 合併寄送 {len(batch)} 封郵件（共用 SMTP 連線）")
+
+        smtp = None
+        try:
+            for job in batch:
+                if not job.future.set_running_or_notify_cancel():
+                    with self._stats_lock:
+                        self._in_flight -= 1
+                    continue
+                if gated and self.limiter.over_limit():
+                    close_session(smtp)
+                    smtp = None
+                    self.limiter.yield_slot()
+                with profile_section("dispatch_send"):
+                    smtp = self._deliver_job(job, smtp)
+        finally:
+            close_session(smtp)
+
+    def _deliver_job(self, job: SendJob, smtp: Optional[smtplib.SMTP]) -> Optional[smtplib.SMTP]:
+        """寄出單一任務並設定結果，回傳之後仍可使用的連線（失效時為 None）。"""
+
+        job.started_at = time.monotonic()
+        key = job.payload.get("idempotency_key")
+        ledger = get_ledger() if key else None
+        if ledger is not None:
+            # 重複的任務在讀取附件與寄送之前就略過
+            try:
+                ledger.check(key)
+            except DuplicateSend as exc:
+                log_info(f"⏭ 略過重複寄送 [{job.desc}]：{exc}")
+                self._finish(job, exc=exc)
+                return smtp
+
+        try:
+            kwargs = {k: job.payload[k] for k in _PAYLOAD_KEYS if k in job.payload}
+            msg, recipients = prepare_email(
+                job.payload["to_addrs"], job.payload["subject"], job.payload["body"], **kwargs
+            )
+        except Exception as exc:  # noqa: BLE001 - 結果交由 Future 回報
+            log_error(f"建立郵件失敗 [{job.desc}]：{exc}")
+            self._finish(job, exc=exc)
+            return smtp
+
+        for attempt in (1, 2):
+            try:
+                if smtp is None:
+                    smtp = self._session_factory()
+                # 只以 SMTP 往返時間調整上限，簽章、紀錄與備份的耗時與伺服器負載無關
+                latency: list[float] = []
+                mid = deliver(
+                    smtp, msg, recipients, on_sent=job.on_sent, on_latency=latency.append, idempotency_key=key
+                )
+            except Exception as exc:  # noqa: BLE001
+                if self.limiter is not None:
+                    self.limiter.record_error(exc)
+                if _is_session_error(exc):
+                    close_session(smtp)
+                    smtp = None
+                    # 結果不明時不重試，避免同一封信寄出兩次
+                    if attempt == 1 and not isinstance(exc, AmbiguousDelivery):
+                        continue
+                self._finish(job, exc=exc)
+            else:
+                if self.limiter is not None:
+                    self.limiter.record_success(latency[0])
+                self._finish(job, mid=mid)
+            break
+        return smtp
+
+    def _finish(self, job: SendJob, *, mid: str | None = None, exc: Exception | None = None) -> None:
+        """更新統計並設定 Future 結果。"""
+
+        now = time.monotonic()
+        with self._stats_lock:
+            self._in_flight -= 1
+            lane = self._lane_stats[job.lane]
+            if exc is None:
+                self._sent += 1
+                lane.sent += 1
+            else:
+                self._failed += 1
+                lane.failed += 1
+            lane.waits.append((job.started_at or now) - job.submitted_at)
+            lane.latencies.append(now - job.submitted_at)
+        if exc is None:
+            job.future.set_result(mid)
+        else:
+            job.future.set_exception(exc)
@@ -0,0 +1,221 @@
+"""
+DKIM 簽章
+---------
+依 RFC 6376 以 rsa-sha256 為寄出的郵件加上 DKIM-Signature 標頭：
+- 私鑰（PEM，PKCS#1 或未加密的 PKCS#8）只在第一次使用時讀取與解析一次
+- 正規化後的內文雜湊（bh=）以呼叫端提供的 body_key（內文與附件的路徑、大小、修改時間）快取，
+  排程重複寄送相同內容時不需重新掃描內文，只需計算標頭雜湊與簽章
+- 以 cryptography（OpenSSL）簽章，OpenSSL 會套用 blinding 並在輸出前驗證 CRT 簽章
+- 由 app/config.py 的 DKIM_* 設定啟用，未設定時不簽章
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Hashable, Optional, Sequence
+
+from cryptography.exceptions import UnsupportedAlgorithm
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa, utils
+
+from app import config
+from app.log_service import log_error, log_info
+
+# 未指定 DKIM_HEADERS 時簽署的標頭（只簽署郵件中實際存在的）
+DEFAULT_HEADERS = (
+    "from",
+    "to",
+    "cc",
+    "reply-to",
+    "subject",
+    "date",
+    "message-id",
+    "mime-version",
+    "content-type",
+    "content-transfer-encoding",
+)
+_WSP_RE = re.compile(rb"[ \t]+")
+# 內文只需取代 tab 與連續空白（單一空格不變），base64 附件通常完全沒有符合的位置
+_BODY_WSP_RE = re.compile(rb"\t[ \t]*| [ \t]+")
+_TRAILING_WSP_RE = re.compile(rb"[ \t]+\r\n")
+
+
+# ----------------------------------------------------------
+# 私鑰
+# ----------------------------------------------------------
+def load_private_key(pem: str) -> rsa.RSAPrivateKey:
+    """讀取未加密的 RSA 私鑰（PKCS#1 或 PKCS#8 PEM）。"""
+    try:
+        key = serialization.load_pem_private_key(pem.encode("ascii"), password=None)
+    except (TypeError, ValueError, UnsupportedAlgorithm) as exc:
+        raise ValueError(f"無法解析私鑰（僅支援未加密的 RSA PEM）：{exc}") from exc
+    if not isinstance(key, rsa.RSAPrivateKey):
+        raise ValueError("私鑰必須是 RSA 金鑰")
+    return key
+
+
+# ----------------------------------------------------------
+# 正規化（RFC 6376 3.4）
+# ----------------------------------------------------------
+def canonicalize_body(body: bytes, method: str) -> bytes:
+    if method == "relaxed":
+        # 先以 bytes 的子字串搜尋確認有需要取代的位置，大型附件可略過整段正規表示式掃描
+        has_tab = b"\t" in body
+        if has_tab or b" \r\n" in body:
+            body = _TRAILING_WSP_RE.sub(b"\r\n", body)
+        if has_tab or b"  " in body:
+            body = _BODY_WSP_RE.sub(b" ", body)
+        if body.endswith((b" ", b"\t")):
+            body = body.rstrip(b" \t")
+        body = body.rstrip(b"\r\n")
+        return body + b"\r\n" if body else b""
+    body = body.rstrip(b"\r\n")
+    return body + b"\r\n"
+
+
+def _canonicalize_header(name: bytes, value: bytes, method: str) -> bytes:
+    """value 為冒號之後的原始內容（含折行，不含結尾 CRLF）。"""
+    if method == "relaxed":
+        value = _WSP_RE.sub(b" ", value.replace(b"\r\n", b"")).strip(b" ")
+        return name.lower().strip() + b":" + value
+    return name + b":" + value
+
+
+def _split_headers(head: bytes) -> list[tuple[bytes, bytes]]:
+    """將標頭區塊切為 (名稱, 值) 清單，續行併入前一個標頭。"""
+    headers: list[tuple[bytes, bytes]] = []
+    for line in head.split(b"\r\n"):
+        if line[:1] in (b" ", b"\t") and headers:
+            name, value = headers[-1]
+            headers[-1] = (name, value + b"\r\n" + line)
+        elif line:
+            name, _, value = line.partition(b":")
+            headers.append((name, value))
+    return headers
+
+
+# ----------------------------------------------------------
+# 簽章器
+# ----------------------------------------------------------
+class DKIMSigner:
+    """持有已解析的私鑰與內文雜湊快取，可跨執行緒共用。"""
+
+    def __init__(
+        self,
+        domain: str,
+        selector: str,
+        key: rsa.RSAPrivateKey,
+        *,
+        headers: Sequence[str] = DEFAULT_HEADERS,
+        canonicalization: str = "relaxed/relaxed",
+        cache_size: int = 1024,
+    ):
+        header_c, _, body_c = canonicalization.lower().partition("/")
+        body_c = body_c or "simple"
+        if header_c not in ("simple", "relaxed") or body_c not in ("simple", "relaxed"):
+            raise ValueError(f"不支援的 DKIM 正規化方式：{canonicalization}")
+        self.domain = domain
+        self.selector = selector
+        self.key = key
+        self.headers = [h.strip().lower() for h in headers if h.strip()]
+        self.header_c = header_c
+        self.body_c = body_c
+        self.cache_size = cache_size
+        self._cache: OrderedDict[Hashable, str] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def body_hash(self, body: bytes, key: Optional[Hashable] = None) -> str:
+        """
+        回傳 bh= 的值：正規化後內文的 SHA-256。
+        key 為能唯一決定內文位元組的鍵（見 fast_mime.WireMessage.body_key），命中時不讀取內文；
+        沒有 key 時每次都重新計算。
+        """
+        if key is not None and self.cache_size > 0:
+            with self._lock:
+                bh = self._cache.get(key)
+                if bh is not None:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return bh
+        bh = base64.b64encode(hashlib.sha256(canonicalize_body(body, self.body_c)).digest()).decode("ascii")
+        if key is not None and self.cache_size > 0:
+            with self._lock:
+                self.misses += 1
+                self._cache[key] = bh
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return bh
+
+    def sign(self, data: bytes, *, timestamp: Optional[int] = None, body_key: Optional[Hashable] = None) -> bytes:
+        """為 CRLF 線路格式的郵件加上 DKIM-Signature 標頭並回傳新的位元組；body_key 見 body_hash。"""
+        sep = data.find(b"\r\n\r\n")
+        if sep < 0:
+            head, body = data, b""
+        else:
+            head, body = data[: sep + 2], data[sep + 4 :]
+        parsed = _split_headers(head)
+
+        # 只簽署郵件中存在的標頭；同名標頭取最後一個（RFC 6376 5.4.2）
+        latest: dict[bytes, tuple[bytes, bytes]] = {}
+        for name, value in parsed:
+            latest[name.strip().lower()] = (name, value)
+        signed = [h for h in self.headers if h.encode("ascii") in latest]
+
+        tags = (
+            f"v=1; a=rsa-sha256; c={self.header_c}/{self.body_c}; d={self.domain}; s={self.selector};\r\n"
+            f" t={int(time.time()) if timestamp is None else timestamp}; h={':'.join(signed)};\r\n"
+            f" bh={self.body_hash(body, body_key)};\r\n b="
+        )
+        hasher = hashlib.sha256()
+        for h in signed:
+            name, value = latest[h.encode("ascii")]
+            hasher.update(_canonicalize_header(name, value, self.header_c) + b"\r\n")
+        # DKIM-Signature 本身以空的 b= 參與雜湊，且不含結尾 CRLF
+        hasher.update(_canonicalize_header(b"DKIM-Signature", b" " + tags.encode("ascii"), self.header_c))
+        raw = self.key.sign(hasher.digest(), padding.PKCS1v15(), utils.Prehashed(hashes.SHA256()))
+        signature = base64.b64encode(raw).decode("ascii")
+        folded = "\r\n ".join(signature[i : i + 72] for i in range(0, len(signature), 72))
+        return f"DKIM-Signature: {tags}{folded}\r\n".encode("ascii") + data
+
+
+# ----------------------------------------------------------
+# 共用實例：第一次使用時才讀取私鑰
+# ----------------------------------------------------------
+_shared: Optional[DKIMSigner] = None
+_shared_lock = threading.Lock()
+_load_failed = False
+
+
+def get_signer() -> Optional[DKIMSigner]:
+    """回傳依 DKIM_* 設定建立的共用簽章器；未設定或私鑰無法讀取時回傳 None（不簽章）。"""
+    global _shared, _load_failed
+    if _shared is not None or _load_failed:
+        return _shared
+    if not (config.DKIM_DOMAIN and config.DKIM_SELECTOR and config.DKIM_PRIVATE_KEY):
+        return None
+    with _shared_lock:
+        if _shared is None and not _load_failed:
+            try:
+                key = load_private_key(Path(config.DKIM_PRIVATE_KEY).read_text(encoding="ascii"))
+                _shared = DKIMSigner(
+                    config.DKIM_DOMAIN,
+                    config.DKIM_SELECTOR,
+                    key,
+                    headers=config.DKIM_HEADERS.split(",") if config.DKIM_HEADERS else DEFAULT_HEADERS,
+                    canonicalization=config.DKIM_CANONICALIZATION,
+                    cache_size=config.DKIM_BODY_CACHE_SIZE,
+                )
+                log_info(f"🔏 已載入 DKIM 私鑰（{config.DKIM_SELECTOR}._domainkey.{config.DKIM_DOMAIN}）")
+            except (OSError, ValueError) as exc:
+                # 只記錄一次，避免每封信都重複讀取失敗的私鑰
+                _load_failed = True
+                log_error(f"無法載入 DKIM 私鑰，郵件將不簽章：{exc}")
+    return _shared
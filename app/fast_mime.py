@@ -0,0 +1,269 @@
+"""
+快速郵件序列化
+--------------
+常見格式（純文字、純文字 + HTML、附件）直接輸出 SMTP 線路格式（CRLF）的位元組，
+省去 EmailMessage 的標頭解析、折行與 Generator 重新序列化的成本：
+- 結構、編碼選擇（7bit / 8bit / quoted-printable / base64）與 EmailMessage 相同，
+  以 email 套件解析後的標頭、內容與附件皆一致（驗證見 benchmarks/bench_serializer.py）
+- boundary 由內容決定，內容相同的郵件（例如重複觸發的排程）內文位元組完全相同；
+  附件皆帶有檔案識別（路徑、大小、修改時間）時另提供 body_key，
+  DKIM 簽章以此為鍵快取內文雜湊，不需再掃描整份內文
+- 遇到無法確定安全輸出的內容（標頭換行、特殊檔名、過長的無空白字串等）回傳 None，
+  由呼叫端改用 EmailMessage
+"""
+
+from __future__ import annotations
+
+import binascii
+import hashlib
+import re
+from dataclasses import dataclass
+from typing import Hashable, NamedTuple, Optional, Sequence
+
+from app.recipients import Recipients, _format, parse_address
+
+# 與 email.policy.default 相同的建議行長
+MAX_LINE = 78
+# RFC 5322 的硬性行長上限（不含 CRLF）
+HARD_LINE = 998
+# 單一 encoded-word 的原始位元組上限：base64 後 60 字元，加上 =?utf-8?b??= 共 72 字元
+_WORD_BYTES = 45
+# 標頭值中不可出現的控制字元；含 =? 的字串可能被誤判為 encoded-word，交給 EmailMessage 處理
+_UNSAFE_HEADER_RE = re.compile(r"[\x00-\x1f\x7f]|=\?")
+_SAFE_FILENAME_RE = re.compile(r'[ -!#-\[\]-~]+\Z')
+
+
+class Attachment(NamedTuple):
+    """已讀入的附件；stamp 為讀取前的 (實際路徑, 大小, 修改時間)，記憶體中產生的附件為 None。"""
+
+    filename: str
+    maintype: str
+    subtype: str
+    data: bytes
+    stamp: Optional[tuple] = None
+
+
+@dataclass
+class WireMessage:
+    """已序列化的郵件；提供與 EmailMessage 相同的標頭讀取方式供日誌與寄送使用。"""
+
+    headers: dict[str, str]
+    data: bytes
+    # 能唯一決定內文（標頭之後的位元組）的鍵，供 DKIM 內文雜湊快取；無法判定時為 None
+    body_key: Optional[Hashable] = None
+
+    def get(self, name: str, default=None):
+        return self.headers.get(name, default)
+
+    def __getitem__(self, name: str) -> Optional[str]:
+        return self.headers.get(name)
+
+
+class _Unsupported(Exception):
+    """此郵件不適用快速路徑。"""
+
+
+# ----------------------------------------------------------
+# 標頭
+# ----------------------------------------------------------
+def _check_header(value: str) -> str:
+    if _UNSAFE_HEADER_RE.search(value):
+        raise _Unsupported
+    return value
+
+
+def _encoded_words(text: str) -> list[str]:
+    """RFC 2047 base64 encoded-word，切割時不拆開多位元組字元。"""
+    words = []
+    chunk = b""
+    for ch in text:
+        b = ch.encode("utf-8")
+        if len(chunk) + len(b) > _WORD_BYTES:
+            words.append(chunk)
+            chunk = b""
+        chunk += b
+    if chunk:
+        words.append(chunk)
+    return ["=?utf-8?b?" + binascii.b2a_base64(w, newline=False).decode("ascii") + "?=" for w in words]
+
+
+def _fold(name: str, tokens: Sequence[str], sep: str) -> str:
+    """依 MAX_LINE 將 tokens 以 sep 串接成標頭行，超出時在分隔處換行。"""
+    line = f"{name}: {tokens[0]}"
+    lines = []
+    for token in tokens[1:]:
+        if len(line) + len(sep) + len(token) > MAX_LINE:
+            lines.append(line + sep.rstrip())
+            line = " " + token
+        else:
+            line += sep + token
+    lines.append(line)
+    if any(len(x) > HARD_LINE for x in lines):
+        raise _Unsupported
+    return "\r\n".join(lines) + "\r\n"
+
+
+def _subject_header(subject: str) -> str:
+    _check_header(subject)
+    if subject != subject.strip() or "  " in subject:
+        # 需保留的連續或前後空白交給 EmailMessage 處理
+        raise _Unsupported
+    if not subject:
+        return "Subject: \r\n"
+    if subject.isascii():
+        return _fold("Subject", subject.split(" "), " ")
+    return _fold("Subject", _encoded_words(subject), " ")
+
+
+def _address(item: str) -> str:
+    """將 recipients._format 的結果轉為標頭格式（非 ASCII 顯示名稱改為 encoded-word）。"""
+    _check_header(item)
+    if item.isascii():
+        return item
+    if not item.endswith(">"):
+        raise _Unsupported
+    name, _, addr = item[:-1].rpartition(" <")
+    if not addr.isascii():
+        raise _Unsupported
+    if name.startswith('"'):
+        name = re.sub(r"\\(.)", r"\1", name[1:-1])
+    return " ".join(_encoded_words(name)) + f" <{addr}>"
+
+
+def _address_header(name: str, items: Sequence[str]) -> str:
+    return _fold(name, [_address(x) for x in items], ", ")
+
+
+def _single_address(value: str) -> str:
+    """From / Reply-To：只接受可解析的單一位址。"""
+    parsed = parse_address(value)
+    if parsed is None:
+        raise _Unsupported
+    return _format(*parsed)
+
+
+# ----------------------------------------------------------
+# 內容
+# ----------------------------------------------------------
+def _text_part(body: str, subtype: str) -> tuple[bytes, bytes]:
+    """依 email.contentmanager 相同的規則選擇傳輸編碼，回傳 (標頭, 內容)。"""
+    try:
+        lines = body.encode("utf-8").splitlines()
+    except UnicodeEncodeError:
+        raise _Unsupported from None
+    if max((len(x) for x in lines), default=0) <= MAX_LINE:
+        cte = "7bit" if body.isascii() else "8bit"
+        payload = b"\r\n".join(lines) + b"\r\n"
+    else:
+        normal = b"\n".join(lines) + b"\n"
+        sniff = b"\n".join(lines[:10]) + b"\n"
+        if len(binascii.b2a_qp(sniff, istext=True)) > len(binascii.b2a_base64(sniff)):
+            cte = "base64"
+            payload = _base64(normal)
+        else:
+            cte = "quoted-printable"
+            payload = binascii.b2a_qp(normal, istext=True).replace(b"\n", b"\r\n")
+    headers = f'Content-Type: text/{subtype}; charset="utf-8"\r\nContent-Transfer-Encoding: {cte}\r\n'
+    return headers.encode("ascii"), payload
+
+
+def _base64(data: bytes) -> bytes:
+    """每行 76 字元的 base64，以 CRLF 結尾。"""
+    encoded = binascii.b2a_base64(data, newline=False)
+    return b"".join(encoded[i : i + 76] + b"\r\n" for i in range(0, len(encoded), 76))
+
+
+def _attachment_part(att: Attachment) -> tuple[bytes, bytes]:
+    if not _SAFE_FILENAME_RE.match(att.filename):
+        # 非 ASCII 或含引號的檔名需 RFC 2231 編碼
+        raise _Unsupported
+    disposition = f'Content-Disposition: attachment; filename="{att.filename}"'
+    if len(disposition) > MAX_LINE:
+        disposition = f'Content-Disposition: attachment;\r\n filename="{att.filename}"'
+        if len(att.filename) + 12 > HARD_LINE:
+            raise _Unsupported
+    headers = (
+        f"Content-Type: {att.maintype}/{att.subtype}\r\n"
+        f"Content-Transfer-Encoding: base64\r\n"
+        f"{disposition}\r\n"
+    )
+    return headers.encode("ascii"), _base64(att.data)
+
+
+def _multipart(subtype: str, parts: list[tuple[bytes, bytes]]) -> tuple[bytes, bytes]:
+    """組合 multipart，boundary 由子部分內容決定並確認不會出現在任何子部分中。"""
+    seed = hashlib.blake2b(subtype.encode("ascii"), digest_size=12)
+    for headers, body in parts:
+        seed.update(headers)
+        seed.update(body)
+    counter = 0
+    while True:
+        digest = seed.copy()
+        digest.update(counter.to_bytes(4, "big"))
+        boundary = f"==============={digest.hexdigest()}=="
+        marker = b"--" + boundary.encode("ascii")
+        if not any(marker in body for _, body in parts):
+            break
+        counter += 1
+    out = bytearray()
+    for headers, body in parts:
+        out += marker + b"\r\n" + headers + b"\r\n" + body + b"\r\n"
+    out += marker + b"--\r\n"
+    headers = f'Content-Type: multipart/{subtype};\r\n boundary="{boundary}"\r\n'
+    return headers.encode("ascii"), bytes(out)
+
+
+# ----------------------------------------------------------
+# 主函式
+# ----------------------------------------------------------
+def serialize(
+    sender: str,
+    rcpts: Recipients,
+    subject: str,
+    body: str,
+    *,
+    date: str,
+    message_id: str,
+    as_html: bool = False,
+    reply_to: Optional[str] = None,
+    attachments: Sequence[Attachment] = (),
+) -> Optional[WireMessage]:
+    """
+    以與 mail_service._build_message 相同的結構直接序列化郵件（Bcc 不寫入標頭）。
+    不適用快速路徑時回傳 None。
+    """
+    try:
+        sender_value = _single_address(sender)
+        to_items = rcpts.to or [sender_value]
+        head = _address_header("From", [sender_value]) + _address_header("To", to_items)
+        headers = {"From": sender, "To": ", ".join(rcpts.to) if rcpts.to else sender}
+        if rcpts.cc:
+            head += _address_header("Cc", rcpts.cc)
+            headers["Cc"] = ", ".join(rcpts.cc)
+        if reply_to:
+            reply_value = _single_address(reply_to.strip())
+            head += _address_header("Reply-To", [reply_value])
+            headers["Reply-To"] = reply_value
+        head += _subject_header(subject)
+        head += f"Date: {_check_header(date)}\r\nMessage-ID: {_check_header(message_id)}\r\n"
+        headers.update({"Subject": subject, "Date": date, "Message-ID": message_id})
+
+        part = _text_part(body, "plain")
+        if as_html:
+            part = _multipart("alternative", [part, _text_part(body, "html")])
+        if attachments:
+            part = _multipart("mixed", [part] + [_attachment_part(a) for a in attachments])
+    except _Unsupported:
+        return None
+
+    part_headers, part_body = part
+    data = head.encode("ascii") + b"MIME-Version: 1.0\r\n" + part_headers + b"\r\n" + part_body
+    return WireMessage(headers, data, _body_key(body, as_html, attachments))
+
+
+def _body_key(body: str, as_html: bool, attachments: Sequence[Attachment]) -> Optional[tuple]:
+    """內文由本文、是否 HTML 與各附件決定；附件以檔案識別代替內容，比雜湊整份內文便宜。"""
+    if any(a.stamp is None for a in attachments):
+        return None
+    digest = hashlib.blake2b(body.encode("utf-8"), digest_size=16).digest()
+    return (digest, as_html, tuple((a.filename, a.maintype, a.subtype, a.stamp) for a in attachments))
@@ -0,0 +1,56 @@
+"""
+跨行程檔案鎖
+------------
+GUI、daemon 與各 CLI 可能同時讀寫同一份資料檔（日誌、停止寄送名單、寄送紀錄、聯絡人），
+以旁邊的 .lock 檔做排他鎖：POSIX 為 flock，Windows 為 msvcrt.locking。
+鎖以開啟的檔案為單位，同一行程內的執行緒仍需自行以 threading 鎖互斥。
+"""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Optional
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+
+class FileLock:
+    """以 with 取得的跨行程排他鎖；鎖檔在第一次取得時才建立。"""
+
+    def __init__(self, path: Path | str):
+        self.path = Path(path)
+        self._file: Optional[object] = None
+
+    def __enter__(self) -> "FileLock":
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a+b")
+        fd = self._file.fileno()
+        if os.name == "nt":
+            self._file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue  # LK_LOCK 重試約 10 秒後放棄，繼續等待
+        else:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        fd = self._file.fileno()
+        if os.name == "nt":
+            self._file.seek(0)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
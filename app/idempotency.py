@@ -0,0 +1,266 @@
+"""
+冪等寄送紀錄
+------------
+以冪等鍵（idempotency key）記錄已寄出的郵件，重複觸發時直接略過，不再連線、登入與傳送 DATA：
+- 排程寄送的鍵為「任務 ID + 排定觸發時間」，misfire 後重跑或同一次觸發重複執行都只寄一次
+- 手動寄送的鍵為收件者、主旨、內文與附件的雜湊，連按兩次「寄送」只會寄出一封
+- DATA 已送出但等不到伺服器回覆（結果不明）時記為 uncertain，之後的重試同樣略過，避免重複寄送
+- 紀錄以附加方式寫入單一文字檔，啟動時讀入記憶體；每筆有各自的到期時間，
+  過期項目在載入與壓縮（compact）時移除，檔案大小只與有效期內的寄送量有關
+- GUI 與 daemon 共用同一份檔案：附加與壓縮都在跨行程鎖（同名 .lock 檔）內進行，
+  壓縮時先重新讀取檔案並合併，不會抹除其他行程寫入的鍵
+
+檔案格式（每行一筆，後寫入的覆蓋先寫入的）：
+    key \\t 狀態（S=已寄出 / U=結果不明 / R=已釋放）\\t 到期時間（epoch 秒）\\t Message-ID
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, NamedTuple, Optional
+
+from app import config
+from app.file_lock import FileLock
+from app.log_service import log_error
+
+SENT = "S"
+UNCERTAIN = "U"
+_RELEASED = "R"
+# 僅存在記憶體中：另一個執行緒正在寄送同一個鍵
+PENDING = "P"
+# 失效的行數超過有效筆數且至少這麼多行時才壓縮，避免頻繁重寫
+_COMPACT_MIN_LINES = 1000
+
+
+class DuplicateSend(Exception):
+    """冪等鍵已寄出、正在寄送或結果不明，本次寄送已略過。"""
+
+    def __init__(self, key: str, state: str, message_id: str = ""):
+        self.key = key
+        self.state = state
+        self.message_id = message_id
+        if state == SENT:
+            text = f"已寄出過（MID:{message_id}），略過重複寄送"
+        elif state == UNCERTAIN:
+            text = "上次寄送結果不明（可能已寄達），為避免重複已略過，請確認收件匣後再重寄"
+        else:
+            text = "相同郵件正在寄送中，略過重複寄送"
+        super().__init__(text)
+
+
+class _Entry(NamedTuple):
+    state: str
+    expires: float
+    message_id: str = ""
+
+
+def _read(path: Path) -> tuple[dict[str, _Entry], set[str], int]:
+    """讀取紀錄檔，回傳 (有效項目, 檔案中出現過的鍵, 行數)；檔案不存在時皆為空。"""
+    entries: dict[str, _Entry] = {}
+    seen: set[str] = set()
+    lines = 0
+    now = time.time()
+    try:
+        f = open(path, "r", encoding="utf-8")
+    except FileNotFoundError:
+        return entries, seen, lines
+    with f:
+        for line in f:
+            lines += 1
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) != 4:
+                continue
+            key, state, expires, mid = parts
+            try:
+                expires_at = float(expires)
+            except ValueError:
+                continue
+            seen.add(key)
+            if state == _RELEASED or expires_at <= now:
+                entries.pop(key, None)
+            else:
+                entries[key] = _Entry(state, expires_at, mid)
+    return entries, seen, lines
+
+
+class IdempotencyLedger:
+    """冪等鍵紀錄，可跨執行緒共用。"""
+
+    def __init__(self, path: Path | str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        # 與其他行程（GUI / daemon）的附加與壓縮互斥
+        self._file_lock = FileLock(self.path.with_name(self.path.name + ".lock"))
+        self._entries: dict[str, _Entry] = {}
+        self._lines = 0
+        self._load()
+
+    def _load(self) -> None:
+        self._entries, _, self._lines = _read(self.path)
+        self._maybe_compact()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # -- 查詢與保留 -------------------------------------------------------
+    def _live(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires <= time.time():
+            del self._entries[key]
+            return None
+        return entry
+
+    def check(self, key: str) -> None:
+        """鍵已寄出、寄送中或結果不明時拋出 DuplicateSend（不保留鍵，供連線前快速判斷）。"""
+        with self._lock:
+            entry = self._live(key)
+        if entry is not None:
+            raise DuplicateSend(key, entry.state, entry.message_id)
+
+    def reserve(self, key: str) -> None:
+        """
+        保留鍵並標記為寄送中；鍵已存在時拋出 DuplicateSend。
+        寄送結束後必須呼叫 commit、mark_uncertain 或 release 其中之一。
+        """
+        with self._lock:
+            entry = self._live(key)
+            if entry is not None:
+                raise DuplicateSend(key, entry.state, entry.message_id)
+            # 寄送中的保留不寫入檔案；程式中途結束時視為未寄出
+            self._entries[key] = _Entry(PENDING, time.time() + ttl_for(key))
+
+    def commit(self, key: str, message_id: str) -> None:
+        """標記為已寄出。"""
+        self._record(key, SENT, message_id)
+
+    def mark_uncertain(self, key: str) -> None:
+        """標記為結果不明（DATA 已送出但未收到回覆），到期前的重試都會略過。"""
+        self._record(key, UNCERTAIN)
+
+    def release(self, key: str) -> None:
+        """寄送確定失敗：移除保留，之後可重新寄送。"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and entry.state != PENDING:
+                # 已寫入檔案的鍵需寫入釋放紀錄，重新載入時才不會復活
+                self._append(f"{key}\t{_RELEASED}\t0\t\n")
+
+    def _record(self, key: str, state: str, message_id: str = "") -> None:
+        expires = time.time() + ttl_for(key)
+        with self._lock:
+            self._entries[key] = _Entry(state, expires, message_id)
+            try:
+                self._append(f"{key}\t{state}\t{expires:.0f}\t{message_id}\n")
+            except OSError as exc:
+                # 寫檔失敗不影響本次寄送結果，只是重新啟動後無法辨識此鍵
+                log_error(f"冪等紀錄寫入失敗：{exc}")
+                return
+            self._maybe_compact()
+
+    # -- 檔案維護 ---------------------------------------------------------
+    def _append(self, line: str) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._file_lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+        self._lines += 1
+
+    def _maybe_compact(self) -> None:
+        if self._lines - len(self._entries) > max(_COMPACT_MIN_LINES, len(self._entries)):
+            try:
+                self._compact()
+            except OSError as exc:
+                log_error(f"冪等紀錄壓縮失敗：{exc}")
+
+    def _compact(self) -> None:
+        """
+        移除過期與被覆蓋的行（先寫暫存檔再取代，呼叫端需持有鎖）。
+        在跨行程鎖內重新讀取檔案：檔案中的最後狀態為準（含其他行程寫入與釋放的鍵），
+        再加上本行程寄送中與尚未寫入檔案的項目。
+        """
+        with self._file_lock:
+            live, seen, _ = _read(self.path)
+            now = time.time()
+            for key, entry in self._entries.items():
+                if entry.expires > now and (entry.state == PENDING or key not in seen):
+                    live[key] = entry
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                for key, entry in live.items():
+                    if entry.state != PENDING:
+                        f.write(f"{key}\t{entry.state}\t{entry.expires:.0f}\t{entry.message_id}\n")
+            os.replace(tmp, self.path)
+        self._entries = live
+        self._lines = sum(1 for e in live.values() if e.state != PENDING)
+
+    def compact(self) -> int:
+        """立即壓縮紀錄檔，回傳有效筆數。"""
+        with self._lock:
+            self._compact()
+            return len(self._entries)
+
+
+# ----------------------------------------------------------
+# 冪等鍵
+# ----------------------------------------------------------
+def ttl_for(key: str) -> float:
+    """手動寄送的鍵只保留 IDEMPOTENCY_MANUAL_TTL（之後可刻意重寄相同內容），其餘為 IDEMPOTENCY_TTL。"""
+    return config.IDEMPOTENCY_MANUAL_TTL if key.startswith("manual:") else config.IDEMPOTENCY_TTL
+
+
+def scheduled_key(job_id: str, fire_time: datetime) -> str:
+    """排程寄送的鍵：任務 ID + 排定觸發時間（分鐘）。"""
+    return f"job:{job_id}:{fire_time:%Y-%m-%dT%H:%M}"
+
+
+def content_key(
+    to_addrs: Iterable[str],
+    subject: str,
+    body: str,
+    *,
+    cc: Iterable[str] | None = None,
+    bcc: Iterable[str] | None = None,
+    attachments: Iterable[str] | None = None,
+) -> str:
+    """
+    手動寄送的鍵：收件者、主旨、內文與附件的雜湊。
+    附件以路徑、大小與修改時間代表，不需讀取檔案內容。
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for field in (to_addrs, cc or (), bcc or ()):
+        h.update("\x1f".join(sorted(a.strip().lower() for a in field)).encode("utf-8") + b"\x1e")
+    h.update(subject.encode("utf-8") + b"\x1e" + body.encode("utf-8") + b"\x1e")
+    for p in attachments or ():
+        try:
+            st = os.stat(p)
+            h.update(f"{os.path.abspath(p)}\x1f{st.st_size}\x1f{st.st_mtime_ns}\x1e".encode("utf-8"))
+        except OSError:
+            h.update(f"{p}\x1e".encode("utf-8"))
+    return f"manual:{h.hexdigest()}"
+
+
+# ----------------------------------------------------------
+# 共用實例：第一次使用時才讀取檔案
+# ----------------------------------------------------------
+_shared: Optional[IdempotencyLedger] = None
+_shared_lock = threading.Lock()
+
+
+def get_ledger() -> Optional[IdempotencyLedger]:
+    """回傳依 IDEMPOTENCY_FILE 開啟的共用紀錄；未設定或無法讀取時回傳 None（不檢查重複）。"""
+    global _shared
+    if not config.IDEMPOTENCY_FILE:
+        return None
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                try:
+                    _shared = IdempotencyLedger(config.IDEMPOTENCY_FILE)
+                except OSError as exc:
+                    log_error(f"無法讀取冪等紀錄：{exc}")
+                    return None
+    return _shared
@@ -0,0 +1,129 @@
+"""
+本機 IPC
+--------
+daemon.py 與 GUI 之間的溝通管道，基於 multiprocessing.connection：
+- 只監聽本機位址，並以 authkey 驗證連線（避免未授權程式反序列化資料）
+- 請求格式：{"op": 名稱, "args": [...]}；回應：{"ok": bool, "result"/"error": ...}
+"""
+
+from __future__ import annotations
+
+import os
+import secrets
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+
+from app import config
+from app.log_service import log_error, log_info
+
+# 未設定 DAEMON_AUTHKEY 時共用的金鑰檔
+KEY_FILE = Path(__file__).resolve().parent.parent / ".daemon_key"
+
+
+def _authkey(create: bool = False) -> bytes | None:
+    """取得 IPC 驗證金鑰；create=True 時若金鑰檔不存在會自動產生。"""
+    if config.DAEMON_AUTHKEY:
+        return config.DAEMON_AUTHKEY.encode("utf-8")
+    if KEY_FILE.is_file():
+        return KEY_FILE.read_bytes().strip()
+    if not create:
+        return None
+    key = secrets.token_hex(32).encode("ascii")
+    fd = os.open(KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+
+class DaemonServer:
+    """在背景執行緒接受本機連線，將請求轉交給 ScheduleService。"""
+
+    # 允許遠端呼叫的 ScheduleService 方法
+    OPERATIONS = ("add_jobs", "list_jobs")
+
+    def __init__(self, service, address: tuple[str, int] | None = None):
+        self.service = service
+        self.address = address or (config.DAEMON_HOST, config.DAEMON_PORT)
+        self._listener = Listener(self.address, authkey=_authkey(create=True))
+        self._thread = threading.Thread(target=self._serve, name="daemon-ipc", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+        log_info(f"🔌 IPC 監聽於 {self.address[0]}:{self.address[1]}")
+
+    def close(self) -> None:
+        self._listener.close()
+
+    def _serve(self) -> None:
+        while True:
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                return  # listener 已關閉
+            except Exception as exc:  # noqa: BLE001 - 驗證失敗等不應中斷服務
+                log_error(f"IPC 連線被拒：{exc}")
+                continue
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn) -> None:
+        with conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    return
+                conn.send(self._dispatch(request))
+
+    def _dispatch(self, request: dict) -> dict:
+        op = request.get("op")
+        if op == "ping":
+            return {"ok": True, "result": "pong"}
+        if op not in self.OPERATIONS:
+            return {"ok": False, "error": f"未知的操作：{op}"}
+        try:
+            return {"ok": True, "result": getattr(self.service, op)(*request.get("args", []))}
+        except Exception as exc:  # noqa: BLE001 - 錯誤訊息回傳給客戶端顯示
+            return {"ok": False, "error": str(exc), "type": type(exc).__name__}
+
+
+class DaemonClient:
+    """GUI 端的排程代理，介面與 ScheduleService 相同。"""
+
+    def __init__(self, address: tuple[str, int] | None = None, authkey: bytes | None = None):
+        self.address = address or (config.DAEMON_HOST, config.DAEMON_PORT)
+        self._authkey = authkey
+
+    @classmethod
+    def connect(cls) -> "DaemonClient | None":
+        """嘗試連線本機 daemon，無法連線時回傳 None（GUI 改用內建排程）。"""
+
+        authkey = _authkey()
+        if authkey is None:
+            return None
+        client = cls(authkey=authkey)
+        try:
+            client._call("ping")
+        except (OSError, EOFError, AuthenticationError):
+            return None
+        return client
+
+    def add_jobs(self, payload: dict, schedule_opts: dict, calendar_dt) -> list[str]:
+        return self._call("add_jobs", payload, schedule_opts, calendar_dt)
+
+    def list_jobs(self) -> list[dict]:
+        return self._call("list_jobs")
+
+    def shutdown(self, wait: bool = False) -> None:
+        """GUI 關閉時不影響 daemon 中的排程。"""
+
+    def _call(self, op: str, *args):
+        with Client(self.address, authkey=self._authkey) as conn:
+            conn.send({"op": op, "args": list(args)})
+            response = conn.recv()
+        if response["ok"]:
+            return response["result"]
+        if response.get("type") == "ValueError":
+            raise ValueError(response["error"])
+        raise RuntimeError(response["error"])
@@ -0,0 +1,143 @@
+"""
+日誌查詢命令列
+--------------
+以 app/log_index 建立的索引搜尋、追蹤與壓縮 logs/ 下的日誌：
+
+    python -m app.log_cli search --level ERROR --recipient someone@example.com --days 30
+    python -m app.log_cli search --mid "<...@example.com>"
+    python -m app.log_cli tail -f --level ERROR
+    python -m app.log_cli archive --older-than 7
+    python -m app.log_cli rebuild
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from app.log_index import LogReader, archive, index_path, match, rebuild
+
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+def _cmd_search(reader: LogReader, args) -> None:
+    since = args.since or (datetime.now() - timedelta(days=args.days) if args.days else None)
+    for record in reader.search(
+        since=since,
+        until=args.until,
+        level=args.level,
+        recipient=args.recipient,
+        mid=args.mid,
+        text=args.text,
+    ):
+        sys.stdout.write(record)
+
+
+def _tail_match(entry, args) -> bool:
+    if not match(entry, None, None, args.level):
+        return False
+    if args.recipient and args.recipient.lower() not in entry.recipients:
+        return False
+    return not args.mid or args.mid.lower().strip("<>") in {m.strip("<>") for m in entry.mids}
+
+
+def _cmd_tail(reader: LogReader, args) -> None:
+    days = reader.days()
+    idx = reader.day_index(days[-1] if days else date.today())
+    entries = [e for e in idx.candidates(args.recipient, args.mid) if match(e, None, None, args.level)]
+    for entry in entries[-args.lines :]:
+        sys.stdout.write(reader.read(idx.log_path, entry))
+    while args.follow:
+        time.sleep(0.5)
+        new = idx.refresh()
+        newer = [day for day in reader.days() if day > idx.day]
+        if newer:
+            # 日誌已換到新的一天：輸出舊檔剩下的紀錄後，從新檔開頭繼續追蹤
+            for entry in new:
+                if _tail_match(entry, args):
+                    sys.stdout.write(reader.read(idx.log_path, entry))
+            idx = reader.day_index(newer[0])
+            new = idx.entries
+        for entry in new:
+            if _tail_match(entry, args):
+                sys.stdout.write(reader.read(idx.log_path, entry))
+        sys.stdout.flush()
+
+
+def _cmd_archive(reader: LogReader, args) -> None:
+    # 今日的日誌仍在寫入，至少保留一天
+    cutoff = date.today() - timedelta(days=max(1, args.older_than))
+    for path in sorted(reader.log_dir.glob("*.log")):
+        try:
+            day = date.fromisoformat(path.stem)
+        except ValueError:
+            continue
+        if day < cutoff:
+            before = path.stat().st_size
+            try:
+                zst = archive(path)
+            except (OSError, ValueError) as exc:
+                print(f"{path.name}：略過（{exc}）")
+                continue
+            print(f"{path.name} → {zst.name}（{before:,} → {zst.stat().st_size:,} bytes）")
+
+
+def _cmd_rebuild(reader: LogReader, args) -> None:
+    today = reader.log_dir / f"{date.today().isoformat()}.log"
+    for path in sorted(reader.log_dir.glob("*.log")):
+        if path == today and not args.include_today:
+            continue  # 今日日誌由 IndexedFileHandler 持續寫入
+        if args.force or not index_path(path).is_file():
+            print(f"{path.name}：{rebuild(path)} 筆")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.log_cli", description="SimpleMailGUI 日誌索引查詢")
+    parser.add_argument("--dir", type=Path, help="日誌目錄（預設為 logs/）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_filters(p):
+        p.add_argument("--level", type=str.upper, help="INFO / ERROR ...")
+        p.add_argument("--recipient", help="收件者位址")
+        p.add_argument("--mid", help="Message-ID")
+
+    p = sub.add_parser("search", help="依條件搜尋日誌")
+    add_filters(p)
+    p.add_argument("--since", type=_parse_time, help="起始時間，例如 2025-09-01 或 2025-09-01T09:00")
+    p.add_argument("--until", type=_parse_time, help="結束時間")
+    p.add_argument("--days", type=int, help="最近 N 天")
+    p.add_argument("--text", help="紀錄內容需包含的文字")
+    p.set_defaults(func=_cmd_search)
+
+    p = sub.add_parser("tail", help="顯示最新日誌的最後幾筆紀錄")
+    add_filters(p)
+    p.add_argument("-n", "--lines", type=int, default=20)
+    p.add_argument("-f", "--follow", action="store_true", help="持續顯示新紀錄（跨過午夜時接續新的日誌）")
+    p.set_defaults(func=_cmd_tail)
+
+    p = sub.add_parser("archive", help="壓縮舊日誌為 .log.zst")
+    p.add_argument("--older-than", type=int, default=7, help="壓縮幾天前的日誌（至少 1，不壓縮今日日誌）")
+    p.set_defaults(func=_cmd_archive)
+
+    p = sub.add_parser("rebuild", help="為沒有索引的日誌重建索引")
+    p.add_argument("--force", action="store_true", help="已有索引也重建")
+    p.add_argument("--include-today", action="store_true")
+    p.set_defaults(func=_cmd_rebuild)
+
+    args = parser.parse_args(argv)
+    try:
+        args.func(LogReader(args.dir), args)
+    except KeyboardInterrupt:
+        pass
+    except BrokenPipeError:
+        os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
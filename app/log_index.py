@@ -0,0 +1,410 @@
+"""
+日誌索引
+--------
+log_service 依紀錄時間寫入每日日誌（跨過午夜時換檔），同時建立索引（logs/YYYY-MM-DD.idx），記錄每筆紀錄的：
+位移、長度、時間、等級、Message-ID 與收件者位址。查詢時只讀取索引並直接定位紀錄，
+不需掃描整份日誌；已壓縮的日誌（.log.zst）以多個獨立 zstd frame 儲存，只解壓命中的 frame。
+GUI 與 daemon 會同時寫入同一份日誌，每筆紀錄在跨行程鎖（logs/.lock）內寫入，索引位移不會錯位。
+
+查詢與維護的命令列介面見 app/log_cli.py。
+"""
+
+from __future__ import annotations
+
+import bisect
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Iterator, Optional
+
+from app.file_lock import FileLock
+
+_MID_RE = re.compile(r"<[^<>\s@]+@[^<>\s]+>")
+_ADDR_RE = re.compile(r"[\w.+'-]+@[\w-]+(?:\.[\w-]+)+")
+# 沒有索引的舊日誌：依 log_service 的格式判斷每筆紀錄的開頭
+_RECORD_RE = re.compile(rb"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),(\d{3}) \[(\w+)\] ", re.M)
+# 壓縮時每個 zstd frame 涵蓋的原始資料量
+FRAME_SIZE = 256 * 1024
+
+
+def extract_keys(message: str) -> tuple[list[str], list[str]]:
+    """從日誌訊息取出 Message-ID 與收件者位址（皆轉為小寫）。"""
+    mids = _MID_RE.findall(message)
+    rest = _MID_RE.sub(" ", message) if mids else message
+    addrs = sorted({a.strip(".'").lower() for a in _ADDR_RE.findall(rest)})
+    return [m.lower() for m in mids], addrs
+
+
+def _index_line(offset: int, length: int, created: float, level: str, message: str) -> str:
+    mids, addrs = extract_keys(message)
+    return f"{offset}\t{length}\t{created:.3f}\t{level}\t{','.join(mids)}\t{','.join(addrs)}\n"
+
+
+# ----------------------------------------------------------
+# 寫入端：取代 logging.FileHandler
+# ----------------------------------------------------------
+def _next_midnight(ts: float) -> tuple[date, float]:
+    """回傳時間戳所屬的日期與隔天 00:00 的時間戳。"""
+    day = date.fromtimestamp(ts)
+    return day, datetime.combine(day + timedelta(days=1), datetime.min.time()).timestamp()
+
+
+class IndexedFileHandler(logging.FileHandler):
+    """
+    依紀錄時間寫入 <log_dir>/YYYY-MM-DD.log，同時把該筆紀錄的位移與查詢鍵附加到同名 .idx 檔；
+    紀錄時間跨過午夜時日誌與索引一起換到新的一天（與 TimedRotatingFileHandler 的 midnight 相同）。
+    附加模式下 tell() 不會反映其他行程的寫入，因此每筆紀錄都在跨行程鎖內移到檔尾、
+    取得位移、寫入並 flush 後才寫索引。
+    """
+
+    def __init__(self, log_dir: str, encoding: str = "utf-8"):
+        self.log_dir = Path(log_dir)
+        self._day, self._rollover_at = _next_midnight(time.time())
+        super().__init__(str(self.log_dir / f"{self._day.isoformat()}.log"), encoding=encoding, delay=True)
+        self._index = None
+        self._write_lock = FileLock(self.log_dir / ".lock")
+
+    def _rollover(self, created: float) -> None:
+        """關閉前一天的日誌與索引，之後的紀錄寫入新的一天。"""
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+        self._day, self._rollover_at = _next_midnight(created)
+        self.baseFilename = os.path.abspath(self.log_dir / f"{self._day.isoformat()}.log")
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            if record.created >= self._rollover_at:
+                self._rollover(record.created)
+            if self.stream is None:
+                self.stream = self._open()
+            if self._index is None:
+                self._index = open(index_path(Path(self.baseFilename)), "a", encoding="utf-8")
+            msg = self.format(record) + self.terminator
+            with self._write_lock:
+                self.stream.seek(0, os.SEEK_END)
+                offset = self.stream.tell()
+                self.stream.write(msg)
+                self.stream.flush()
+                length = self.stream.tell() - offset
+                self._index.write(_index_line(offset, length, record.created, record.levelname, record.getMessage()))
+                self._index.flush()
+        except Exception:  # noqa: BLE001 - 與 logging 相同，交由 handleError 處理
+            self.handleError(record)
+
+    def close(self) -> None:
+        self.acquire()
+        try:
+            if self._index is not None:
+                self._index.close()
+                self._index = None
+            self._write_lock.close()
+            super().close()
+        finally:
+            self.release()
+
+
+# ----------------------------------------------------------
+# 檔案路徑
+# ----------------------------------------------------------
+def index_path(log_path: Path) -> Path:
+    return log_path.with_suffix(".idx")
+
+
+def _archive_paths(log_path: Path) -> tuple[Path, Path]:
+    """壓縮檔與 frame 對照表路徑。"""
+    return log_path.with_suffix(".log.zst"), log_path.with_suffix(".frames")
+
+
+def _time_span(idx_path: Path) -> Optional[tuple[float, float]]:
+    """讀取索引第一筆與最後一筆的紀錄時間；只讀檔頭與檔尾，無法解析時回傳 None。"""
+    try:
+        with open(idx_path, "rb") as f:
+            first = f.readline()
+            if not first.endswith(b"\n"):
+                return None
+            size = f.seek(0, os.SEEK_END)
+            block = 4096
+            while True:
+                start = max(0, size - block)
+                f.seek(start)
+                chunk = f.read()
+                # 去掉寫入中的半行後，取最後一行完整的紀錄
+                body = chunk[: chunk.rfind(b"\n")]
+                nl = body.rfind(b"\n")
+                if nl >= 0 or start == 0:
+                    last = body[nl + 1 :]
+                    break
+                block *= 4
+        return float(first.split(b"\t")[2]), float(last.split(b"\t")[2])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _default_dir() -> Path:
+    from app.log_service import LOG_DIR  # 延後匯入，避免與 log_service 互相匯入
+
+    return Path(LOG_DIR)
+
+
+# ----------------------------------------------------------
+# 讀取端
+# ----------------------------------------------------------
+@dataclass
+class Entry:
+    offset: int
+    length: int
+    created: float
+    level: str
+    mids: tuple[str, ...]
+    recipients: tuple[str, ...]
+
+
+@dataclass
+class DayIndex:
+    """單日索引與反向對照表，依索引檔大小增量更新。"""
+
+    day: date
+    log_path: Path
+    entries: list[Entry] = field(default_factory=list)
+    by_mid: dict[str, list[int]] = field(default_factory=dict)
+    by_recipient: dict[str, list[int]] = field(default_factory=dict)
+    _read_pos: int = 0
+
+    def refresh(self) -> list[Entry]:
+        """讀取索引檔新增的部分，回傳新的項目。"""
+        path = index_path(self.log_path)
+        if not path.is_file():
+            return []
+        new: list[Entry] = []
+        with open(path, "r", encoding="utf-8") as f:
+            f.seek(self._read_pos)
+            for line in f:
+                if not line.endswith("\n"):
+                    break  # 寫入中的半行，下次再讀
+                self._read_pos += len(line.encode("utf-8"))
+                off, length, created, level, mids, addrs = line.rstrip("\n").split("\t")
+                entry = Entry(
+                    int(off),
+                    int(length),
+                    float(created),
+                    level,
+                    tuple(mids.split(",")) if mids else (),
+                    tuple(addrs.split(",")) if addrs else (),
+                )
+                pos = len(self.entries)
+                self.entries.append(entry)
+                for mid in entry.mids:
+                    self.by_mid.setdefault(mid, []).append(pos)
+                for addr in entry.recipients:
+                    self.by_recipient.setdefault(addr, []).append(pos)
+                new.append(entry)
+        return new
+
+    def candidates(self, recipient: Optional[str], mid: Optional[str]) -> list[Entry]:
+        """以反向對照表縮小範圍；沒有指定時回傳全部項目。"""
+        positions = None
+        if recipient:
+            positions = set(self.by_recipient.get(recipient.lower(), ()))
+        if mid:
+            mid_pos = set(self.by_mid.get(mid.lower() if mid.startswith("<") else f"<{mid.lower()}>", ()))
+            positions = mid_pos if positions is None else positions & mid_pos
+        if positions is None:
+            return self.entries
+        return [self.entries[p] for p in sorted(positions)]
+
+
+class LogReader:
+    """依索引讀取原始或已壓縮的日誌紀錄。"""
+
+    def __init__(self, log_dir: Path | None = None):
+        self.log_dir = Path(log_dir) if log_dir else _default_dir()
+        self._days: dict[date, DayIndex] = {}
+        self._frames: dict[Path, tuple[list[int], list[tuple[int, int]]]] = {}
+        self._frame_cache: tuple[Path, int, bytes] | None = None
+
+    def days(self, since: float | None = None, until: float | None = None) -> list[date]:
+        """回傳紀錄時間與 [since, until]（時間戳）有交集的日誌日期，依索引內的紀錄時間判斷而非檔名。"""
+        found = []
+        for path in self.log_dir.glob("*.idx"):
+            try:
+                day = date.fromisoformat(path.stem)
+            except ValueError:
+                continue
+            if since is not None or until is not None:
+                span = _time_span(path)
+                if span is None and path.stat().st_size == 0:
+                    continue
+                # 無法解析時保留，交由逐筆比對時間
+                if span is not None and (
+                    (since is not None and span[1] < since) or (until is not None and span[0] > until)
+                ):
+                    continue
+            found.append(day)
+        return sorted(found)
+
+    def day_index(self, day: date) -> DayIndex:
+        idx = self._days.get(day)
+        if idx is None:
+            idx = self._days[day] = DayIndex(day, self.log_dir / f"{day.isoformat()}.log")
+        idx.refresh()
+        return idx
+
+    def search(
+        self,
+        *,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        level: str | None = None,
+        recipient: str | None = None,
+        mid: str | None = None,
+        text: str | None = None,
+    ) -> Iterator[str]:
+        """依條件回傳符合的紀錄全文（依時間排序）。"""
+        start_ts = since.timestamp() if since else None
+        end_ts = until.timestamp() if until else None
+        for day in self.days(start_ts, end_ts):
+            idx = self.day_index(day)
+            for entry in idx.candidates(recipient, mid):
+                if not match(entry, start_ts, end_ts, level):
+                    continue
+                record = self.read(idx.log_path, entry)
+                if text and text not in record:
+                    continue
+                yield record
+
+    def read(self, log_path: Path, entry: Entry) -> str:
+        """讀取單筆紀錄；原始日誌已壓縮時只解壓涵蓋該位移的 frame。"""
+        if log_path.is_file():
+            with open(log_path, "rb") as f:
+                f.seek(entry.offset)
+                return f.read(entry.length).decode("utf-8", "replace")
+        zst_path, frames_path = _archive_paths(log_path)
+        starts, spans = self._load_frames(frames_path)
+        out = bytearray()
+        pos = entry.offset
+        end = entry.offset + entry.length
+        while pos < end:
+            i = bisect.bisect_right(starts, pos) - 1
+            raw = self._frame(zst_path, i, spans[i])
+            lo = pos - starts[i]
+            chunk = raw[lo : lo + (end - pos)]
+            if not chunk:
+                break
+            out += chunk
+            pos += len(chunk)
+        return out.decode("utf-8", "replace")
+
+    def _load_frames(self, frames_path: Path):
+        cached = self._frames.get(frames_path)
+        if cached is None:
+            starts, spans = [], []
+            for line in frames_path.read_text(encoding="ascii").splitlines():
+                raw_start, comp_off, comp_len = map(int, line.split("\t"))
+                starts.append(raw_start)
+                spans.append((comp_off, comp_len))
+            cached = self._frames[frames_path] = (starts, spans)
+        return cached
+
+    def _frame(self, zst_path: Path, i: int, span: tuple[int, int]) -> bytes:
+        if self._frame_cache and self._frame_cache[:2] == (zst_path, i):
+            return self._frame_cache[2]
+        import zstandard
+
+        with open(zst_path, "rb") as f:
+            f.seek(span[0])
+            raw = zstandard.ZstdDecompressor().decompress(f.read(span[1]))
+        self._frame_cache = (zst_path, i, raw)
+        return raw
+
+
+def match(entry: Entry, start_ts: float | None, end_ts: float | None, level: str | None) -> bool:
+    if start_ts is not None and entry.created < start_ts:
+        return False
+    if end_ts is not None and entry.created > end_ts:
+        return False
+    return level is None or entry.level == level
+
+
+# ----------------------------------------------------------
+# 維護：重建索引與壓縮
+# ----------------------------------------------------------
+def rebuild(log_path: Path) -> int:
+    """為沒有索引的舊日誌重建 .idx，回傳紀錄筆數。多行紀錄（例如堆疊）歸屬前一筆。"""
+    data = log_path.read_bytes()
+    starts = [m.start() for m in _RECORD_RE.finditer(data)]
+    lines = []
+    for i, start in enumerate(starts):
+        end = starts[i + 1] if i + 1 < len(starts) else len(data)
+        m = _RECORD_RE.match(data, start)
+        created = datetime.strptime(m.group(1).decode(), "%Y-%m-%d %H:%M:%S").timestamp()
+        created += int(m.group(2)) / 1000
+        message = data[m.end() : end].decode("utf-8", "replace")
+        lines.append(_index_line(start, end - start, created, m.group(3).decode(), message))
+    index_path(log_path).write_text("".join(lines), encoding="utf-8")
+    return len(lines)
+
+
+def archive(log_path: Path, level: int = 10) -> Path:
+    """
+    將日誌壓縮為 .log.zst（每 FRAME_SIZE 一個獨立 frame，切在紀錄邊界）並刪除原檔。
+    索引的位移維持原始位移，讀取時經由 .frames 對照表定位。
+
+    今日（含）之後的日誌或含有今日紀錄的日誌仍在寫入，一律拒絕（ValueError）；
+    壓縮期間若日誌又有寫入、或檔案仍被其他行程開啟而無法刪除，放棄壓縮並保留原檔。
+    """
+    import zstandard
+
+    today = datetime.combine(date.today(), datetime.min.time()).timestamp()
+    try:
+        current = date.fromisoformat(log_path.stem) >= date.today()
+    except ValueError:
+        current = False
+    idx = index_path(log_path)
+    if not idx.is_file():
+        rebuild(log_path)
+    span = _time_span(idx)
+    if current or (span is not None and span[1] >= today):
+        raise ValueError(f"{log_path.name} 仍在寫入，不壓縮")
+    boundaries = [int(line.split("\t", 1)[0]) for line in idx.read_text(encoding="utf-8").splitlines()]
+    data = log_path.read_bytes()
+    zst_path, frames_path = _archive_paths(log_path)
+    compressor = zstandard.ZstdCompressor(level=level)
+
+    frames = []
+    with open(zst_path, "wb") as out:
+        start = 0
+        while start < len(data):
+            # 下一個 frame 從第一個超過 FRAME_SIZE 的紀錄邊界開始
+            i = bisect.bisect_right(boundaries, start + FRAME_SIZE)
+            end = boundaries[i] if i < len(boundaries) else len(data)
+            if end <= start:
+                end = len(data)
+            comp = compressor.compress(data[start:end])
+            frames.append(f"{start}\t{out.tell()}\t{len(comp)}\n")
+            out.write(comp)
+            start = end
+
+    # 在寫入鎖內確認壓縮期間沒有新的寫入後才刪除原檔
+    lock = FileLock(log_path.parent / ".lock")
+    try:
+        with lock:
+            try:
+                if log_path.stat().st_size != len(data):
+                    raise ValueError(f"{log_path.name} 壓縮期間有新的寫入，保留原檔")
+                frames_path.write_text("".join(frames), encoding="ascii")
+                log_path.unlink()
+            except (OSError, ValueError):
+                zst_path.unlink(missing_ok=True)
+                frames_path.unlink(missing_ok=True)
+                raise
+    finally:
+        lock.close()
+    return zst_path
@@ -2,21 +2,20 @@
 
 import logging
 import os
-from datetime import datetime
+
+from app.log_index import IndexedFileHandler
 
 # logs 目錄位於專案根目錄下，若不存在會自動建立
 LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "logs")
 os.makedirs(LOG_DIR, exist_ok=True)
 
-# 以日期分檔，方便追蹤每日寄信紀錄
-LOG_FILE = os.path.join(LOG_DIR, f"{datetime.now():%Y-%m-%d}.log")
-
 # 建立同時輸出到檔案與終端機的記錄設定
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(message)s",
     handlers=[
-        logging.FileHandler(LOG_FILE, encoding="utf-8"),
+        # 以日期分檔（logs/YYYY-MM-DD.log，跨過午夜自動換檔），寫入時同步建立 .idx 索引供 python -m app.log_cli 查詢
+        IndexedFileHandler(LOG_DIR, encoding="utf-8"),
         logging.StreamHandler(),  # 同時輸出到終端機
     ],
 )
@@ -8,43 +8,91 @@ SMTP Mail Service
 - 支援附加檔案 (自動判斷 MIME 類型)
 - 透過 app.config 載入 SMTP 設定
 - 透過 app.log_service 記錄寄送結果與錯誤
+- 寄出的郵件存入寄件備份（app.archive），可還原原文
 """
 
 from __future__ import annotations
 
 import mimetypes
+import os
+import re
 import smtplib
+import time
 from email.message import EmailMessage
+from email.utils import formatdate, make_msgid, parseaddr
 from pathlib import Path
-from typing import Iterable, List, Optional
+from typing import Callable, Iterable, List, Optional
 
 from app import config
 from app.log_service import log_info, log_error, log_exception
+from app import fast_mime
+from app.archive import get_archive
+from app.dkim_signer import get_signer
+from app.fast_mime import Attachment, WireMessage
+from app.idempotency import get_ledger
+from app.profiling import profiled
+from app.recipients import Recipients, process_recipients
+from app.suppression import get_suppression_list
 
 
 # ----------------------------------------------------------
-# 工具函式：統一處理輸入型別
+# 工具函式：統一處理收件者
 # ----------------------------------------------------------
-def _ensure_list(x: Optional[Iterable[str]]) -> List[str]:
+def _ensure_recipients(
+    to_addrs: Iterable[str] | None,
+    cc: Iterable[str] | None,
+    bcc: Iterable[str] | None,
+) -> Recipients:
     """
-    將傳入的收件者資訊轉成 List[str]
-    若為 None 或空集合，回傳空清單。
+    解析、驗證並去重 To / Cc / Bcc。
+    有格式錯誤的位址時直接拋出 ValueError，避免連線後才被伺服器拒絕。
     """
-    if not x:
-        return []
-    return [s.strip() for s in x if s and s.strip()]
+    rcpts = process_recipients(to_addrs, cc, bcc)
+    if rcpts.invalid:
+        shown = ", ".join(rcpts.invalid[:5])
+        more = f" 等 {len(rcpts.invalid)} 個" if len(rcpts.invalid) > 5 else ""
+        raise ValueError(f"收件者格式錯誤：{shown}{more}")
+    if not rcpts:
+        raise ValueError("至少需要一個收件者（To / Cc / Bcc）")
+    if rcpts.duplicates:
+        log_info(f"已移除 {rcpts.duplicates} 個重複的收件者")
+    return rcpts
+
+
+def _apply_suppression(recipients: List[str]) -> List[str]:
+    """
+    排除停止寄送名單中的位址（只影響實際 RCPT，標頭維持不變）。
+    全部收件者都被排除時拋出 ValueError，不建立連線。
+    """
+    suppression = get_suppression_list()
+    if suppression is None:
+        return recipients
+    allowed, suppressed = suppression.filter(recipients)
+    if suppressed:
+        log_info(f"🚫 略過停止寄送名單中的收件者：{', '.join(suppressed)}")
+    if not allowed:
+        raise ValueError("所有收件者皆在停止寄送名單中")
+    return allowed
+
+
+def _sender_domain(sender: str) -> Optional[str]:
+    """取出寄件者網域作為 Message-ID 右半部，無法判斷時交給 make_msgid 預設值。"""
+    _, _, domain = sender.rpartition("@")
+    domain = domain.strip(" >")
+    return domain or None
 
 
 # ----------------------------------------------------------
 # 工具函式：處理附件
 # ----------------------------------------------------------
-def _add_attachments(msg: EmailMessage, attachments: Iterable[str] | None) -> None:
+def _read_attachments(attachments: Iterable[str] | None) -> List[Attachment]:
     """
-    附加檔案到郵件中，根據副檔名自動判斷 MIME 類型。
+    讀取附件並根據副檔名自動判斷 MIME 類型。
     若找不到檔案或無法判斷類型，會記錄錯誤但不會中斷寄信。
     """
     if not attachments:
-        return
+        return []
+    files = []
     for p in attachments:
         path = Path(p)
         if not path.is_file():
@@ -57,19 +105,18 @@ def _add_attachments(msg: EmailMessage, attachments: Iterable[str] | None) -> No
             ctype = "application/octet-stream"
         maintype, subtype = ctype.split("/", 1)
 
-        # 以二進位方式讀取檔案內容
+        # 以二進位方式讀取檔案內容；讀取前記下檔案識別，讀取期間被修改時之後的識別必然不同
         with path.open("rb") as f:
-            msg.add_attachment(
-                f.read(),
-                maintype=maintype,
-                subtype=subtype,
-                filename=path.name,
-            )
+            st = os.fstat(f.fileno())
+            stamp = (os.path.realpath(path), st.st_size, st.st_mtime_ns)
+            files.append(Attachment(path.name, maintype, subtype, f.read(), stamp))
+    return files
 
 
 # ----------------------------------------------------------
 # 建立 EmailMessage 物件
 # ----------------------------------------------------------
+@profiled("build_message")
 def build_message(
     sender: str,
     to_addrs: Iterable[str],
@@ -85,23 +132,44 @@ def build_message(
     """
     建立一封郵件物件，可支援 HTML、Cc、Bcc、回覆地址、附件等功能。
     """
-    # 將收件人、抄送、密件抄送統一處理成清單
-    to_list = _ensure_list(to_addrs)
-    cc_list = _ensure_list(cc)
-    bcc_list = _ensure_list(bcc)
+    # 將收件人、抄送、密件抄送解析並去重
+    rcpts = _ensure_recipients(to_addrs, cc, bcc)
+    return _build_message(
+        sender,
+        rcpts,
+        subject,
+        body,
+        as_html=as_html,
+        reply_to=reply_to,
+        files=_read_attachments(attachments),
+    )
 
-    if not to_list and not cc_list and not bcc_list:
-        raise ValueError("至少需要一個收件者（To / Cc / Bcc）")
 
+def _build_message(
+    sender: str,
+    rcpts: Recipients,
+    subject: str,
+    body: str,
+    *,
+    as_html: bool = False,
+    reply_to: Optional[str] = None,
+    files: Iterable[Attachment] = (),
+    date: Optional[str] = None,
+    message_id: Optional[str] = None,
+) -> EmailMessage:
+    """以已處理的收件者與已讀入的附件建立郵件物件（Bcc 不寫入標頭）。"""
     # 初始化郵件物件
     msg = EmailMessage()
     msg["From"] = sender
-    msg["To"] = ", ".join(to_list) if to_list else sender
-    if cc_list:
-        msg["Cc"] = ", ".join(cc_list)
+    msg["To"] = ", ".join(rcpts.to) if rcpts.to else sender
+    if rcpts.cc:
+        msg["Cc"] = ", ".join(rcpts.cc)
     if reply_to:
         msg["Reply-To"] = reply_to.strip()
     msg["Subject"] = subject
+    msg["Date"] = date or formatdate(localtime=True)
+    # 每封信都給予唯一 Message-ID，批次共用連線時才能分辨各自的結果
+    msg["Message-ID"] = message_id or make_msgid(domain=_sender_domain(sender))
 
     # 根據 as_html 決定信件內容格式
     if as_html:
@@ -112,10 +180,55 @@ def build_message(
         msg.set_content(body)
 
     # 處理附件
-    _add_attachments(msg, attachments)
+    for f in files:
+        msg.add_attachment(f.data, maintype=f.maintype, subtype=f.subtype, filename=f.filename)
     return msg
 
 
+def _compose(
+    sender: str,
+    rcpts: Recipients,
+    subject: str,
+    body: str,
+    *,
+    as_html: bool = False,
+    reply_to: Optional[str] = None,
+    attachments: Iterable[str] | None = None,
+) -> EmailMessage | WireMessage:
+    """
+    建立待寄送的郵件：常見格式由 fast_mime 直接序列化，
+    其餘（或 FAST_SERIALIZER 關閉時）改用 EmailMessage。
+    """
+    files = _read_attachments(attachments)
+    date = formatdate(localtime=True)
+    message_id = make_msgid(domain=_sender_domain(sender))
+    if config.FAST_SERIALIZER:
+        wire = fast_mime.serialize(
+            sender,
+            rcpts,
+            subject,
+            body,
+            date=date,
+            message_id=message_id,
+            as_html=as_html,
+            reply_to=reply_to,
+            attachments=files,
+        )
+        if wire is not None:
+            return wire
+    return _build_message(
+        sender,
+        rcpts,
+        subject,
+        body,
+        as_html=as_html,
+        reply_to=reply_to,
+        files=files,
+        date=date,
+        message_id=message_id,
+    )
+
+
 # ----------------------------------------------------------
 # 建立 SMTP 連線
 # ----------------------------------------------------------
@@ -134,9 +247,252 @@ def _connect_smtp() -> smtplib.SMTP:
     return smtp
 
 
+# ----------------------------------------------------------
+# 連線工作階段：供單封與批次寄送共用
+# ----------------------------------------------------------
+def _check_config() -> None:
+    """確認環境設定是否齊全。"""
+    if not (config.SMTP_SERVER and config.SMTP_PORT and config.SMTP_USER and config.SMTP_PASS):
+        raise ValueError("SMTP 設定不完整，請確認 .env 或 app/config.py")
+
+
+def open_session() -> smtplib.SMTP:
+    """
+    建立已登入的 SMTP 連線，可連續寄送多封郵件後再以 close_session 關閉。
+    """
+    _check_config()
+    smtp = None
+    try:
+        smtp = _connect_smtp()
+        smtp.login(config.SMTP_USER, config.SMTP_PASS)
+    except Exception as e:
+        _log_smtp_error(e)
+        close_session(smtp)
+        raise
+    return smtp
+
+
+def close_session(smtp: Optional[smtplib.SMTP]) -> None:
+    """安全關閉連線，忽略關閉過程中的錯誤。"""
+    if smtp is None:
+        return
+    try:
+        smtp.quit()
+    except Exception:
+        pass
+
+
+def prepare_email(
+    to_addrs: Iterable[str],
+    subject: str,
+    body: str,
+    *,
+    as_html: bool = False,
+    cc: Iterable[str] | None = None,
+    bcc: Iterable[str] | None = None,
+    reply_to: Optional[str] = None,
+    attachments: Iterable[str] | None = None,
+) -> tuple[EmailMessage | WireMessage, List[str]]:
+    """
+    建立郵件物件並組合實際寄送用的收件人清單（含 Bcc，已排除停止寄送名單）。
+    參數與 send_email 相同。
+    """
+    _check_config()
+    rcpts = _ensure_recipients(to_addrs, cc, bcc)
+    envelope = _apply_suppression(rcpts.envelope)
+    msg = _compose(
+        config.SMTP_USER,
+        rcpts,
+        subject,
+        body,
+        as_html=as_html,
+        reply_to=reply_to,
+        attachments=attachments,
+    )
+    return msg, envelope
+
+
+def _flatten(msg: EmailMessage | WireMessage) -> bytes:
+    """以 SMTP 線路格式（CRLF）序列化郵件，與 smtplib.send_message 的輸出相同。"""
+    if isinstance(msg, WireMessage):
+        return msg.data
+    return msg.as_bytes(policy=msg.policy.clone(linesep="\r\n"))
+
+
+class AmbiguousDelivery(smtplib.SMTPServerDisconnected):
+    """郵件內容已送出，但在伺服器回覆前連線中斷或逾時，無法確定是否已寄達。"""
+
+
+_LEADING_DOT_RE = re.compile(rb"(?m)^\.")
+
+
+def _abort_transaction(smtp: smtplib.SMTP, code: int) -> None:
+    """MAIL / RCPT 被拒後結束本次交易：421 代表伺服器即將斷線，其餘以 RSET 重置。"""
+    if code == 421:
+        smtp.close()
+        return
+    try:
+        smtp.rset()
+    except smtplib.SMTPServerDisconnected:
+        pass
+
+
+def _sendmail(smtp: smtplib.SMTP, from_addr: str, recipients: List[str], data: bytes) -> dict:
+    """
+    與 smtplib.SMTP.sendmail 相同（回傳部分被拒的收件者），
+    但 DATA 內容送出後的連線錯誤改拋出 AmbiguousDelivery，
+    呼叫端才能區分「確定未寄出」（可安全重試）與「可能已寄出」。
+    """
+    smtp.ehlo_or_helo_if_needed()
+    options = []
+    if smtp.does_esmtp and smtp.has_extn("size"):
+        options.append(f"size={len(data)}")
+    code, resp = smtp.mail(from_addr, options)
+    if code != 250:
+        _abort_transaction(smtp, code)
+        raise smtplib.SMTPSenderRefused(code, resp, from_addr)
+
+    refused = {}
+    for rcpt in recipients:
+        code, resp = smtp.rcpt(rcpt)
+        if code not in (250, 251):
+            refused[rcpt] = (code, resp)
+        if code == 421:
+            smtp.close()
+            raise smtplib.SMTPRecipientsRefused(refused)
+    if len(refused) == len(recipients):
+        _abort_transaction(smtp, code)
+        raise smtplib.SMTPRecipientsRefused(refused)
+
+    code, resp = smtp.docmd("data")
+    if code != 354:
+        _abort_transaction(smtp, code)
+        raise smtplib.SMTPDataError(code, resp)
+    # 以下與 smtplib.SMTP.data 相同：行首的點加倍並以 <CRLF>.<CRLF> 結尾
+    payload = _LEADING_DOT_RE.sub(b"..", data)
+    if not payload.endswith(b"\r\n"):
+        payload += b"\r\n"
+    try:
+        smtp.send(payload + b".\r\n")
+        code, resp = smtp.getreply()
+    except (smtplib.SMTPServerDisconnected, OSError) as exc:
+        smtp.close()
+        raise AmbiguousDelivery(f"DATA 已送出但未收到伺服器回覆：{exc}") from exc
+    if code != 250:
+        _abort_transaction(smtp, code)
+        raise smtplib.SMTPDataError(code, resp)
+    return refused
+
+
+def deliver(
+    smtp: smtplib.SMTP,
+    msg: EmailMessage | WireMessage,
+    recipients: List[str],
+    *,
+    on_sent: Optional[Callable[[int], None]] = None,
+    on_latency: Optional[Callable[[float], None]] = None,
+    idempotency_key: Optional[str] = None,
+) -> str:
+    """
+    透過已登入的連線寄出一封郵件並記錄結果，回傳 Message-ID。
+    有設定 DKIM 時會在寄出前簽章；寄出後存入寄件備份（ARCHIVE_FILE）。
+    on_sent 會在寄出後收到郵件大小（位元組），供進度顯示計算傳輸速率。
+    on_latency 會在寄出後收到 SMTP 交易（MAIL FROM 至 DATA 回覆）的秒數，
+    不含簽章、紀錄與備份，供調整同時連線數。
+    idempotency_key 已寄出過（或結果不明）時拋出 DuplicateSend，不傳送任何指令。
+    失敗時記錄錯誤後拋出原例外，連線是否仍可用由呼叫端判斷。
+    """
+    data = _flatten(msg)
+    signer = get_signer()
+    if signer is not None:
+        data = signer.sign(data, body_key=getattr(msg, "body_key", None))
+    ledger = get_ledger() if idempotency_key else None
+    if ledger is not None:
+        ledger.reserve(idempotency_key)
+    try:
+        started = time.monotonic()
+        refused = _sendmail(smtp, parseaddr(msg["From"])[1], recipients, data)
+        latency = time.monotonic() - started
+    except Exception as e:
+        _log_smtp_error(e)
+        if isinstance(e, smtplib.SMTPRecipientsRefused):
+            _suppress_refused(e.recipients)
+        if ledger is not None:
+            if isinstance(e, AmbiguousDelivery):
+                ledger.mark_uncertain(idempotency_key)
+            else:
+                ledger.release(idempotency_key)
+        raise
+    if refused:
+        # 部分收件者被拒時 sendmail 不會拋出例外，只回傳被拒清單
+        log_error(f"部分收件人被拒絕：{refused}")
+        _suppress_refused(refused)
+    mid = msg.get("Message-ID", "") or "<no-message-id>"
+    if ledger is not None:
+        ledger.commit(idempotency_key, mid)
+    log_info(
+        f"寄信成功 → To:{msg.get('To')} Cc:{msg.get('Cc', '')} "
+        f"Rcpt:{len(recipients)} Subject:{msg.get('Subject')} MID:{mid}"
+    )
+    _archive_sent(data, msg, recipients, mid)
+    if on_sent is not None:
+        on_sent(len(data))
+    if on_latency is not None:
+        on_latency(latency)
+    return mid
+
+
+def _archive_sent(data: bytes, msg: EmailMessage | WireMessage, recipients: List[str], mid: str) -> None:
+    """將寄出的郵件存入寄件備份；備份失敗只記錄錯誤，不影響寄送結果。"""
+    archive = get_archive()
+    if archive is None:
+        return
+    try:
+        archive.store(
+            data,
+            message_id=mid,
+            sender=parseaddr(msg["From"])[1],
+            recipients=recipients,
+            subject=str(msg.get("Subject", "")),
+        )
+    except Exception as exc:  # noqa: BLE001
+        log_error(f"寄件備份失敗 MID:{mid}：{exc}")
+
+
+def _suppress_refused(refused: dict) -> None:
+    """將信箱層級永久被拒（550 / 551 / 553、5.1.x / 5.2.1）的收件者加入停止寄送名單。"""
+    suppression = get_suppression_list()
+    if suppression is None:
+        return
+    try:
+        suppression.add_refused(refused)
+    except OSError as exc:
+        log_error(f"停止寄送名單寫入失敗：{exc}")
+
+
+def _log_smtp_error(e: Exception) -> None:
+    """常見 SMTP 錯誤分類記錄。"""
+    if isinstance(e, smtplib.SMTPAuthenticationError):
+        log_error("驗證失敗：請檢查 SMTP_USER / SMTP_PASS 或應用程式密碼。")
+    elif isinstance(e, smtplib.SMTPRecipientsRefused):
+        log_error(f"收件人被拒絕：{e.recipients}")
+    elif isinstance(e, smtplib.SMTPConnectError):
+        log_error(f"無法連線至伺服器：{e}")
+    elif isinstance(e, AmbiguousDelivery):
+        log_error(f"寄送結果不明：{e}")
+    elif isinstance(e, smtplib.SMTPServerDisconnected):
+        log_error(f"伺服器連線中斷：{e}")
+    elif isinstance(e, smtplib.SMTPSenderRefused):
+        log_error(f"寄件人被拒絕：{e}")
+    else:
+        # 捕捉所有其他未預期錯誤
+        log_exception(e)
+
+
 # ----------------------------------------------------------
 # 寄送郵件主函式
 # ----------------------------------------------------------
+@profiled("send_email")
 def send_email(
     to_addrs: Iterable[str],
     subject: str,
@@ -147,6 +503,8 @@ def send_email(
     bcc: Iterable[str] | None = None,
     reply_to: Optional[str] = None,
     attachments: Iterable[str] | None = None,
+    on_sent: Optional[Callable[[int], None]] = None,
+    idempotency_key: Optional[str] = None,
 ) -> str:
     """
     寄送郵件（使用 app/config 中的 SMTP 設定）。
@@ -160,25 +518,28 @@ def send_email(
     cc, bcc  : 抄送與密件抄送清單
     reply_to : 回覆地址（可選）
     attachments : 附件檔案路徑清單（可選）
+    on_sent  : 寄出後以郵件大小（位元組）呼叫的回呼（可選）
+    idempotency_key : 冪等鍵（可選），已寄出過的鍵不會重複寄送（見 app/idempotency.py）
 
     回傳：
     --------
-    message_id : EmailMessage 所產生的 Message-ID（非伺服器端 ID）
+    message_id : build_message 所產生的 Message-ID（非伺服器端 ID）
 
     例外：
     --------
     若 SMTP 設定有誤或連線/驗證失敗，會拋出 smtplib 相關例外。
+    冪等鍵重複時拋出 app.idempotency.DuplicateSend（不建立連線）。
     """
-    # 確認環境設定是否齊全
-    if not (config.SMTP_SERVER and config.SMTP_PORT and config.SMTP_USER and config.SMTP_PASS):
-        raise ValueError("SMTP 設定不完整，請確認 .env 或 app/config.py")
+    # 重複寄送在連線前就攔下，省去連線、登入與 DATA
+    ledger = get_ledger() if idempotency_key else None
+    if ledger is not None:
+        ledger.check(idempotency_key)
 
-    # 建立郵件物件
-    msg = build_message(
-        sender=config.SMTP_USER,
-        to_addrs=to_addrs,
-        subject=subject,
-        body=body,
+    # 建立郵件物件與實際收件人清單
+    msg, all_recipients = prepare_email(
+        to_addrs,
+        subject,
+        body,
         as_html=as_html,
         cc=cc,
         bcc=bcc,
@@ -186,52 +547,11 @@ def send_email(
         attachments=attachments,
     )
 
-    # 組合所有收件人（實際寄送用）
-    to_list = _ensure_list(to_addrs)
-    cc_list = _ensure_list(cc)
-    bcc_list = _ensure_list(bcc)
-    all_recipients = to_list + cc_list + bcc_list or [config.SMTP_USER]
-
     smtp = None
     try:
-        # 建立連線並登入
-        smtp = _connect_smtp()
-        smtp.login(config.SMTP_USER, config.SMTP_PASS)
-
-        # 寄送郵件
-        smtp.send_message(msg, to_addrs=all_recipients)
-        mid = msg.get("Message-ID", "") or "<no-message-id>"
-
-        log_info(
-            f"寄信成功 → To:{to_list or ['(self)']} "
-            f"Cc:{cc_list} Bcc:{len(bcc_list)} Subject:{subject} MID:{mid}"
-        )
-        return mid
-
-    # 常見 SMTP 錯誤分類記錄
-    except smtplib.SMTPAuthenticationError:
-        log_error("驗證失敗：請檢查 SMTP_USER / SMTP_PASS 或應用程式密碼。")
-        raise
-    except smtplib.SMTPRecipientsRefused as e:
-        log_error(f"收件人被拒絕：{e.recipients}")
-        raise
-    except smtplib.SMTPConnectError as e:
-        log_error(f"無法連線至伺服器：{e}")
-        raise
-    except smtplib.SMTPServerDisconnected as e:
-        log_error(f"伺服器連線中斷：{e}")
-        raise
-    except smtplib.SMTPSenderRefused as e:
-        log_error(f"寄件人被拒絕：{e}")
-        raise
-    except Exception as e:
-        # 捕捉所有其他未預期錯誤
-        log_exception(e)
-        raise
+        # 建立連線並登入後寄送
+        smtp = open_session()
+        return deliver(smtp, msg, all_recipients, on_sent=on_sent, idempotency_key=idempotency_key)
     finally:
         # 結束連線（安全關閉）
-        if smtp is not None:
-            try:
-                smtp.quit()
-            except Exception:
-                pass
+        close_session(smtp)
@@ -0,0 +1,135 @@
+"""
+效能剖析
+--------
+可選的 cProfile / tracemalloc 取樣，用於追查正式環境中寄信緩慢的原因：
+- 以 PROFILE_ENABLED 環境變數或 GUI 開關啟用，預設關閉且幾乎沒有額外成本
+- 針對單次寄信、排程任務與啟動流程取樣，輸出 .pstats（可用 snakeviz / flameprof 轉成火焰圖）
+- 開啟 PROFILE_MEMORY 時另外輸出 tracemalloc 記憶體配置統計（.mem.txt）
+- 取樣率、耗時預算與輸出目錄大小上限皆可設定，超過時自動略過或刪除最舊的檔案
+"""
+
+from __future__ import annotations
+
+import cProfile
+import functools
+import os
+import random
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from app import config
+from app.log_service import log_error, log_info
+
+_enabled = config.PROFILE_ENABLED
+# cProfile（sys.monitoring）與 tracemalloc 皆為全域，同一時間只能剖析一個區段
+_active = threading.Lock()
+_budget_lock = threading.Lock()
+_enabled_at = time.monotonic()
+_profiled_seconds = 0.0
+
+
+def set_enabled(enabled: bool) -> None:
+    """開啟或關閉剖析（GUI 開關使用），並重新計算耗時預算。"""
+    global _enabled, _enabled_at, _profiled_seconds
+    with _budget_lock:
+        _enabled = enabled
+        _enabled_at = time.monotonic()
+        _profiled_seconds = 0.0
+    log_info(f"🔬 效能剖析已{'開啟' if enabled else '關閉'}")
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def _should_sample() -> bool:
+    """依取樣率與耗時預算決定本次是否剖析。"""
+    if not _enabled or random.random() >= config.PROFILE_SAMPLE_RATE:
+        return False
+    with _budget_lock:
+        elapsed = time.monotonic() - _enabled_at
+        # 啟用後的前幾秒沒有足夠的時間基準，允許取樣
+        return elapsed < 5 or _profiled_seconds <= elapsed * config.PROFILE_OVERHEAD_BUDGET
+
+
+@contextmanager
+def profile_section(name: str):
+    """
+    剖析 with 區塊。未啟用、未被取樣、或已有其他區段正在剖析時直接執行，不產生輸出。
+    """
+    global _profiled_seconds
+    if not _should_sample() or not _active.acquire(blocking=False):
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    trace_memory = config.PROFILE_MEMORY and not tracemalloc.is_tracing()
+    start = time.monotonic()
+    try:
+        try:
+            profiler.enable()
+        except ValueError:
+            # 其他剖析工具（例如除錯器）已在執行
+            yield
+            return
+        if trace_memory:
+            tracemalloc.start()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            snapshot = tracemalloc.take_snapshot() if trace_memory else None
+            if trace_memory:
+                tracemalloc.stop()
+            duration = time.monotonic() - start
+            _write(name, profiler, snapshot, duration)
+    finally:
+        _active.release()
+        with _budget_lock:
+            _profiled_seconds += time.monotonic() - start
+
+
+def profiled(name: str):
+    """以 profile_section 包裝函式的裝飾器。"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with profile_section(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _write(name: str, profiler: cProfile.Profile, snapshot, duration: float) -> None:
+    """寫出剖析結果並依大小上限輪替。寫檔失敗只記錄，不影響寄信流程。"""
+    try:
+        out_dir = Path(config.PROFILE_DIR)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        stem = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{name}-{os.getpid()}"
+        profiler.dump_stats(out_dir / f"{stem}.pstats")
+        if snapshot is not None:
+            lines = [str(stat) for stat in snapshot.statistics("lineno")[:50]]
+            (out_dir / f"{stem}.mem.txt").write_text("\n".join(lines), encoding="utf-8")
+        log_info(f"🔬 已輸出剖析結果 {stem}（{duration * 1000:.1f} ms）")
+        _rotate(out_dir)
+    except Exception as exc:  # noqa: BLE001
+        log_error(f"剖析結果寫入失敗：{exc}")
+
+
+def _rotate(out_dir: Path) -> None:
+    """刪除最舊的檔案，直到目錄大小不超過 PROFILE_MAX_BYTES。"""
+    # 檔名以時間戳記開頭，依名稱排序即為新舊順序
+    files = sorted(p for p in out_dir.iterdir() if p.suffix in (".pstats", ".txt"))
+    total = sum(p.stat().st_size for p in files)
+    for path in files:
+        if total <= config.PROFILE_MAX_BYTES:
+            break
+        total -= path.stat().st_size
+        path.unlink(missing_ok=True)
@@ -0,0 +1,135 @@
+"""排程服務：包裝 APScheduler 與寄送 dispatcher，可由 GUI 或無介面常駐程式共用。"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from uuid import uuid4
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
+
+from app.dispatcher import LANE_SCHEDULED, SendDispatcher
+from app.idempotency import DuplicateSend, scheduled_key
+from app.log_service import log_error, log_info, log_exception
+from app.profiling import profiled
+
+
+class ScheduleService:
+    """建立、列出排程任務，並在觸發時交由 dispatcher 合併寄送。"""
+
+    def __init__(self, dispatcher: SendDispatcher | None = None, scheduler: BackgroundScheduler | None = None):
+        self.dispatcher = dispatcher or SendDispatcher()
+        self.scheduler = scheduler or BackgroundScheduler()
+
+    # -- 生命週期 ---------------------------------------------------------
+    def start(self) -> None:
+        self.scheduler.start()
+
+    def shutdown(self, wait: bool = False) -> None:
+        """停止排程器與 dispatcher，wait=True 時會等已排入的郵件寄完。"""
+
+        try:
+            self.scheduler.shutdown(wait=wait)
+        finally:
+            self.dispatcher.shutdown(wait=wait)
+
+    # -- 對外 API --------------------------------------------------------
+    def add_jobs(self, payload: dict, schedule_opts: dict, calendar_dt) -> list[str]:
+        """依照排程設定建立 APScheduler 任務，回傳描述清單。"""
+
+        descriptions: list[str] = []
+        hour, minute = schedule_opts["daily_time"]
+        now = datetime.now()
+
+        if schedule_opts["use_calendar"]:
+            if calendar_dt is None:
+                raise ValueError("請在月曆頁籤選擇日期與時間。")
+            if calendar_dt <= now:
+                raise ValueError("排程時間必須晚於目前時間。")
+            desc = f"單次排程：{calendar_dt:%Y-%m-%d %H:%M}"
+            job_id = f"once-{uuid4()}"
+            self.scheduler.add_job(
+                self._run_scheduled_send,
+                trigger="date",
+                run_date=calendar_dt,
+                args=[payload, desc, job_id],
+                id=job_id,
+                replace_existing=False,
+            )
+            descriptions.append(desc)
+
+        if schedule_opts["daily"]:
+            desc = f"每日 {hour:02d}:{minute:02d}"
+            job_id = f"daily-{uuid4()}"
+            trigger = CronTrigger(hour=hour, minute=minute)
+            self.scheduler.add_job(
+                self._run_scheduled_send,
+                trigger=trigger,
+                args=[payload, desc, job_id],
+                id=job_id,
+                replace_existing=False,
+            )
+            descriptions.append(desc)
+
+        if schedule_opts["weekday"]:
+            desc = f"週一至週五 {hour:02d}:{minute:02d}"
+            job_id = f"weekday-{uuid4()}"
+            trigger = CronTrigger(day_of_week="mon-fri", hour=hour, minute=minute)
+            self.scheduler.add_job(
+                self._run_scheduled_send,
+                trigger=trigger,
+                args=[payload, desc, job_id],
+                id=job_id,
+                replace_existing=False,
+            )
+            descriptions.append(desc)
+
+        if not descriptions:
+            raise ValueError("請至少選擇一種排程方式。")
+
+        log_info("📅 已建立排程：" + " / ".join(descriptions))
+        return descriptions
+
+    def list_jobs(self) -> list[dict]:
+        """回傳目前所有排程的摘要（可序列化，供 IPC 傳輸）。"""
+
+        jobs = []
+        for job in self.scheduler.get_jobs():
+            payload, desc = job.args[0], job.args[1]
+            jobs.append(
+                {
+                    "id": job.id,
+                    "desc": desc,
+                    "next_run_time": job.next_run_time,
+                    "to_addrs": list(payload["to_addrs"]),
+                    "subject": payload["subject"],
+                }
+            )
+        return jobs
+
+    # -- 內部 -------------------------------------------------------------
+    @profiled("scheduled_job")
+    def _run_scheduled_send(self, payload: dict, job_desc: str, job_id: str | None = None) -> None:
+        """
+        供 APScheduler 呼叫的背景寄信任務，實際寄送交由 dispatcher 合併處理。
+        以任務 ID 與排定觸發時間作為冪等鍵：所有排程都在整分觸發且 misfire 寬限遠小於一分鐘，
+        觸發當下的分鐘即為排定時間，同一次觸發重複執行時只會寄出一封。
+        """
+
+        if job_id is not None:
+            payload = {**payload, "idempotency_key": scheduled_key(job_id, datetime.now())}
+
+        def _on_done(future) -> None:
+            exc = future.exception()
+            if isinstance(exc, DuplicateSend):
+                log_info(f"⏭ [排程略過] {job_desc}：{exc}")
+            elif exc is not None:
+                log_error(f"❌ [排程失敗] {job_desc}：{exc}")
+            else:
+                log_info(f"✅ [排程完成] {job_desc} MID:{future.result()}")
+
+        try:
+            log_info(f"📅 [排程觸發] {job_desc} → 目的地 {payload['to_addrs']}")
+            self.dispatcher.submit(payload, job_desc, lane=LANE_SCHEDULED).add_done_callback(_on_done)
+        except Exception as exc:  # noqa: BLE001
+            log_exception(exc)
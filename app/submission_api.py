@@ -0,0 +1,326 @@
+"""
+本機提交 API
+------------
+讓同一台主機上的其他服務把郵件交給 daemon 寄送，不必操作 GUI。
+以 asyncio 實作精簡的 HTTP/1.1（支援 keep-alive），可監聽 localhost 或 Unix domain socket：
+
+- POST /v1/messages      單封（JSON 物件）或批次（JSON 陣列），欄位同 send_email 參數；
+                         附件必須位於 SUBMIT_UPLOAD_DIR 內；
+                         可另帶 idempotency_key，同一個鍵在 IDEMPOTENCY_TTL 內只寄送一次；
+                         lane 為優先順序（bulk / scheduled，預設 bulk）；interactive 保留給 GUI 的手動寄送，
+                         API 提交一律拒絕
+- GET  /v1/messages/<id> 查詢單封狀態：queued / sending / sent / failed
+- GET  /v1/status        佇列與寄送統計
+
+佇列空間不足以容納整個請求時回傳 429 與 Retry-After（背壓），用戶端應稍後重送整批。
+
+每個請求都需附上 SUBMIT_TOKEN 的 Bearer token（未設定 token 時不啟動）；POST 內容必須是
+Content-Type: application/json，帶有 Origin 標頭的請求（瀏覽器跨站請求）一律拒絕。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from app import config
+from app.dispatcher import LANE_BULK, LANE_SCHEDULED, SendDispatcher
+from app.log_service import log_error, log_info
+
+# 單一請求內容上限，避免異常用戶端占用記憶體
+MAX_BODY_BYTES = 32 * 1024 * 1024
+# 保留可查詢狀態的提交數量（超過時淘汰最舊的紀錄）
+MAX_TRACKED = 100_000
+
+_REASONS = {
+    200: "OK",
+    202: "Accepted",
+    400: "Bad Request",
+    401: "Unauthorized",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    415: "Unsupported Media Type",
+    429: "Too Many Requests",
+    503: "Service Unavailable",
+}
+
+_LIST_FIELDS = ("to_addrs", "cc", "bcc", "attachments")
+# API 可使用的優先順序；interactive 有保留連線且不受佇列上限限制，只給 GUI 的手動寄送
+_API_LANES = (LANE_BULK, LANE_SCHEDULED)
+
+
+def _resolve_attachment(path: str) -> str:
+    """把附件路徑解析為 SUBMIT_UPLOAD_DIR 內的實際路徑，目錄外（含符號連結指向外部）的路徑一律拒絕。"""
+    if not config.SUBMIT_UPLOAD_DIR:
+        raise ValueError("未設定 SUBMIT_UPLOAD_DIR，不接受附件")
+    root = os.path.realpath(config.SUBMIT_UPLOAD_DIR)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root or not os.path.isfile(resolved):
+        raise ValueError(f"附件必須是 SUBMIT_UPLOAD_DIR 內的檔案：{path}")
+    return resolved
+
+
+def _validate(item) -> dict:
+    """檢查一筆提交內容並轉成 dispatcher 使用的 payload。"""
+    if not isinstance(item, dict):
+        raise ValueError("每筆郵件必須是 JSON 物件")
+    payload = {}
+    for key in _LIST_FIELDS:
+        value = item.get(key)
+        if value is None:
+            continue
+        if isinstance(value, str):
+            value = [value]
+        if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+            raise ValueError(f"{key} 必須是字串或字串陣列")
+        payload[key] = value
+    if not (payload.get("to_addrs") or payload.get("cc") or payload.get("bcc")):
+        raise ValueError("至少需要一個收件者（to_addrs / cc / bcc）")
+    for key in ("subject", "body"):
+        if not isinstance(item.get(key, ""), str):
+            raise ValueError(f"{key} 必須是字串")
+        payload[key] = item.get(key, "")
+    payload.setdefault("to_addrs", [])
+    payload["attachments"] = [_resolve_attachment(path) for path in payload.get("attachments", [])]
+    if "as_html" in item:
+        payload["as_html"] = bool(item["as_html"])
+    if item.get("reply_to") is not None:
+        if not isinstance(item["reply_to"], str):
+            raise ValueError("reply_to 必須是字串")
+        payload["reply_to"] = item["reply_to"]
+    if item.get("idempotency_key") is not None:
+        key = item["idempotency_key"]
+        if not isinstance(key, str) or not key or any(c in key for c in "\t\r\n"):
+            raise ValueError("idempotency_key 必須是不含 tab 與換行的非空字串")
+        # 加上前綴避免與排程、手動寄送的鍵重疊
+        payload["idempotency_key"] = f"api:{key}"
+    lane = item.get("lane", LANE_BULK)
+    if lane not in _API_LANES:
+        raise ValueError(f"lane 必須是 {' / '.join(_API_LANES)} 其中之一")
+    payload["lane"] = lane
+    return payload
+
+
+def _parse_body(body: bytes) -> list:
+    """解析 JSON 物件或陣列，統一回傳清單。"""
+    data = json.loads(body)
+    return data if isinstance(data, list) else [data]
+
+
+def _future_state(future: Future) -> dict:
+    if not future.done():
+        return {"state": "sending" if future.running() else "queued"}
+    exc = future.exception()
+    if exc is not None:
+        return {"state": "failed", "error": str(exc)}
+    return {"state": "sent", "message_id": future.result()}
+
+
+class SubmissionServer:
+    """在獨立執行緒的 event loop 上提供提交 API，郵件交由 SendDispatcher 寄送。"""
+
+    def __init__(self, dispatcher: SendDispatcher):
+        self.dispatcher = dispatcher
+        self._tracked: OrderedDict[str, Future] = OrderedDict()
+        self._ids = itertools.count(1)
+        self._id_prefix = secrets.token_hex(4)
+        self._accepted = 0
+        self._rejected = 0
+        self._started_at = time.time()
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="submission-api", daemon=True)
+        self._server: asyncio.AbstractServer | None = None
+
+    # -- 生命週期 ---------------------------------------------------------
+    def start(self) -> None:
+        if not config.SUBMIT_TOKEN:
+            log_error("提交 API 未啟動：必須設定 SUBMIT_TOKEN")
+            return
+        self._thread.start()
+        self._ready.wait()
+
+    def close(self) -> None:
+        if self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread.is_alive():
+            self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        if config.SUBMIT_SOCKET:
+            if os.path.exists(config.SUBMIT_SOCKET):
+                os.unlink(config.SUBMIT_SOCKET)
+            server = asyncio.start_unix_server(self._handle, path=config.SUBMIT_SOCKET, limit=65536)
+            where = config.SUBMIT_SOCKET
+        else:
+            server = asyncio.start_server(self._handle, config.SUBMIT_HOST, config.SUBMIT_PORT, limit=65536)
+            where = f"{config.SUBMIT_HOST}:{config.SUBMIT_PORT}"
+        try:
+            self._server = self._loop.run_until_complete(server)
+        except OSError as exc:
+            log_error(f"提交 API 無法啟動：{exc}")
+            self._ready.set()
+            return
+        if config.SUBMIT_SOCKET:
+            os.chmod(config.SUBMIT_SOCKET, 0o600)
+        log_info(f"📮 提交 API 監聽於 {where}")
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            # 關閉監聽並結束仍在等待中的連線，再釋放 event loop
+            self._server.close()
+            pending = asyncio.all_tasks(self._loop)
+            for task in pending:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self._loop.close()
+
+    # -- HTTP -------------------------------------------------------------
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    return
+                except asyncio.LimitOverrunError:
+                    writer.write(self._response(413, {"error": "標頭過大"}, keep_alive=False))
+                    return
+                lines = head[:-4].decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    writer.write(self._response(400, {"error": "無效的請求列"}, keep_alive=False))
+                    return
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                if "transfer-encoding" in headers:
+                    writer.write(self._response(411, {"error": "請使用 Content-Length"}, keep_alive=False))
+                    return
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    writer.write(self._response(400, {"error": "無效的 Content-Length"}, keep_alive=False))
+                    return
+                if length > MAX_BODY_BYTES:
+                    writer.write(self._response(413, {"error": "內容過大"}, keep_alive=False))
+                    return
+                body = await reader.readexactly(length) if length else b""
+
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                status, data, extra = self._route(method, target, headers, body)
+                writer.write(self._response(status, data, keep_alive=keep_alive, extra=extra))
+                # 僅在輸出緩衝累積時等待，避免每個請求都切換協程
+                if writer.transport.get_write_buffer_size() > 1 << 20:
+                    await writer.drain()
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            try:
+                await writer.drain()
+            except (ConnectionError, asyncio.CancelledError):
+                pass
+            writer.close()
+
+    @staticmethod
+    def _response(status: int, data: dict, *, keep_alive: bool, extra: dict | None = None) -> bytes:
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        head = [
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}",
+            "Content-Type: application/json; charset=utf-8",
+            f"Content-Length: {len(body)}",
+            "Connection: keep-alive" if keep_alive else "Connection: close",
+        ]
+        for name, value in (extra or {}).items():
+            head.append(f"{name}: {value}")
+        return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body
+
+    def _route(self, method: str, target: str, headers: dict, body: bytes) -> tuple[int, dict, dict | None]:
+        # 瀏覽器送出的跨站請求一定帶有 Origin，本機服務不會帶
+        if "origin" in headers:
+            return 403, {"error": "不接受瀏覽器跨站請求"}, None
+        expected = f"Bearer {config.SUBMIT_TOKEN}".encode()
+        if not config.SUBMIT_TOKEN or not secrets.compare_digest(headers.get("authorization", "").encode(), expected):
+            return 401, {"error": "未授權"}, None
+        path = target.split("?", 1)[0]
+        if path == "/v1/messages":
+            if method != "POST":
+                return 405, {"error": "僅支援 POST"}, {"Allow": "POST"}
+            return self._submit(body, headers.get("content-type", ""))
+        if path.startswith("/v1/messages/"):
+            future = self._tracked.get(path.rsplit("/", 1)[1])
+            if future is None:
+                return 404, {"error": "查無此提交或紀錄已淘汰"}, None
+            return 200, _future_state(future), None
+        if path == "/v1/status":
+            return 200, self.status(), None
+        return 404, {"error": "未知的路徑"}, None
+
+    # -- 提交 -------------------------------------------------------------
+    def _submit(self, body: bytes, content_type: str) -> tuple[int, dict, dict | None]:
+        if content_type.split(";", 1)[0].strip().lower() != "application/json":
+            return 415, {"error": "Content-Type 必須是 application/json"}, None
+        try:
+            items = _parse_body(body)
+            payloads = [_validate(item) for item in items]
+        except (ValueError, json.JSONDecodeError) as exc:
+            return 400, {"error": str(exc)}, None
+        if not payloads:
+            return 400, {"error": "沒有任何郵件"}, None
+
+        # 整批無法放入佇列時直接拒絕，讓用戶端整批重送
+        if self.dispatcher.free_capacity() < len(payloads):
+            self._rejected += len(payloads)
+            return 429, {"error": "佇列已滿，請稍後重送", "retry_after": 1}, {"Retry-After": "1"}
+
+        ids = []
+        for payload in payloads:
+            sid = f"{self._id_prefix}-{next(self._ids)}"
+            try:
+                lane = payload.pop("lane")
+                future = self.dispatcher.submit(payload, f"API {sid}", lane=lane, block=False)
+            except queue.Full:
+                # 與排程同時寫入佇列時的少見競爭：回報已接受的部分
+                self._rejected += len(payloads) - len(ids)
+                return 429, {"error": "佇列已滿", "ids": ids, "retry_after": 1}, {"Retry-After": "1"}
+            except RuntimeError as exc:
+                return 503, {"error": str(exc), "ids": ids}, None
+            self._track(sid, future)
+            ids.append(sid)
+        self._accepted += len(ids)
+        return 202, {"accepted": len(ids), "ids": ids}, None
+
+    def _track(self, sid: str, future: Future) -> None:
+        self._tracked[sid] = future
+        if len(self._tracked) > MAX_TRACKED:
+            self._tracked.popitem(last=False)
+
+    def status(self) -> dict:
+        """提交 API 與 dispatcher 的統計資料。"""
+
+        return {
+            "uptime": round(time.time() - self._started_at, 1),
+            "accepted": self._accepted,
+            "rejected": self._rejected,
+            "dispatcher": self.dispatcher.stats(),
+        }
@@ -0,0 +1,369 @@
+"""
+停止寄送名單
+------------
+記錄硬退信與取消訂閱的位址，寄信前（RCPT 之前）先行排除：
+- 主檔為可 mmap 的精簡格式：Bloom filter 在前，後接排序後的位址索引，
+  絕大多數未列入的位址只需檢查幾個位元即可判定，百萬筆名單也只需讀取少量頁面
+- 新增的位址先附加到日誌檔（.journal）並保存在記憶體中，compact() 時才合併進主檔
+- 寄送時被伺服器以信箱層級的永久錯誤（550 / 551 / 553，或 5.1.x / 5.2.1）拒絕的收件者會自動加入名單
+- 支援批次匯入 / 匯出（見 app/suppression_cli.py）；其他行程替換主檔或寫入日誌後，
+  執行中的 GUI / daemon 依檔案的 inode、修改時間與大小偵測變更並重新載入
+- 附加日誌與 compact() 都在跨行程鎖（同名 .lock 檔）內進行，compact() 在鎖內重新讀取主檔與日誌，
+  不會遺失其他行程剛加入的位址
+
+主檔格式（小端序）：
+    header   MAGIC(8) | count(u64) | bloom_bits(u64) | hashes(u32) | reserved(u32)
+    bloom    bloom_bits / 8 位元組
+    offsets  count 個 u64，第 i 個為第 i 小位址在 strings 區段內的起點
+    strings  排序後的位址，以 \\n 分隔
+"""
+
+from __future__ import annotations
+
+import hashlib
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from app import config
+from app.file_lock import FileLock
+from app.log_service import log_error, log_info
+
+MAGIC = b"SMGSUP1\0"
+_HEADER = struct.Struct("<8sQQII")
+_OFFSET = struct.Struct("<Q")
+# Bloom filter 目標誤判率；誤判只會多一次精確索引查詢，不會誤擋位址
+FALSE_POSITIVE_RATE = 0.01
+# 檢查主檔與日誌是否被其他行程更新的最短間隔（秒）
+RELOAD_INTERVAL = 1.0
+# 代表收件者信箱不存在或停用的 SMTP 回覆；5.7.x（政策、驗證）與 530 / 535 等不在此列
+_MAILBOX_CODES = (550, 551, 553)
+_ENHANCED_RE = re.compile(r"^\s*([245])\.(\d{1,3})\.(\d{1,3})\b")
+
+
+def normalize(addr: str) -> Optional[str]:
+    """名單比對用的鍵：去除空白與角括號後整個位址轉小寫，不像位址時回傳 None。"""
+    addr = addr.strip().strip("<>").strip().lower()
+    local, sep, domain = addr.rpartition("@")
+    if not sep or not local or not domain:
+        return None
+    return addr
+
+
+def is_mailbox_failure(code: int, resp: str) -> bool:
+    """
+    是否為收件者信箱層級的永久失敗：代碼為 550 / 551 / 553，且附帶的增強狀態碼（若有）
+    為 5.1.x（5.1.7 / 5.1.8 為寄件者位址問題除外）或 5.2.1（信箱停用）。
+    """
+    if code not in _MAILBOX_CODES:
+        return False
+    m = _ENHANCED_RE.match(resp)
+    if m is None:
+        return True
+    cls, subject, detail = m.groups()
+    if cls != "5":
+        return False
+    if subject == "1":
+        return detail not in ("7", "8")
+    return subject == "2" and detail == "1"
+
+
+def _file_id(path: Path) -> Optional[tuple[int, int, int]]:
+    """檔案的 (inode, 修改時間, 大小)，不存在時回傳 None。"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _bloom_positions(key: bytes, bits: int, hashes: int) -> Iterator[int]:
+    """以 blake2b 的兩段 64 位元值做雙重雜湊，產生 hashes 個位元位置。"""
+    digest = hashlib.blake2b(key, digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], "little")
+    h2 = int.from_bytes(digest[8:], "little") | 1
+    for i in range(hashes):
+        yield (h1 + i * h2) % bits
+
+
+def _bloom_size(count: int) -> tuple[int, int]:
+    """依筆數與目標誤判率計算 (位元數, 雜湊數)，位元數取 8 的倍數。"""
+    count = max(count, 1)
+    bits = math.ceil(-count * math.log(FALSE_POSITIVE_RATE) / (math.log(2) ** 2))
+    bits = max(64, (bits + 7) // 8 * 8)
+    hashes = max(1, round(bits / count * math.log(2)))
+    return bits, hashes
+
+
+def write_file(path: Path, addresses: Iterable[str]) -> int:
+    """將位址寫成主檔格式（先寫暫存檔再取代），回傳寫入筆數。"""
+    keys = sorted({k.encode("utf-8") for k in addresses})
+    bits, hashes = _bloom_size(len(keys))
+    bloom = bytearray(bits // 8)
+    offsets = bytearray()
+    pos = 0
+    for key in keys:
+        for bit in _bloom_positions(key, bits, hashes):
+            bloom[bit >> 3] |= 1 << (bit & 7)
+        offsets += _OFFSET.pack(pos)
+        pos += len(key) + 1
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(keys), bits, hashes, 0))
+        f.write(bloom)
+        f.write(offsets)
+        for key in keys:
+            f.write(key + b"\n")
+    os.replace(tmp, path)
+    return len(keys)
+
+
+class _MappedIndex:
+    """以 mmap 唯讀開啟的主檔。"""
+
+    def __init__(self, path: Path):
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # 空檔案無法 mmap
+            self._file.close()
+            raise ValueError(f"停止寄送名單檔案格式錯誤：{path}") from None
+        magic, self.count, self.bits, self.hashes, _ = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"停止寄送名單檔案格式錯誤：{path}")
+        self._bloom_at = _HEADER.size
+        self._offsets_at = self._bloom_at + self.bits // 8
+        self._strings_at = self._offsets_at + self.count * _OFFSET.size
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
+
+    def _key(self, i: int) -> bytes:
+        start = self._strings_at + _OFFSET.unpack_from(self._map, self._offsets_at + i * _OFFSET.size)[0]
+        return self._map[start : self._map.find(b"\n", start)]
+
+    def __contains__(self, key: bytes) -> bool:
+        if not self.count:
+            return False
+        data, base = self._map, self._bloom_at
+        for bit in _bloom_positions(key, self.bits, self.hashes):
+            if not data[base + (bit >> 3)] & (1 << (bit & 7)):
+                return False
+        # Bloom filter 可能誤判，以排序索引二分搜尋確認
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo < self.count and self._key(lo) == key
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self.count):
+            yield self._key(i).decode("utf-8")
+
+
+class SuppressionList:
+    """主檔 + 附加日誌組成的停止寄送名單，可跨執行緒共用。"""
+
+    def __init__(self, path: Path | str):
+        self.path = Path(path)
+        self.journal_path = self.path.with_name(self.path.name + ".journal")
+        # compact() 與重新載入會替換主檔，查詢時需與其互斥
+        self._lock = threading.RLock()
+        # 其他行程附加日誌與 compact() 之間的互斥
+        self._file_lock = FileLock(self.path.with_name(self.path.name + ".lock"))
+        self._index: Optional[_MappedIndex] = None
+        self._index_id: Optional[tuple[int, int, int]] = None
+        self._added: dict[str, str] = {}
+        self._journal_ino: Optional[int] = None
+        self._journal_pos = 0
+        self._load_index()
+        self._load_journal(reset=True)
+        self._checked_at = time.monotonic()
+
+    def _load_index(self) -> None:
+        """開啟（或重新開啟）主檔；新檔開啟成功後才關閉舊的對應。"""
+        index_id = _file_id(self.path)
+        index = _MappedIndex(self.path) if index_id is not None else None
+        if self._index is not None:
+            self._index.close()
+        self._index, self._index_id = index, index_id
+
+    def _load_journal(self, *, reset: bool) -> None:
+        """讀取日誌；reset 為 False 時只讀取上次位置之後附加的部分。"""
+        added = {} if reset else self._added
+        pos = 0 if reset else self._journal_pos
+        ino = None
+        try:
+            with open(self.journal_path, "rb") as f:
+                ino = os.fstat(f.fileno()).st_ino
+                f.seek(pos)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # 寫入中的半行，下次再讀
+                    pos += len(line)
+                    addr, _, reason = line.decode("utf-8").rstrip("\n").partition("\t")
+                    if addr:
+                        added[addr] = reason.partition("\t")[2]
+        except FileNotFoundError:
+            pos = 0
+        # 整份重新讀取時換成新的 dict，查詢端不會看到清空到一半的內容
+        self._added, self._journal_ino, self._journal_pos = added, ino, pos
+
+    def _refresh(self) -> None:
+        """其他行程（例如 suppression_cli 的 import / add / compact）更新檔案後重新載入。"""
+        now = time.monotonic()
+        if now - self._checked_at < RELOAD_INTERVAL:
+            return
+        with self._lock:
+            self._checked_at = now
+            if _file_id(self.path) != self._index_id:
+                try:
+                    self._load_index()
+                except (OSError, ValueError) as exc:
+                    log_error(f"無法重新載入停止寄送名單：{exc}")
+                    return
+                self._load_journal(reset=True)
+                log_info(f"🔄 已重新載入停止寄送名單（{len(self):,} 筆）")
+                return
+            journal_id = _file_id(self.journal_path)
+            if journal_id is None:
+                if self._journal_ino is not None:
+                    self._load_journal(reset=True)
+            elif journal_id[0] != self._journal_ino or journal_id[2] < self._journal_pos:
+                self._load_journal(reset=True)
+            elif journal_id[2] > self._journal_pos:
+                self._load_journal(reset=False)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._index is not None:
+                self._index.close()
+                self._index = None
+                self._index_id = None
+
+    # -- 查詢 -------------------------------------------------------------
+    def __contains__(self, addr: str) -> bool:
+        key = normalize(addr)
+        if key is None:
+            return False
+        self._refresh()
+        if key in self._added:
+            return True
+        with self._lock:
+            return self._index is not None and key.encode("utf-8") in self._index
+
+    def __len__(self) -> int:
+        """筆數（主檔與日誌可能重複，compact 後才精確）。"""
+        self._refresh()
+        return (self._index.count if self._index else 0) + len(self._added)
+
+    def filter(self, recipients: Iterable[str]) -> tuple[list[str], list[str]]:
+        """將收件者分成 (可寄送, 已列入名單) 兩組，維持原本順序。"""
+        allowed, suppressed = [], []
+        for addr in recipients:
+            (suppressed if addr in self else allowed).append(addr)
+        return allowed, suppressed
+
+    def __iter__(self) -> Iterator[str]:
+        """列出所有位址（已去重；主檔依排序在前，日誌新增的在後）。"""
+        self._refresh()
+        seen = set(self._added)
+        if self._index is not None:
+            for addr in self._index:
+                if addr not in seen:
+                    yield addr
+        yield from sorted(self._added)
+
+    # -- 新增與維護 -------------------------------------------------------
+    def add(self, addresses: Iterable[str], reason: str = "") -> int:
+        """加入位址並寫入日誌，回傳實際新增的筆數。"""
+        reason = " ".join(reason.split())
+        now = int(time.time())
+        lines = []
+        with self._lock:
+            for addr in addresses:
+                key = normalize(addr)
+                if key is None or key in self:
+                    continue
+                self._added[key] = reason
+                lines.append(f"{key}\t{now}\t{reason}\n")
+            if lines:
+                self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+                with self._file_lock, open(self.journal_path, "a", encoding="utf-8") as f:
+                    f.writelines(lines)
+        return len(lines)
+
+    def add_refused(self, refused: dict) -> list[str]:
+        """
+        依 SMTPRecipientsRefused.recipients 或 sendmail 回傳的拒絕清單
+        （{位址: (代碼, 訊息)}）加入信箱層級永久失敗（見 is_mailbox_failure）的位址，回傳加入的位址。
+        政策或驗證造成的拒絕（5.7.x、530、535 等）與收件者本身無關，不會加入。
+        """
+        added = []
+        for addr, (code, resp) in refused.items():
+            if isinstance(resp, bytes):
+                resp = resp.decode("utf-8", "replace")
+            if is_mailbox_failure(code, resp) and self.add([addr], f"{code} {resp}"):
+                added.append(addr)
+        if added:
+            log_info(f"🚫 已加入停止寄送名單：{', '.join(added)}")
+        return added
+
+    def compact(self, extra: Iterable[str] = ()) -> int:
+        """
+        將日誌合併進主檔並清空日誌，回傳主檔筆數。
+        extra 為批次匯入的位址，直接寫入主檔而不經過日誌。
+        """
+        with self._lock, self._file_lock:
+            # 在鎖內從磁碟重新讀取，納入其他行程剛替換的主檔或附加的日誌
+            self._load_index()
+            self._load_journal(reset=True)
+            addresses = set(self._added)
+            if self._index is not None:
+                addresses.update(self._index)
+            addresses.update(k for k in map(normalize, extra) if k)
+            # Windows 無法取代仍在 mmap 中的檔案，先關閉再寫入
+            self.close()
+            count = write_file(self.path, addresses)
+            self.journal_path.unlink(missing_ok=True)
+            self._load_index()
+            self._load_journal(reset=True)
+            self._checked_at = time.monotonic()
+        return count
+
+
+# ----------------------------------------------------------
+# 共用實例：第一次使用時才開啟檔案
+# ----------------------------------------------------------
+_shared: Optional[SuppressionList] = None
+_shared_lock = threading.Lock()
+
+
+def get_suppression_list() -> Optional[SuppressionList]:
+    """回傳依 SUPPRESSION_FILE 開啟的共用名單；未設定或無法開啟時回傳 None（不排除任何位址）。"""
+    global _shared
+    if not config.SUPPRESSION_FILE:
+        return None
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                try:
+                    _shared = SuppressionList(config.SUPPRESSION_FILE)
+                except (OSError, ValueError) as exc:
+                    log_error(f"無法開啟停止寄送名單：{exc}")
+                    return None
+    return _shared
@@ -0,0 +1,112 @@
+"""
+停止寄送名單命令列
+------------------
+    python -m app.suppression_cli import bounces.csv --reason "hard bounce"
+    python -m app.suppression_cli export > suppression.txt
+    python -m app.suppression_cli add someone@example.com --reason unsubscribe
+    python -m app.suppression_cli check someone@example.com
+    python -m app.suppression_cli compact
+
+匯入檔為每行一個位址，或 CSV（取第一欄）；以 # 開頭的行會被略過。
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import sys
+from pathlib import Path
+from typing import Iterator
+
+from app import config
+from app.suppression import SuppressionList
+
+
+def _read_addresses(path: str) -> Iterator[str]:
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8-sig", newline="")
+    try:
+        for row in csv.reader(f):
+            if row and row[0].strip() and not row[0].lstrip().startswith("#"):
+                yield row[0]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def _cmd_import(suppression: SuppressionList, args) -> None:
+    before = len(suppression)
+    addresses = (addr for path in args.files for addr in _read_addresses(path))
+    if args.reason:
+        # 需保留原因時經由日誌新增，再合併進主檔
+        suppression.add(addresses, args.reason)
+        count = suppression.compact()
+    else:
+        count = suppression.compact(addresses)
+    print(f"名單共 {count:,} 筆（新增 {max(0, count - before):,} 筆）")
+
+
+def _cmd_export(suppression: SuppressionList, args) -> None:
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        for addr in suppression:
+            out.write(addr + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+def _cmd_add(suppression: SuppressionList, args) -> None:
+    print(f"新增 {suppression.add(args.addresses, args.reason)} 筆")
+
+
+def _cmd_check(suppression: SuppressionList, args) -> None:
+    listed = False
+    for addr in args.addresses:
+        hit = addr in suppression
+        listed |= hit
+        print(f"{addr}\t{'已列入' if hit else '未列入'}")
+    sys.exit(1 if listed else 0)
+
+
+def _cmd_compact(suppression: SuppressionList, args) -> None:
+    print(f"名單共 {suppression.compact():,} 筆")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.suppression_cli", description="SimpleMailGUI 停止寄送名單")
+    parser.add_argument("--file", type=Path, default=config.SUPPRESSION_FILE, help="名單主檔（預設為 SUPPRESSION_FILE）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("import", help="批次匯入位址（文字檔或 CSV，- 代表標準輸入）")
+    p.add_argument("files", nargs="+")
+    p.add_argument("--reason", default="", help="記錄匯入原因（較慢，經由日誌寫入）")
+    p.set_defaults(func=_cmd_import)
+
+    p = sub.add_parser("export", help="匯出所有位址，每行一個")
+    p.add_argument("-o", "--output", default="-")
+    p.set_defaults(func=_cmd_export)
+
+    p = sub.add_parser("add", help="新增位址")
+    p.add_argument("addresses", nargs="+")
+    p.add_argument("--reason", default="manual")
+    p.set_defaults(func=_cmd_add)
+
+    p = sub.add_parser("check", help="查詢位址是否已列入（任一列入時結束碼為 1）")
+    p.add_argument("addresses", nargs="+")
+    p.set_defaults(func=_cmd_check)
+
+    p = sub.add_parser("compact", help="將新增日誌合併進主檔")
+    p.set_defaults(func=_cmd_compact)
+
+    args = parser.parse_args(argv)
+    if not args.file:
+        parser.error("未設定 SUPPRESSION_FILE，請以 --file 指定名單檔案")
+    suppression = SuppressionList(args.file)
+    try:
+        args.func(suppression, args)
+    finally:
+        suppression.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""寄件備份效能測試：模擬每日排程重複寄出相同附件，量測占用空間、每封備份時間與還原正確性。
+
+每封郵件的主旨與內文不同，附件（隨機位元組與文字檔）相同；全部還原後逐位元組比對原文。
+
+執行方式：
+    uv run python -m benchmarks.bench_archive [郵件數量]
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from app import config
+from app.archive import SentArchive
+from app.mail_service import _flatten, prepare_email
+
+
+def main(n: int = 200) -> None:
+    logging.disable(logging.WARNING)
+    config.SMTP_SERVER, config.SMTP_PORT = "localhost", 25
+    config.SMTP_USER, config.SMTP_PASS = "bench@example.com", "bench"
+    config.SUPPRESSION_FILE = ""
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        report = Path(tmp) / "report.pdf"
+        report.write_bytes(os.urandom(2 * 1024 * 1024))
+        sheet = Path(tmp) / "sheet.csv"
+        sheet.write_text("".join(f"{i},{rng.random():.6f},{rng.choice('ABC')}\n" for i in range(40_000)))
+        archive = SentArchive(Path(tmp) / "archive.sqlite")
+
+        messages, timings = [], []
+        for i in range(n):
+            msg, _ = prepare_email(
+                [f"team{i % 7}@example.com"],
+                f"Daily report #{i}",
+                f"Hi,\n\nReport {i} attached.\n" * 20,
+                as_html=i % 2 == 1,
+                attachments=[str(report), str(sheet)],
+            )
+            data = _flatten(msg)
+            start = time.perf_counter()
+            archive.store(data, message_id=msg["Message-ID"], recipients=[f"team{i % 7}@example.com"])
+            timings.append(time.perf_counter() - start)
+            messages.append((msg["Message-ID"], data))
+
+        start = time.perf_counter()
+        mismatches = sum(1 for mid, data in messages if archive.get(mid) != data)
+        rebuild_time = (time.perf_counter() - start) / n
+
+        s = archive.stats()
+        print(f"{n:,} 封郵件：原始 {s['raw_bytes'] / 1e6:,.1f} MB → 備份 {s['stored_bytes'] / 1e6:,.2f} MB（片段 {s['blobs']:,} 個）")
+        print(
+            f"備份：第一封 {timings[0] * 1000:.0f} ms、之後 p50 {statistics.median(timings[1:]) * 1000:.1f} ms；"
+            f"還原平均 {rebuild_time * 1000:.1f} ms"
+        )
+        archive.close()
+        if mismatches:
+            sys.exit(f"❌ {mismatches} 封還原後與原文不同")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
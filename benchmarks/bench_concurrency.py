@@ -0,0 +1,75 @@
+"""自適應連線數效能測試：對會過載的本機 SMTP 接收端寄出大量郵件，比較固定連線數與 AIMD 調整。
+
+接收端同時連線超過 capacity 時每封延遲依比例增加，超過 max_connections 時以 421 拒絕連線；
+固定使用 SMTP_MAX_SESSIONS 條連線時會持續觸發 421 而寄送失敗，自適應上限應收斂在 capacity 附近。
+
+執行方式：
+    uv run python -m benchmarks.bench_concurrency [郵件數量]
+"""
+
+from __future__ import annotations
+
+import logging
+import sys
+import time
+from concurrent.futures import wait
+
+from app import config
+from app.dispatcher import SendDispatcher
+from benchmarks.smtp_sink import SMTPSink
+
+_PAYLOAD = {"subject": "concurrency test", "body": "hello", "attachments": []}
+
+
+def _run(n: int, *, adaptive: bool, sessions: int, capacity: int, max_connections: int) -> dict:
+    sink = SMTPSink(latency=0.01, capacity=capacity, max_connections=max_connections).start()
+    config.SMTP_SERVER, config.SMTP_PORT = sink.host, sink.port
+    dispatcher = SendDispatcher(
+        window=0, max_per_session=10, max_sessions=sessions, max_queue=0, interactive_sessions=0, adaptive=adaptive
+    )
+    try:
+        start = time.perf_counter()
+        futures = [dispatcher.submit({**_PAYLOAD, "to_addrs": [f"user{i}@example.com"]}, "bulk") for i in range(n)]
+        wait(futures)
+        elapsed = time.perf_counter() - start
+        stats = dispatcher.stats()
+    finally:
+        dispatcher.shutdown()
+        sink.close()
+    return {
+        "elapsed": elapsed,
+        "sent": stats["sent"],
+        "failed": stats["failed"],
+        "rejected": sink.stats.rejected,
+        "peak": sink.stats.peak_active,
+        "concurrency": stats["concurrency"],
+    }
+
+
+def main(n: int = 3000) -> None:
+    # 預期會有大量 421 錯誤紀錄，測試期間全部關閉
+    logging.disable(logging.CRITICAL)
+    config.SMTP_SECURITY = "NONE"
+    config.SMTP_USER, config.SMTP_PASS = "loadtest@example.com", "loadtest"
+    config.SUPPRESSION_FILE = ""
+    config.IDEMPOTENCY_FILE = ""
+    config.ARCHIVE_FILE = ""
+    config.DKIM_SELECTOR = ""
+    results = {}
+    for adaptive in (False, True):
+        r = results[adaptive] = _run(n, adaptive=adaptive, sessions=16, capacity=4, max_connections=6)
+        label = "自適應（AIMD）" if adaptive else "固定 16 條連線"
+        print(
+            f"{label}：{r['sent']:,} 封成功、{r['failed']:,} 封失敗，{r['elapsed']:.1f} 秒"
+            f"（{r['sent'] / r['elapsed']:,.0f} 封/秒），421 拒絕 {r['rejected']:,} 次，連線峰值 {r['peak']}"
+        )
+        if adaptive:
+            c = r["concurrency"]
+            changes = " → ".join(f"{h['limit']}" for h in c["history"][-20:])
+            print(f"  最近 20 次上限變化：{changes}（基準延遲 {c['baseline_ms']} ms）")
+    if results[True]["failed"] > results[False]["failed"]:
+        sys.exit("❌ 自適應上限的失敗數比固定連線數多")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3000)
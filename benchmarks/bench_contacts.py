@@ -0,0 +1,81 @@
+"""收件者自動完成效能測試：以合成通訊錄量測索引建立時間與每次按鍵的查詢延遲。
+
+模擬逐字輸入既有聯絡人的位址或名字，每個前綴查詢一次，並以完整掃描驗證排序結果。
+
+執行方式：
+    uv run python -m benchmarks.bench_contacts [聯絡人數量]
+"""
+
+from __future__ import annotations
+
+import heapq
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from app.contacts import ContactBook, _keys, _normalize_prefix, _rank_key
+
+_FIRST = ["jane", "john", "mary", "michael", "li", "wei", "anna", "david", "chen", "maria", "james", "yuki", "omar"]
+_LAST = ["doe", "smith", "wang", "lee", "garcia", "chan", "tanaka", "brown", "khan", "lopez", "huang", "miller"]
+_DOMAINS = ["example.com", "example.org", "corp.example", "mail.example.net", "partner.example"]
+
+
+def _build_book(n: int, path: Path) -> tuple[ContactBook, float]:
+    rng = random.Random(42)
+    book = ContactBook(path)
+    now = time.time()
+    entries = []
+    for i in range(n):
+        first, last = rng.choice(_FIRST), rng.choice(_LAST)
+        entries.append((f"{first.title()} {last.title()}", f"{first}.{last}{i}@{rng.choice(_DOMAINS)}"))
+    book.add(entries)
+    # 部分聯絡人有寄送紀錄：少數常用、多數偶爾
+    for _ in range(n):
+        name, addr = entries[int(rng.paretovariate(1.2)) % n]
+        book.record([f"{name} <{addr}>"], now - rng.random() * 365 * 86400)
+    start = time.perf_counter()
+    reloaded = ContactBook(path)
+    reloaded.load()
+    return reloaded, time.perf_counter() - start
+
+
+def _expected(keyed: list, prefix: str, limit: int) -> list[str]:
+    prefix = _normalize_prefix(prefix)
+    found = [c for c, keys in keyed if any(k.startswith(prefix) for k in keys)]
+    return [c.address for c in heapq.nlargest(limit, found, key=_rank_key)]
+
+
+def main(n: int = 50_000) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        book, load_time = _build_book(n, Path(tmp) / "contacts.tsv")
+        print(f"{len(book):,} 位聯絡人：背景載入與建立索引 {load_time * 1000:.0f} ms")
+
+        rng = random.Random(7)
+        contacts = list(book)
+        keyed = [(c, _keys(c)) for c in contacts]
+        targets = [c.address for c in rng.sample(contacts, 200)] + [c.name.split()[0] for c in rng.sample(contacts, 100)]
+        timings, mismatches = [], 0
+        for n_target, target in enumerate(targets):
+            for i in range(1, min(len(target), 12) + 1):
+                prefix = target[:i]
+                start = time.perf_counter()
+                found = book.suggest(prefix)
+                timings.append(time.perf_counter() - start)
+                # 完整掃描很慢，只抽查部分短前綴
+                if n_target % 10 == 0 and i <= 3 and [c.address for c in found] != _expected(keyed, prefix, len(found) or 8):
+                    mismatches += 1
+        timings.sort()
+        p50 = statistics.median(timings) * 1e6
+        p99 = timings[int(len(timings) * 0.99)] * 1e6
+        print(f"{len(timings):,} 次按鍵查詢：p50 {p50:.0f} µs、p99 {p99:.0f} µs、最大 {timings[-1] * 1e6:.0f} µs")
+        if mismatches:
+            sys.exit(f"❌ {mismatches} 個前綴的排序與完整掃描不一致")
+        if p99 > 1000:
+            sys.exit("❌ p99 超過 1 ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
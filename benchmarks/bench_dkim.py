@@ -0,0 +1,104 @@
+"""DKIM 簽章效能測試：量測小郵件與含大附件郵件的每秒簽章數，以及內文雜湊所占的時間。
+含附件的情境另量測內文雜湊快取命中時（相同附件重複寄送）的速度。
+
+未設定 DKIM_PRIVATE_KEY 時會產生一把暫時的 2048 位元 RSA 金鑰。
+若已安裝 dkimpy，會另外以其驗證簽章是否正確。
+
+執行方式：
+    uv run python -m benchmarks.bench_dkim [每種情境的簽章次數]
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+from base64 import b64encode
+from email.utils import formatdate, make_msgid
+from pathlib import Path
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from app import fast_mime
+from app.dkim_signer import DKIMSigner, load_private_key
+from app.fast_mime import Attachment
+from app.recipients import process_recipients
+
+DOMAIN = "example.com"
+SELECTOR = "bench"
+
+
+def _message(body: str, attachments=()) -> fast_mime.WireMessage:
+    rcpts = process_recipients("recipient@example.org")
+    wire = fast_mime.serialize(
+        f"sender@{DOMAIN}",
+        rcpts,
+        "Weekly report",
+        body,
+        date=formatdate(localtime=True),
+        message_id=make_msgid(domain=DOMAIN),
+        attachments=attachments,
+    )
+    return wire
+
+
+def _verify(signed: bytes, key: rsa.RSAPrivateKey) -> str:
+    try:
+        import dkim
+    except ImportError:
+        return "未安裝 dkimpy，略過外部驗證"
+    spki = key.public_key().public_bytes(serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+    record = b"v=DKIM1; k=rsa; p=" + b64encode(spki)
+    ok = dkim.verify(signed, dnsfunc=lambda name, timeout=5: record)
+    return "dkimpy 驗證通過" if ok else "❌ dkimpy 驗證失敗"
+
+
+def main(n: int = 300) -> None:
+    if os.getenv("DKIM_PRIVATE_KEY"):
+        key = load_private_key(Path(os.environ["DKIM_PRIVATE_KEY"]).read_text(encoding="ascii"))
+    else:
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    small_body = "Hello,\n\n" + "This is the weekly report. " * 60 + "\n"
+    payload = os.urandom(1 << 20)
+    # 每封附件的檔案識別都不同，模擬不同內容的郵件
+    unique = [
+        Attachment("report.bin", "application", "octet-stream", payload, (f"/uploads/report-{i}.bin", len(payload), i))
+        for i in range(max(1, n // 10))
+    ]
+    # 相同附件重複寄送（例如重複觸發的排程），只有第一封需要計算內文雜湊
+    repeated = Attachment("report.bin", "application", "octet-stream", payload, ("/uploads/report.bin", len(payload), 0))
+    scenarios = {
+        "小郵件（約 2 KB）": [_message(small_body) for _ in range(n)],
+        "含 1 MB 附件（快取未命中）": [_message(small_body, [a]) for a in unique],
+        "含 1 MB 附件（快取命中）": [_message(small_body, [repeated]) for _ in range(n)],
+    }
+    failed = False
+    for name, messages in scenarios.items():
+        signer = DKIMSigner(DOMAIN, SELECTOR, key)
+        start = time.perf_counter()
+        for wire in messages:
+            signed = signer.sign(wire.data, body_key=wire.body_key)
+        per_message = (time.perf_counter() - start) / len(messages)
+
+        # 以新的簽章器重新量測，避免沿用上面已填入的快取
+        signer = DKIMSigner(DOMAIN, SELECTOR, key)
+        bodies = [wire.data[wire.data.find(b"\r\n\r\n") + 4 :] for wire in messages]
+        start = time.perf_counter()
+        for wire, data in zip(messages, bodies):
+            signer.body_hash(data, wire.body_key)
+        body = (time.perf_counter() - start) / len(messages)
+
+        result = _verify(signed, key)
+        failed |= result.startswith("❌")
+        print(
+            f"{name}：{1 / per_message:,.0f} 封/秒（每封 {per_message * 1000:.2f} ms，"
+            f"其中內文雜湊 {body * 1000:.2f} ms）— {result}"
+        )
+    if failed:
+        sys.exit("❌ 簽章驗證失敗")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300)
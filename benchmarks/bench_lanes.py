@@ -0,0 +1,78 @@
+"""寄送優先順序效能測試：大量寄送積壓時，量測手動寄送從按下到寄出的延遲。
+
+先排入大量 bulk 郵件與部分 scheduled 郵件，再每隔一段時間提交一封手動寄送，
+比較「全部視為 bulk、沒有保留連線」與「interactive 優先順序 + 保留連線」兩種設定。
+
+執行方式：
+    uv run python -m benchmarks.bench_lanes [bulk 數量]
+"""
+
+from __future__ import annotations
+
+import logging
+import statistics
+import sys
+import time
+
+from app import config
+from app.dispatcher import LANE_BULK, LANE_INTERACTIVE, LANE_SCHEDULED, SendDispatcher
+from benchmarks.smtp_sink import SMTPSink
+
+_PAYLOAD = {"subject": "lane test", "body": "hello", "attachments": []}
+
+
+def _run(bulk: int, *, lanes: bool, probes: int = 20, interval: float = 0.1) -> tuple[list[float], dict]:
+    dispatcher = SendDispatcher(max_queue=0, interactive_sessions=1 if lanes else 0)
+    backlog = []
+    try:
+        for i in range(bulk):
+            backlog.append(dispatcher.submit({**_PAYLOAD, "to_addrs": [f"bulk{i}@example.com"]}, "bulk"))
+            if i % 10 == 0:
+                lane = LANE_SCHEDULED if lanes else LANE_BULK
+                backlog.append(
+                    dispatcher.submit({**_PAYLOAD, "to_addrs": [f"job{i}@example.com"]}, "scheduled", lane=lane)
+                )
+        latencies = []
+        for i in range(probes):
+            time.sleep(interval)
+            start = time.perf_counter()
+            lane = LANE_INTERACTIVE if lanes else LANE_BULK
+            dispatcher.submit({**_PAYLOAD, "to_addrs": [f"me{i}@example.com"]}, "手動寄送", lane=lane).result()
+            latencies.append(time.perf_counter() - start)
+        return latencies, dispatcher.stats()
+    finally:
+        # 量測完畢，取消尚未寄出的積壓郵件
+        for future in backlog:
+            future.cancel()
+        dispatcher.shutdown()
+
+
+def main(bulk: int = 3000) -> None:
+    # 避免寫入大量測試寄信紀錄
+    logging.disable(logging.WARNING)
+    sink = SMTPSink(latency=0.005).start()
+    config.SMTP_SERVER, config.SMTP_PORT, config.SMTP_SECURITY = sink.host, sink.port, "NONE"
+    config.SMTP_USER, config.SMTP_PASS = "loadtest@example.com", "loadtest"
+    config.SUPPRESSION_FILE = ""
+    config.IDEMPOTENCY_FILE = ""
+    config.ARCHIVE_FILE = ""
+    config.DKIM_SELECTOR = ""
+    try:
+        for lanes in (False, True):
+            latencies, stats = _run(bulk, lanes=lanes)
+            label = "interactive + 保留連線" if lanes else "全部為 bulk（FIFO）"
+            print(
+                f"{label}：手動寄送 p50 {statistics.median(latencies) * 1000:.0f} ms、"
+                f"最大 {max(latencies) * 1000:.0f} ms（當時積壓 {stats['queued']:,} 封）"
+            )
+            if lanes:
+                for name, lane in stats["lanes"].items():
+                    print(f"  {name:<12} 已寄 {lane['sent']:>5,}  等待 {lane['wait_ms']}  完成 {lane['latency_ms']}")
+                if max(latencies) > 2.0:
+                    sys.exit("❌ 手動寄送超過 2 秒")
+    finally:
+        sink.close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3000)
@@ -0,0 +1,54 @@
+"""收件者處理效能測試：確認十萬筆以上的 To / Cc / Bcc 可在一秒內完成解析、驗證與去重。
+
+執行方式：
+    uv run python -m benchmarks.bench_recipients [筆數]
+"""
+
+from __future__ import annotations
+
+import random
+import sys
+import time
+
+from app.recipients import process_recipients
+
+
+def _make_field(n: int, seed: int = 0) -> tuple[str, list[str], list[str]]:
+    """產生混合格式的收件者：純位址、含逗號的顯示名稱、重複與錯誤位址。"""
+    rng = random.Random(seed)
+    domains = [f"corp{i}.example.com" for i in range(200)] + ["Example.COM", "gmail.com", "例子.測試"]
+    addrs = []
+    for i in range(n):
+        addr = f"user{i}.{rng.randrange(1000)}@{rng.choice(domains)}"
+        r = rng.random()
+        if r < 0.10:
+            addrs.append(f'"Doe, Jane {i}" <{addr}>')
+        elif r < 0.15:
+            addrs.append(f"User {i} <{addr}>")
+        elif r < 0.17:
+            addrs.append(f"broken{i}@@{rng.choice(domains)}")
+        else:
+            addrs.append(addr)
+    to_raw = ", ".join(addrs[: n // 2])
+    cc = addrs[n // 2 :]
+    # 約 5% 的 Bcc 與 To / Cc 重複
+    bcc = rng.sample(addrs, n // 20)
+    return to_raw, cc, bcc
+
+
+def main(n: int = 100_000, rounds: int = 5) -> None:
+    to_raw, cc, bcc = _make_field(n)
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = process_recipients(to_raw, cc, bcc)
+        best = min(best, time.perf_counter() - start)
+    total = n + len(bcc)
+    print(f"輸入 {total} 筆 → 有效 {len(result.envelope)}、錯誤 {len(result.invalid)}、重複 {result.duplicates}")
+    print(f"最佳耗時 {best * 1000:.1f} ms（{total / best:,.0f} 筆/秒）")
+    if best >= 1.0:
+        sys.exit("❌ 超過 1 秒目標")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,163 @@
+"""快速序列化驗證與效能測試：比對 fast_mime 與 EmailMessage 的輸出，並量測每封郵件的序列化耗時。
+
+對每個樣本分別以兩種方式產生郵件，再以 email 套件解析兩份位元組，
+確認標頭、MIME 結構、內容與附件完全一致；任何不一致都會列出並以非零結束碼結束。
+
+執行方式：
+    uv run python -m benchmarks.bench_serializer [每種樣本的重複次數]
+"""
+
+from __future__ import annotations
+
+import sys
+import time
+from email import message_from_bytes, policy
+from email.utils import formatdate, make_msgid
+
+from app import fast_mime
+from app.fast_mime import Attachment
+from app.mail_service import _build_message, _flatten
+from app.recipients import process_recipients
+
+SENDER = "sender@example.com"
+_LONG_ASCII = " ".join(f"word{i}" for i in range(40))
+_PDF = bytes(range(256)) * 40
+
+# (名稱, to, cc, subject, body, as_html, reply_to, attachments)
+CORPUS = [
+    ("plain", "a@example.com", None, "Hello", "Hi there\nsecond line\n", False, None, []),
+    ("no-trailing-newline", "a@example.com", None, "Hi", "one line", False, None, []),
+    ("empty-body", "a@example.com", None, "", "", False, None, []),
+    ("crlf-body", "a@example.com", None, "CRLF", "a\r\nb\rc\n", False, None, []),
+    ("chinese", "王小明 <b@example.com>", None, "測試主旨 hello", "內文\n第二行\n", False, None, []),
+    ("long-subject", "a@example.com", None, _LONG_ASCII, "x\n", False, None, []),
+    ("long-cjk-subject", "a@example.com", None, "很長的主旨" * 20, "x\n", False, None, []),
+    ("long-lines-ascii", "a@example.com", None, "qp", "x" * 200 + "\n" + "y " * 100 + "\n", False, None, []),
+    ("long-lines-cjk", "a@example.com", None, "b64", "中文" * 100 + "\n", False, None, []),
+    ("trailing-space", "a@example.com", None, "ws", ("a " * 50) + "\t\nend\n", False, None, []),
+    ("many-recipients", ", ".join(f"user{i}@example.com" for i in range(60)), None, "bulk", "x\n", False, None, []),
+    (
+        "names",
+        '"Doe, Jane" <jane@example.com>, John <john@example.com>',
+        ["陳大文 <chan@example.com>", '"李, 四" <li@example.com>'],
+        "names",
+        "x\n",
+        False,
+        "Reply Desk <reply@example.com>",
+        [],
+    ),
+    ("idna", "a@例子.測試", None, "idna", "x\n", False, None, []),
+    ("html", "a@example.com", "c@example.com", "HTML", "<p>Hello <b>world</b></p>\n", True, None, []),
+    ("html-cjk", "a@example.com", None, "HTML 中文", "<p>你好</p>\n" * 30, True, None, []),
+    ("attachment", "a@example.com", None, "att", "see attached\n", False, None, [Attachment("report.pdf", "application", "pdf", _PDF)]),
+    (
+        "html-attachments",
+        "a@example.com",
+        None,
+        "att",
+        "<p>files</p>\n",
+        True,
+        None,
+        [
+            Attachment("a.txt", "text", "plain", b"hello\n"),
+            Attachment("image.png", "image", "png", _PDF[:1000]),
+            Attachment("x" * 90 + ".bin", "application", "octet-stream", b""),
+        ],
+    ),
+    # 以下應退回 EmailMessage
+    ("fallback-cjk-filename", "a@example.com", None, "att", "x\n", False, None, [Attachment("報告.pdf", "application", "pdf", b"1")]),
+    ("fallback-encoded-word", "a@example.com", None, "=?utf-8?q?x?=", "x\n", False, None, []),
+    ("fallback-double-space", "a@example.com", None, "a  b", "x\n", False, None, []),
+]
+
+
+def _structure(data: bytes) -> list[tuple]:
+    """將郵件解析為可比較的結構（boundary 與 Message-ID 以外的所有語意內容）。"""
+    msg = message_from_bytes(data, policy=policy.default)
+    items = []
+    for name in ("From", "To", "Cc", "Reply-To", "Subject", "Date", "Message-ID", "Bcc"):
+        value = msg.get(name)
+        items.append((name, None if value is None else str(value)))
+    for part in msg.walk():
+        entry = [part.get_content_type(), part.get_content_disposition(), part.get_filename()]
+        if not part.is_multipart():
+            entry.append(part.get_content())
+            entry.append(part.get_content_charset())
+        items.append(tuple(entry))
+        if part.defects:
+            items.append(("defects", [type(d).__name__ for d in part.defects]))
+    return items
+
+
+def _build_both(case):
+    _, to, cc, subject, body, as_html, reply_to, attachments = case
+    rcpts = process_recipients(to, cc)
+    date = formatdate(localtime=True)
+    mid = make_msgid(domain="example.com")
+    kwargs = dict(as_html=as_html, reply_to=reply_to)
+    ref = _flatten(_build_message(SENDER, rcpts, subject, body, files=attachments, date=date, message_id=mid, **kwargs))
+    wire = fast_mime.serialize(SENDER, rcpts, subject, body, date=date, message_id=mid, attachments=attachments, **kwargs)
+    return rcpts, date, mid, ref, wire
+
+
+def verify() -> int:
+    failures = 0
+    for case in CORPUS:
+        name = case[0]
+        _, _, _, ref, wire = _build_both(case)
+        if wire is None:
+            status = "退回 EmailMessage" if name.startswith("fallback") else "❌ 未預期的退回"
+            failures += not name.startswith("fallback")
+            print(f"{name:24s} {status}")
+            continue
+        if name.startswith("fallback"):
+            print(f"{name:24s} ❌ 應退回 EmailMessage")
+            failures += 1
+            continue
+        if any(len(line) > 998 for line in wire.data.split(b"\r\n")) or b"\n" in wire.data.replace(b"\r\n", b""):
+            print(f"{name:24s} ❌ 行長或換行格式錯誤")
+            failures += 1
+            continue
+        expected, actual = _structure(ref), _structure(wire.data)
+        if expected != actual:
+            failures += 1
+            print(f"{name:24s} ❌ 不一致")
+            for e, a in zip(expected, actual):
+                if e != a:
+                    print(f"    預期 {e!r}\n    實際 {a!r}")
+        else:
+            print(f"{name:24s} ✅ 一致（{len(wire.data):,} / {len(ref):,} bytes）")
+    return failures
+
+
+def bench(rounds: int) -> None:
+    for name in ("plain", "chinese", "html", "html-attachments"):
+        case = next(c for c in CORPUS if c[0] == name)
+        _, to, cc, subject, body, as_html, reply_to, attachments = case
+        rcpts = process_recipients(to, cc)
+        date = formatdate(localtime=True)
+        mid = make_msgid(domain="example.com")
+        kwargs = dict(as_html=as_html, reply_to=reply_to, date=date, message_id=mid)
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            _flatten(_build_message(SENDER, rcpts, subject, body, files=attachments, **kwargs))
+        slow = (time.perf_counter() - start) / rounds
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            fast_mime.serialize(SENDER, rcpts, subject, body, attachments=attachments, **kwargs)
+        fast = (time.perf_counter() - start) / rounds
+        print(f"{name:18s} EmailMessage {slow * 1e6:8.1f} µs → fast_mime {fast * 1e6:6.1f} µs（{slow / fast:.0f}x）")
+
+
+def main(rounds: int = 2000) -> None:
+    failures = verify()
+    print()
+    bench(rounds)
+    if failures:
+        sys.exit(f"❌ {failures} 個樣本不一致")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
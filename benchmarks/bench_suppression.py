@@ -0,0 +1,49 @@
+"""停止寄送名單效能測試：百萬筆名單下，單次查詢應在數微秒內完成。
+
+執行方式：
+    uv run python -m benchmarks.bench_suppression [筆數]
+"""
+
+from __future__ import annotations
+
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from app.suppression import SuppressionList, write_file
+
+
+def main(n: int = 1_000_000, lookups: int = 200_000) -> None:
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "suppression.bin"
+        start = time.perf_counter()
+        write_file(path, (f"user{i}@corp{i % 500}.example.com" for i in range(n)))
+        build = time.perf_counter() - start
+
+        suppression = SuppressionList(path)
+        # 一般情況：絕大多數收件者不在名單中，另混入 1% 命中
+        probes = []
+        for i in range(lookups):
+            if rng.random() < 0.01:
+                k = rng.randrange(n)
+                probes.append(f"User{k}@Corp{k % 500}.example.com")
+            else:
+                probes.append(f"someone{i}@other.example.org")
+        hits = 0
+        start = time.perf_counter()
+        for addr in probes:
+            hits += addr in suppression
+        elapsed = time.perf_counter() - start
+        suppression.close()
+
+        print(f"名單 {n:,} 筆，檔案 {path.stat().st_size / 1024 / 1024:.1f} MB，建立耗時 {build:.1f} 秒")
+        print(f"查詢 {lookups:,} 次（命中 {hits:,}）：平均 {elapsed / lookups * 1e6:.2f} µs/次")
+        if elapsed / lookups >= 10e-6:
+            sys.exit("❌ 超過 10 µs 目標")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,419 @@
+"""排程重播與負載測試：以模擬時鐘加速執行真實的排程設定，寄到本機 SMTP 接收端。
+
+以 ScheduleService.add_jobs（與 MainWindow / daemon 相同的路徑）建立任務，
+APScheduler 與 dispatcher 皆為正式程式碼，只將時間換成 N 倍速的模擬時鐘：
+- 觸發延遲：實際觸發（模擬時間）與排定時間的差距
+- 寄達延遲：排程觸發到 SMTP 接收端回覆 250 的時間
+- 併發峰值：同時執行的排程任務、dispatcher 佇列深度與 SMTP 連線數
+- misfire 與因 max_instances 被略過的次數、每分鐘吞吐量
+
+任務組合檔（JSON）：
+    {
+      "start": "2025-01-06T08:58:00",
+      "jobs": [
+        {"count": 300, "daily": true, "time": "09:00"},
+        {"count": 200, "weekday": true, "time": "09:00", "recipients": 3, "body_bytes": 4000},
+        {"count": 5, "calendar": "2025-01-06T12:30"}
+      ]
+    }
+
+執行方式：
+    uv run python -m benchmarks.replay_schedule [jobs.json] --speed 60 --duration 10m
+    uv run python -m benchmarks.replay_schedule jobs.json --duration 3d --skip-idle
+
+注意：模擬時間中的所有延遲都會乘上倍速，倍速過高時 Python 本身的處理時間也會被放大，
+結果應與較低倍速的測試互相比對。為了與正式環境相同的實際時間判斷 misfire，
+APScheduler 的 misfire_grace_time（預設 1 秒）與 dispatcher 的合併時間窗都依倍速換算成模擬時間，
+觸發延遲另以實際秒數列出。
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from threading import TIMEOUT_MAX
+from typing import Callable, Optional
+
+import apscheduler.executors.base
+import apscheduler.schedulers.base
+from apscheduler.events import (
+    EVENT_JOB_ERROR,
+    EVENT_JOB_EXECUTED,
+    EVENT_JOB_MAX_INSTANCES,
+    EVENT_JOB_MISSED,
+)
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.base import STATE_STOPPED
+
+import app.schedule_service
+from app import config
+from app.dispatcher import SendDispatcher
+from app.schedule_service import ScheduleService
+from benchmarks.smtp_sink import SMTPSink
+
+# 正式環境使用 APScheduler 預設的 misfire 寬限（實際秒）
+MISFIRE_GRACE_TIME = 1
+
+DEFAULT_JOBS = {
+    "jobs": [
+        {"count": 300, "daily": True, "time": "09:00"},
+        {"count": 200, "weekday": True, "time": "09:00"},
+        {"count": 50, "daily": True, "time": "09:01", "recipients": 5},
+    ]
+}
+
+
+# ----------------------------------------------------------
+# 模擬時鐘
+# ----------------------------------------------------------
+class SimClock:
+    """以 speed 倍速前進的時鐘，可在閒置時直接跳到下一個觸發時間。"""
+
+    def __init__(self, start: datetime, speed: float):
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._sim_base = start.timestamp()
+        self._real_base = time.monotonic()
+
+    def time(self) -> float:
+        with self._lock:
+            return self._sim_base + (time.monotonic() - self._real_base) * self.speed
+
+    def now(self, tz=None) -> datetime:
+        return datetime.fromtimestamp(self.time(), tz)
+
+    def advance(self, seconds: float) -> None:
+        with self._lock:
+            self._sim_base += max(0.0, seconds)
+
+
+def _patch_datetime(clock: SimClock) -> Callable[[], None]:
+    """讓 APScheduler 與 ScheduleService 的 datetime.now() 改讀模擬時鐘，回傳還原函式。"""
+
+    class SimDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return clock.now(tz)
+
+    modules = (apscheduler.schedulers.base, apscheduler.executors.base, app.schedule_service)
+    originals = [m.datetime for m in modules]
+    for m in modules:
+        m.datetime = SimDatetime
+
+    def restore() -> None:
+        for m, original in zip(modules, originals):
+            m.datetime = original
+
+    return restore
+
+
+class SimScheduler(BackgroundScheduler):
+    """等待時間依倍速縮短；skip_idle 時在沒有寄送中的郵件時直接跳到下一個觸發時間。"""
+
+    def __init__(self, clock: SimClock, *, is_idle: Callable[[], bool], skip_idle: bool, end: float, **kwargs):
+        super().__init__(**kwargs)
+        self.clock = clock
+        self.is_idle = is_idle
+        self.skip_idle = skip_idle
+        self.end = end
+
+    def _main_loop(self):
+        wait_seconds = self._process_jobs()
+        while self.state != STATE_STOPPED:
+            if wait_seconds is None or wait_seconds >= TIMEOUT_MAX:
+                wait_seconds = max(0.0, self.end - self.clock.time())
+            if self.skip_idle and wait_seconds > 1 and self.is_idle():
+                self.clock.advance(min(wait_seconds, self.end - self.clock.time()))
+                wait_seconds = 0
+            # 有寄送中的郵件時最多等 0.1 秒（實際時間）就重新判斷是否可跳過
+            real_wait = wait_seconds / self.clock.speed
+            self._event.wait(min(real_wait, 0.1) if self.skip_idle else real_wait)
+            self._event.clear()
+            wait_seconds = self._process_jobs()
+
+
+# ----------------------------------------------------------
+# 量測
+# ----------------------------------------------------------
+class Recorder:
+    def __init__(self, clock: SimClock):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.fire_lag: list[float] = []
+        self.delivery: list[float] = []
+        self.missed = 0
+        self.skipped = 0
+        self.errors = 0
+        self.failed = 0
+        self.running = 0
+        self.peak_running = 0
+        self.peak_queue = 0
+        self.fires_per_second: Counter[int] = Counter()
+
+    def on_event(self, event) -> None:
+        now = self.clock.time()
+        with self._lock:
+            if event.code == EVENT_JOB_MISSED:
+                self.missed += 1
+            elif event.code == EVENT_JOB_MAX_INSTANCES:
+                self.skipped += 1
+            else:
+                self.errors += event.code == EVENT_JOB_ERROR
+                self.fire_lag.append(now - event.scheduled_run_time.timestamp())
+                self.fires_per_second[int(now)] += 1
+
+    def job_started(self) -> None:
+        with self._lock:
+            self.running += 1
+            self.peak_running = max(self.peak_running, self.running)
+
+    def job_finished(self) -> None:
+        with self._lock:
+            self.running -= 1
+
+    def submitted(self, future, fired_at: float) -> None:
+        def done(f) -> None:
+            with self._lock:
+                if f.exception() is None:
+                    self.delivery.append(self.clock.time() - fired_at)
+                else:
+                    self.failed += 1
+
+        future.add_done_callback(done)
+
+
+class ReplayDispatcher(SendDispatcher):
+    def __init__(self, recorder: Recorder, **kwargs):
+        super().__init__(**kwargs)
+        self.recorder = recorder
+
+    def submit(self, payload: dict, desc: str = "", **kwargs):
+        fired_at = self.recorder.clock.time()
+        future = super().submit(payload, desc, **kwargs)
+        self.recorder.submitted(future, fired_at)
+        stats = self.stats()
+        with self.recorder._lock:
+            self.recorder.peak_queue = max(self.recorder.peak_queue, stats["queued"] + stats["in_flight"])
+        return future
+
+
+class ReplayService(ScheduleService):
+    def __init__(self, recorder: Recorder, **kwargs):
+        super().__init__(**kwargs)
+        self.recorder = recorder
+
+    def _run_scheduled_send(self, payload: dict, job_desc: str, job_id: str | None = None) -> None:
+        self.recorder.job_started()
+        try:
+            super()._run_scheduled_send(payload, job_desc, job_id)
+        finally:
+            self.recorder.job_finished()
+
+
+# ----------------------------------------------------------
+# 任務組合
+# ----------------------------------------------------------
+def _payload(n: int, recipients: int, body_bytes: int) -> dict:
+    line = "Load test message body. "
+    body = (line * (body_bytes // len(line) + 1))[:body_bytes]
+    return {
+        "to_addrs": [f"user{n}-{i}@loadtest.example.com" for i in range(recipients)],
+        "subject": f"Replay job {n}",
+        "body": body,
+    }
+
+
+def load_jobs(service: ReplayService, spec: dict) -> int:
+    """依組合檔建立任務，回傳任務數。"""
+    total = 0
+    for group in spec["jobs"]:
+        hour, minute = (int(x) for x in group.get("time", "09:00").split(":"))
+        calendar_dt = datetime.fromisoformat(group["calendar"]) if group.get("calendar") else None
+        opts = {
+            "daily": bool(group.get("daily")),
+            "weekday": bool(group.get("weekday")),
+            "use_calendar": calendar_dt is not None,
+            "daily_time": (hour, minute),
+        }
+        for _ in range(int(group.get("count", 1))):
+            payload = _payload(total, int(group.get("recipients", 1)), int(group.get("body_bytes", 1000)))
+            total += len(service.add_jobs(payload, opts, calendar_dt))
+    return total
+
+
+def _parse_duration(text: str) -> float:
+    m = re.fullmatch(r"(\d+(?:\.\d+)?)([smhd]?)", text)
+    if not m:
+        raise argparse.ArgumentTypeError("格式例如 90s、10m、2h、3d")
+    return float(m.group(1)) * {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}[m.group(2)]
+
+
+def _pct(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def _report(rec: Recorder, sink: SMTPSink, jobs: int, real_elapsed: float, sim_elapsed: float, speed: float) -> dict:
+    per_minute = Counter(int(t // 60) for t, _ in sink.stats.received)
+    per_10s = Counter(int(t // 10) for t, _ in sink.stats.received)
+    return {
+        "jobs": jobs,
+        "fires": len(rec.fire_lag),
+        "misfires": rec.missed,
+        "skipped_max_instances": rec.skipped,
+        "job_errors": rec.errors,
+        "send_failures": rec.failed,
+        "fire_lag_s": {"p50": _pct(rec.fire_lag, 0.5), "p95": _pct(rec.fire_lag, 0.95), "max": max(rec.fire_lag, default=0.0)},
+        # 排程器本身的延遲與倍速無關，換回實際秒數才能與 misfire 寬限比較
+        "fire_lag_real_s": {
+            "p50": _pct(rec.fire_lag, 0.5) / speed,
+            "p95": _pct(rec.fire_lag, 0.95) / speed,
+            "max": max(rec.fire_lag, default=0.0) / speed,
+        },
+        "misfire_grace_s": MISFIRE_GRACE_TIME,
+        "delivery_s": {"p50": _pct(rec.delivery, 0.5), "p95": _pct(rec.delivery, 0.95), "max": max(rec.delivery, default=0.0)},
+        "peak_running_jobs": rec.peak_running,
+        "peak_fires_per_second": max(rec.fires_per_second.values(), default=0),
+        "peak_dispatch_backlog": rec.peak_queue,
+        "peak_smtp_sessions": sink.stats.peak_active,
+        "smtp_connections": sink.stats.connections,
+        "messages": sink.stats.messages,
+        "recipients": sink.stats.recipients,
+        "peak_messages_per_minute": max(per_minute.values(), default=0),
+        "peak_messages_per_second_10s": max(per_10s.values(), default=0) / 10,
+        "sim_seconds": sim_elapsed,
+        "real_seconds": real_elapsed,
+    }
+
+
+def _print_report(r: dict) -> None:
+    lag, real, dl = r["fire_lag_s"], r["fire_lag_real_s"], r["delivery_s"]
+    print(f"任務 {r['jobs']:,}，觸發 {r['fires']:,}，misfire {r['misfires']:,}，max_instances 略過 {r['skipped_max_instances']:,}")
+    print(f"觸發延遲（模擬秒） p50 {lag['p50']:.2f} / p95 {lag['p95']:.2f} / max {lag['max']:.2f}")
+    print(
+        f"觸發延遲（實際秒） p50 {real['p50']:.3f} / p95 {real['p95']:.3f} / max {real['max']:.3f}"
+        f"（misfire 寬限 {r['misfire_grace_s']} 秒）"
+    )
+    print(f"寄達延遲（模擬秒） p50 {dl['p50']:.2f} / p95 {dl['p95']:.2f} / max {dl['max']:.2f}")
+    print(
+        f"併發峰值：排程任務 {r['peak_running_jobs']}、每秒觸發 {r['peak_fires_per_second']}、"
+        f"dispatcher 積壓 {r['peak_dispatch_backlog']}、SMTP 連線 {r['peak_smtp_sessions']}（共 {r['smtp_connections']} 次連線）"
+    )
+    print(
+        f"吞吐量：寄出 {r['messages']:,} 封（{r['recipients']:,} 位收件者），尖峰每分鐘 {r['peak_messages_per_minute']:,} 封，"
+        f"尖峰 10 秒平均 {r['peak_messages_per_second_10s']:.1f} 封/秒"
+    )
+    print(f"失敗：任務錯誤 {r['job_errors']}、寄送失敗 {r['send_failures']}")
+    print(f"模擬 {timedelta(seconds=round(r['sim_seconds']))}，實際耗時 {r['real_seconds']:.1f} 秒")
+
+
+def run(
+    spec: dict,
+    *,
+    speed: float,
+    duration: float,
+    skip_idle: bool,
+    smtp_latency: float,
+    workers: Optional[int],
+) -> dict:
+    start = datetime.fromisoformat(spec["start"]) if spec.get("start") else None
+    if start is None:
+        # 預設從下一個 08:58 開始，涵蓋 09:00 的尖峰
+        now = datetime.now()
+        start = now.replace(hour=8, minute=58, second=0, microsecond=0)
+        if start <= now:
+            start += timedelta(days=1)
+    clock = SimClock(start, speed)
+    end = clock.time() + duration
+    sink = SMTPSink(latency=smtp_latency / speed, clock=clock.time).start()
+
+    # 寄到本機接收端；停用停止寄送名單、冪等紀錄與寄件備份，避免測試資料寫入正式檔案
+    config.SMTP_SERVER, config.SMTP_PORT, config.SMTP_SECURITY = sink.host, sink.port, "NONE"
+    config.SMTP_USER, config.SMTP_PASS = "loadtest@example.com", "loadtest"
+    config.SUPPRESSION_FILE = ""
+    config.IDEMPOTENCY_FILE = ""
+    config.ARCHIVE_FILE = ""
+
+    restore = _patch_datetime(clock)
+    rec = Recorder(clock)
+    dispatcher = ReplayDispatcher(rec, window=config.COALESCE_WINDOW / speed)
+
+    def is_idle() -> bool:
+        stats = dispatcher.stats()
+        return rec.running == 0 and stats["queued"] == 0 and stats["in_flight"] == 0
+
+    executors = {"default": ThreadPoolExecutor(workers)} if workers else None
+    # misfire 寬限以模擬秒計算，乘上倍速才與正式環境的實際寬限相同
+    scheduler = SimScheduler(
+        clock,
+        is_idle=is_idle,
+        skip_idle=skip_idle,
+        end=end,
+        job_defaults={"misfire_grace_time": MISFIRE_GRACE_TIME * speed},
+        **({"executors": executors} if executors else {}),
+    )
+    scheduler.add_listener(rec.on_event, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+    service = ReplayService(rec, dispatcher=dispatcher, scheduler=scheduler)
+    jobs = load_jobs(service, spec)
+
+    real_start = time.monotonic()
+    sim_start = clock.time()
+    service.start()
+    try:
+        while clock.time() < end:
+            time.sleep(0.05)
+    finally:
+        service.shutdown(wait=True)
+        restore()
+        sink.close()
+    return _report(rec, sink, jobs, time.monotonic() - real_start, clock.time() - sim_start, speed)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.replay_schedule", description="排程重播與負載測試")
+    parser.add_argument("jobs", nargs="?", help="任務組合 JSON（預設為 09:00 尖峰的 550 個任務）")
+    parser.add_argument("--speed", type=float, default=60.0, help="模擬倍速（預設 60）")
+    parser.add_argument("--duration", type=_parse_duration, default=600.0, help="模擬時間長度，例如 10m、2d（預設 10m）")
+    parser.add_argument("--skip-idle", action="store_true", help="沒有寄送中的郵件時直接跳到下一個觸發時間")
+    parser.add_argument("--smtp-latency", type=float, default=0.05, help="SMTP 接收端每封郵件的延遲（模擬秒，預設 0.05）")
+    parser.add_argument("--workers", type=int, help="APScheduler 執行緒池大小（預設與正式環境相同）")
+    parser.add_argument("--json", dest="json_out", help="另將結果寫入 JSON 檔")
+    parser.add_argument("--log", action="store_true", help="保留寄信日誌（預設關閉，避免寫入大量測試紀錄）")
+    args = parser.parse_args(argv)
+
+    if not args.log:
+        logging.disable(logging.WARNING)
+    if args.jobs:
+        with open(args.jobs, "r", encoding="utf-8") as f:
+            spec = json.load(f)
+    else:
+        spec = DEFAULT_JOBS
+
+    report = run(
+        spec,
+        speed=args.speed,
+        duration=args.duration,
+        skip_idle=args.skip_idle,
+        smtp_latency=args.smtp_latency,
+        workers=args.workers,
+    )
+    _print_report(report)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if report["misfires"] or report["send_failures"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""本機 SMTP 接收端：接受任何帳號登入與收件者，只統計收到的郵件，供負載測試使用。
+
+支援 EHLO / HELO、AUTH PLAIN / LOGIN、MAIL、RCPT、DATA、RSET、NOOP、QUIT，
+不支援 STARTTLS（負載測試時請將 SMTP_SECURITY 設為 NONE）。
+
+單獨執行：
+    uv run python -m benchmarks.smtp_sink [port]
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+
+@dataclass
+class SinkStats:
+    messages: int = 0
+    recipients: int = 0
+    bytes: int = 0
+    connections: int = 0
+    # 超過 max_connections 而以 421 拒絕的連線數
+    rejected: int = 0
+    active: int = 0
+    peak_active: int = 0
+    # (時間, 位元組) — 時間由 clock 提供，負載測試時為模擬時間
+    received: list[tuple[float, int]] = field(default_factory=list)
+
+
+class SMTPSink:
+    """在背景執行緒執行的 asyncio SMTP 伺服器。"""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        *,
+        latency: float = 0.0,
+        capacity: int = 0,
+        max_connections: int = 0,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.host = host
+        self.port = port
+        # 每封郵件 DATA 結束後回覆前的延遲（秒），模擬伺服器處理時間
+        self.latency = latency
+        # 模擬中繼伺服器過載：同時連線超過 capacity 時延遲依比例增加，
+        # 超過 max_connections 時以 421 拒絕（0 為不限制）
+        self.capacity = capacity
+        self.max_connections = max_connections
+        self.clock = clock
+        self.stats = SinkStats()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+    # -- 生命週期 ---------------------------------------------------------
+    def start(self) -> "SMTPSink":
+        self._thread = threading.Thread(target=self._run, name="smtp-sink", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def close(self) -> None:
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle, self.host, self.port, limit=1 << 20)
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            self._loop.close()
+
+    # -- 協定 -------------------------------------------------------------
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        with self._lock:
+            if self.max_connections and self.stats.active >= self.max_connections:
+                self.stats.rejected += 1
+                writer.write(b"421 4.7.0 Too many connections, try again later\r\n")
+                writer.close()
+                return
+            self.stats.connections += 1
+            self.stats.active += 1
+            self.stats.peak_active = max(self.stats.peak_active, self.stats.active)
+
+        def reply(line: str) -> None:
+            writer.write(line.encode("ascii") + b"\r\n")
+
+        rcpts = 0
+        try:
+            reply("220 smtp-sink ESMTP")
+            await writer.drain()
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                verb = line[:4].upper()
+                if verb == b"EHLO":
+                    writer.write(b"250-smtp-sink\r\n250-AUTH PLAIN LOGIN\r\n250-8BITMIME\r\n250 SIZE 0\r\n")
+                elif verb == b"HELO":
+                    reply("250 smtp-sink")
+                elif verb == b"AUTH":
+                    parts = line.split()
+                    if len(parts) == 2 and parts[1].upper() == b"LOGIN":
+                        for prompt in ("334 VXNlcm5hbWU6", "334 UGFzc3dvcmQ6"):
+                            reply(prompt)
+                            await writer.drain()
+                            await reader.readline()
+                    elif len(parts) == 2:
+                        reply("334 ")
+                        await writer.drain()
+                        await reader.readline()
+                    reply("235 2.7.0 Authentication successful")
+                elif verb == b"MAIL":
+                    rcpts = 0
+                    reply("250 2.1.0 OK")
+                elif verb == b"RCPT":
+                    rcpts += 1
+                    reply("250 2.1.5 OK")
+                elif verb == b"DATA":
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    await writer.drain()
+                    size = 0
+                    while True:
+                        chunk = await reader.readline()
+                        if not chunk or chunk == b".\r\n":
+                            break
+                        size += len(chunk)
+                    if self.latency:
+                        load = self.stats.active / self.capacity if self.capacity else 1.0
+                        await asyncio.sleep(self.latency * max(1.0, load))
+                    with self._lock:
+                        self.stats.messages += 1
+                        self.stats.recipients += rcpts
+                        self.stats.bytes += size
+                        self.stats.received.append((self.clock(), size))
+                    reply("250 2.0.0 Queued")
+                elif verb == b"QUIT":
+                    reply("221 2.0.0 Bye")
+                    await writer.drain()
+                    break
+                else:
+                    # RSET / NOOP 等其他指令一律接受
+                    reply("250 2.0.0 OK")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            with self._lock:
+                self.stats.active -= 1
+            writer.close()
+
+
+def main(port: int = 2525) -> None:
+    sink = SMTPSink(port=port).start()
+    print(f"SMTP sink 監聽 {sink.host}:{sink.port}（Ctrl+C 結束）")
+    try:
+        while True:
+            time.sleep(5)
+            s = sink.stats
+            print(f"郵件 {s.messages:,}、收件者 {s.recipients:,}、{s.bytes / 1024:,.0f} KB、連線峰值 {s.peak_active}")
+    except KeyboardInterrupt:
+        sink.close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2525)
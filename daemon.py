@@ -0,0 +1,48 @@
+"""SimpleMailGUI 無介面常駐程式：執行排程器與寄送引擎，不載入 Tk。
+
+GUI（main.py）啟動時若偵測到 daemon，會改為透過本機 IPC 建立與列出排程，
+關閉視窗也不會中止已建立的排程。
+"""
+
+import signal
+import threading
+
+from app import config
+from app.ipc import DaemonServer
+from app.log_service import log_info
+from app.profiling import profile_section
+from app.schedule_service import ScheduleService
+from app.submission_api import SubmissionServer
+
+
+def run() -> None:
+    """啟動排程服務與 IPC，直到收到 SIGINT / SIGTERM。"""
+
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+
+    with profile_section("startup"):
+        service = ScheduleService()
+        service.start()
+        server = DaemonServer(service)
+        server.start()
+        submission = None
+        if config.SUBMIT_ENABLED:
+            submission = SubmissionServer(service.dispatcher)
+            submission.start()
+    log_info("🛰️ SimpleMailGUI daemon 已啟動")
+
+    try:
+        stop.wait()
+    finally:
+        server.close()
+        if submission is not None:
+            submission.close()
+        # 等待已排入 dispatcher 的郵件寄完再結束
+        service.shutdown(wait=True)
+        log_info("🛑 SimpleMailGUI daemon 已停止")
+
+
+if __name__ == "__main__":
+    run()
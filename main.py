@@ -1,8 +1,10 @@
 """SimpleMailGUI 入口：負責啟動 CustomTkinter 主視窗。"""
 
+from app.profiling import profile_section
 from ui import MainWindow
 
 if __name__ == "__main__":
-    # 建立主視窗並啟動事件迴圈
-    app = MainWindow()
+    # 建立主視窗並啟動事件迴圈（啟用剖析時會記錄啟動耗時）
+    with profile_section("startup"):
+        app = MainWindow()
     app.mainloop()
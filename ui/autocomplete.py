@@ -0,0 +1,143 @@
+"""收件者自動完成：在輸入欄位下方列出 app.contacts 的建議，以方向鍵選擇、Enter / Tab 填入。"""
+
+from __future__ import annotations
+
+import tkinter as tk
+
+import customtkinter as ctk
+
+from app.contacts import SUGGEST_LIMIT, ContactBook
+
+# 不觸發查詢的按鍵（由各自的綁定處理）
+_NAV_KEYS = {"Up", "Down", "Return", "Tab", "Escape", "Shift_L", "Shift_R", "Control_L", "Control_R", "Alt_L", "Alt_R"}
+
+
+def current_token(text: str, cursor: int) -> tuple[int, str]:
+    """
+    回傳游標所在位址的 (起點, 內容)：
+    從游標往前找到最近一個不在引號或角括號內的逗號 / 分號。
+    """
+    start = 0
+    quoted = False
+    angle = 0
+    for i, ch in enumerate(text[:cursor]):
+        if ch == '"':
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif ch == "<":
+            angle += 1
+        elif ch == ">":
+            angle = max(0, angle - 1)
+        elif ch in ",;" and not angle:
+            start = i + 1
+    return start, text[start:cursor].lstrip()
+
+
+class RecipientAutocomplete:
+    """掛在 CTkEntry 上的下拉建議清單；通訊錄尚未載入完成時不顯示任何建議。"""
+
+    def __init__(self, entry: ctk.CTkEntry, book: ContactBook, *, limit: int = SUGGEST_LIMIT):
+        self.entry = entry
+        self.book = book
+        self.limit = limit
+        self._matches: list = []
+        self._popup: tk.Toplevel | None = None
+        self._listbox: tk.Listbox | None = None
+
+        entry.bind("<KeyRelease>", self._on_key)
+        entry.bind("<Down>", lambda _e: self._move(1))
+        entry.bind("<Up>", lambda _e: self._move(-1))
+        entry.bind("<Return>", self._on_accept)
+        entry.bind("<Tab>", self._on_accept)
+        entry.bind("<Escape>", lambda _e: self.hide())
+        # 延後關閉，讓滑鼠點選清單項目時仍能取得選取結果
+        entry.bind("<FocusOut>", lambda _e: entry.after(150, self._hide_if_unfocused))
+
+    # -- 事件 -------------------------------------------------------------
+    def _on_key(self, event) -> None:
+        if event.keysym in _NAV_KEYS:
+            return
+        _, token = current_token(self.entry.get(), self.entry.index("insert"))
+        self._matches = self.book.suggest(token, self.limit) if token else []
+        if self._matches:
+            self._show()
+        else:
+            self.hide()
+
+    def _move(self, step: int):
+        if not self._visible():
+            return None
+        lb = self._listbox
+        current = lb.curselection()
+        i = (current[0] + step) if current else (0 if step > 0 else len(self._matches) - 1)
+        i = max(0, min(len(self._matches) - 1, i))
+        lb.selection_clear(0, "end")
+        lb.selection_set(i)
+        lb.see(i)
+        return "break"
+
+    def _on_accept(self, _event=None):
+        if not self._visible():
+            return None
+        current = self._listbox.curselection()
+        self._accept(self._matches[current[0] if current else 0])
+        return "break"
+
+    def _accept(self, contact) -> None:
+        """以選取的聯絡人取代游標所在的位址，並加上分隔符號以便繼續輸入。"""
+        text = self.entry.get()
+        cursor = self.entry.index("insert")
+        start, _ = current_token(text, cursor)
+        before = text[:start].rstrip()
+        if before:
+            before += " "
+        after = text[cursor:]
+        self.entry.delete(0, "end")
+        self.entry.insert(0, f"{before}{contact.display}, {after.lstrip()}")
+        self.entry.icursor(len(before) + len(contact.display) + 2)
+        self.entry.focus_set()
+        self.hide()
+
+    # -- 下拉清單 ---------------------------------------------------------
+    def _visible(self) -> bool:
+        return self._popup is not None and bool(self._matches)
+
+    def _show(self) -> None:
+        if self._popup is None:
+            self._popup = tk.Toplevel(self.entry)
+            self._popup.overrideredirect(True)
+            dark = ctk.get_appearance_mode() == "Dark"
+            self._listbox = tk.Listbox(
+                self._popup,
+                activestyle="none",
+                exportselection=False,
+                borderwidth=1,
+                highlightthickness=0,
+                background="#2b2b2b" if dark else "#ffffff",
+                foreground="#dce4ee" if dark else "#1a1a1a",
+                selectbackground="#1f6aa5",
+                selectforeground="#ffffff",
+            )
+            self._listbox.pack(fill="both", expand=True)
+            self._listbox.bind("<ButtonRelease-1>", lambda _e: self._on_accept())
+        lb = self._listbox
+        lb.delete(0, "end")
+        for c in self._matches:
+            lb.insert("end", c.display)
+        lb.configure(height=len(self._matches))
+        lb.selection_set(0)
+        x = self.entry.winfo_rootx()
+        y = self.entry.winfo_rooty() + self.entry.winfo_height()
+        self._popup.geometry(f"{self.entry.winfo_width()}x{lb.winfo_reqheight()}+{x}+{y}")
+        self._popup.deiconify()
+        self._popup.lift()
+
+    def hide(self) -> None:
+        self._matches = []
+        if self._popup is not None:
+            self._popup.withdraw()
+
+    def _hide_if_unfocused(self) -> None:
+        if self._popup is not None and self.entry.focus_get() is not self._listbox:
+            self.hide()
@@ -3,18 +3,28 @@
 from __future__ import annotations
 
 import threading
-from datetime import datetime
-from uuid import uuid4
 
 import customtkinter as ctk
 from tkinter import messagebox
 
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
-
+from app import profiling
+from app.contacts import get_contact_book
+from app.dispatcher import LANE_INTERACTIVE
+from app.idempotency import DuplicateSend, content_key
+from app.ipc import DaemonClient
 from app.mail_service import send_email
+from app.recipients import process_recipients
 from app.log_service import log_info, log_exception
-from .tab_container import TabContainer
+from app.schedule_service import ScheduleService
+from .progress import FRAME_INTERVAL_MS, ProgressChannel
+from .tab_container import FormSnapshot, TabContainer
+
+# 進度通道通知種類對應的對話框
+_NOTICE_DIALOGS = {
+    "info": messagebox.showinfo,
+    "warning": messagebox.showwarning,
+    "error": messagebox.showerror,
+}
 
 
 class MainWindow(ctk.CTk):
@@ -25,47 +35,78 @@ class MainWindow(ctk.CTk):
         self.title("Simple Mail GUI")
         self.geometry("900x640")
 
-        self.scheduler = BackgroundScheduler()
-        self.scheduler.start()
+        # 若本機有執行 daemon.py，排程交給 daemon；否則在視窗內執行排程器
+        remote = DaemonClient.connect()
+        self._remote_schedules = remote is not None
+        self.schedules = remote or ScheduleService()
+        if not self._remote_schedules:
+            self.schedules.start()
+        log_info("📅 排程模式：" + ("daemon" if self._remote_schedules else "本機"))
         self.protocol("WM_DELETE_WINDOW", self._on_close)
 
         self.grid_rowconfigure(0, weight=1)
         self.grid_columnconfigure(0, weight=1)
 
+        # 背景寄信執行緒透過 progress 回報進度，UI 以固定頻率重繪
+        self.progress = ProgressChannel()
+        # 收件者自動完成的通訊錄，於背景執行緒載入
+        self.contacts = get_contact_book()
+
         # 由 TabContainer 建立並管理所有頁籤
-        self.tabs = TabContainer(self, self.send_email_thread)
+        self.tabs = TabContainer(
+            self,
+            self.send_email_thread,
+            self.show_jobs,
+            on_profile_toggle=profiling.set_enabled,
+            profiling_enabled=profiling.is_enabled(),
+            contacts=self.contacts,
+        )
         self.tabs.grid(row=0, column=0, padx=20, pady=20, sticky="nsew")
 
     # ------------------------------------------------------------------
     # 寄信處理
     # ------------------------------------------------------------------
     def send_email_thread(self):
-        """以背景執行緒寄信，避免阻塞 UI。"""
+        """以背景執行緒寄信，避免阻塞 UI。表單內容先在 Tk 執行緒擷取成快照。"""
 
-        t = threading.Thread(target=self._send_email, daemon=True)
+        form = self.tabs.snapshot_form()
+        self.tabs.disable_send_button()
+        self.progress.reset(status="Sending...")
+        t = threading.Thread(target=self._send_email, args=(form,), daemon=True)
         t.start()
+        self._tick_progress()
 
-    def _send_email(self):
-        """實際的寄信流程，確保 UI 更新透過 self.after 呼叫。"""
+    def _tick_progress(self) -> None:
+        """以固定頻率重繪進度並顯示背景執行緒排入的通知，直到工作結束。"""
 
-        self.after(0, self.tabs.disable_send_button)
-        self.after(0, lambda: self.tabs.set_status("Sending..."))
+        snapshot = self.progress.snapshot()
+        self.tabs.update_progress(snapshot)
+        for kind, title, text in self.progress.drain_notices():
+            _NOTICE_DIALOGS[kind](title, text)
+        if snapshot.finished:
+            self.tabs.enable_send_button()
+            return
+        self.after(FRAME_INTERVAL_MS, self._tick_progress)
 
+    def _send_email(self, form: FormSnapshot):
+        """實際的寄信流程（背景執行緒），只透過 self.progress 回報狀態，不直接操作 Tk。"""
+
+        progress = self.progress
+        status = None
         try:
-            to_raw = self.tabs.get_recipients_raw()
-            subject = self.tabs.get_subject()
-            body = self.tabs.get_body()
-            schedule_opts = self.tabs.get_schedule_options()
-            calendar_dt = self.tabs.get_calendar_datetime()
-
-            if not to_raw:
-                warning_msg = "Please enter at least one recipient."
-                self.after(0, lambda: messagebox.showwarning("Missing field", warning_msg))
+            schedule_opts = form.schedule_options
+            calendar_dt = form.calendar_datetime
+
+            if not form.recipients_raw:
+                progress.notify("warning", "Missing field", "Please enter at least one recipient.")
                 return
 
-            # 支援逗號或分號分隔多個收件人
-            to_addrs = [addr.strip() for addr in to_raw.replace(";", ",").split(",") if addr.strip()]
-            attachments = list(self.tabs.get_attachments())
+            # 支援逗號或分號分隔多個收件人，以及 "Doe, Jane" <j@x> 等完整位址語法
+            recipients = process_recipients(form.recipients_raw)
+            if recipients.invalid:
+                warning_msg = "以下收件者格式錯誤：\n" + "\n".join(recipients.invalid[:10])
+                progress.notify("warning", "收件者格式錯誤", warning_msg)
+                return
 
             schedule_enabled = (
                 schedule_opts["use_calendar"]
@@ -74,127 +115,106 @@ class MainWindow(ctk.CTk):
             )
 
             if schedule_opts["use_calendar"] and calendar_dt is None:
-                msg = "請先在「月曆」頁籤點選日期並設定時間。"
-                self.after(0, lambda: messagebox.showwarning("排程設定不完整", msg))
+                progress.notify("warning", "排程設定不完整", "請先在「月曆」頁籤點選日期並設定時間。")
                 return
 
             payload = {
-                "to_addrs": to_addrs,
-                "subject": subject,
-                "body": body,
-                "attachments": attachments,
+                "to_addrs": recipients.to,
+                "subject": form.subject,
+                "body": form.body,
+                "attachments": list(form.attachments),
             }
 
             if schedule_enabled:
                 try:
-                    descriptions = self._schedule_jobs(payload, schedule_opts, calendar_dt)
+                    descriptions = self.schedules.add_jobs(payload, schedule_opts, calendar_dt)
                 except ValueError as exc:
-                    self.after(0, lambda: self.tabs.set_status("❌ Schedule failed."))
-                    self.after(0, lambda: messagebox.showwarning("排程設定錯誤", str(exc)))
+                    status = "❌ Schedule failed."
+                    progress.notify("warning", "排程設定錯誤", str(exc))
                 else:
+                    self._remember_recipients(recipients.to)
                     summary = "\n".join(f"• {desc}" for desc in descriptions)
-                    log_info("📅 已建立排程：" + " / ".join(descriptions))
-                    self.after(0, lambda: self.tabs.set_status("📅 Scheduled"))
-                    self.after(
-                        0,
-                        lambda: messagebox.showinfo(
-                            "已建立排程",
-                            f"以下排程已透過 APScheduler 建立：\n{summary}",
-                        ),
-                    )
+                    status = "📅 Scheduled"
+                    progress.notify("info", "已建立排程", f"以下排程已透過 APScheduler 建立：\n{summary}")
                 return
 
-            self._send_immediate(payload)
+            status = self._send_immediate(payload)
 
         except Exception as e:  # noqa: BLE001 - 保留一般例外記錄
             log_exception(e)
-            self.after(0, lambda: self.tabs.set_status("❌ Failed to send."))
-            self.after(0, lambda: messagebox.showerror("Error", f"Failed to send email:\n{e}"))
+            status = "❌ Failed to send."
+            progress.notify("error", "Error", f"Failed to send email:\n{e}")
         finally:
-            self.after(0, self.tabs.enable_send_button)
+            progress.finish(status or "Ready")
 
-    def _send_immediate(self, payload: dict) -> None:
-        """立即寄送郵件，供非排程狀態使用。"""
+    def _send_immediate(self, payload: dict) -> str:
+        """立即寄送郵件，供非排程狀態使用，回傳最終狀態文字。"""
 
         to_addrs = payload["to_addrs"]
         subject = payload["subject"]
         body = payload["body"]
         attachments = payload["attachments"]
 
+        # 相同內容短時間內重按「寄送」只寄一次
+        key = content_key(to_addrs, subject, body, attachments=attachments)
+        on_sent = lambda nbytes: self.progress.record(sent=1, nbytes=nbytes)  # noqa: E731
+
+        self.progress.add_total(1)
         log_info(f"📨 開始寄信給 {to_addrs}（附件 {len(attachments)} 個）...")
-        send_email(to_addrs, subject, body, attachments=attachments)
+        try:
+            if self._remote_schedules:
+                send_email(to_addrs, subject, body, attachments=attachments, on_sent=on_sent, idempotency_key=key)
+            else:
+                # 交由本機 dispatcher 的 interactive 優先順序寄送：排程大量寄送進行中也能立即寄出，
+                # 且與排程共用連線數上限
+                self.schedules.dispatcher.submit(
+                    {**payload, "idempotency_key": key}, "手動寄送", lane=LANE_INTERACTIVE, on_sent=on_sent
+                ).result()
+        except DuplicateSend as exc:
+            # 沒有實際寄送，不計入進度
+            self.progress.add_total(-1)
+            log_info(f"⏭ {exc}")
+            self.progress.notify("warning", "Duplicate", f"這封郵件{exc}")
+            return "⏭ Skipped duplicate."
+        except Exception:
+            self.progress.record(failed=1)
+            raise
         log_info("✅ 郵件寄出成功。")
+        self._remember_recipients(to_addrs)
 
-        self.after(0, lambda: self.tabs.set_status("✅ Sent successfully."))
-        self.after(0, lambda: messagebox.showinfo("Success", "Email sent successfully!"))
-
-    def _schedule_jobs(self, payload: dict, schedule_opts: dict, calendar_dt) -> list[str]:
-        """依照排程設定建立 APScheduler 任務，回傳描述清單。"""
-
-        descriptions: list[str] = []
-        hour, minute = schedule_opts["daily_time"]
-        now = datetime.now()
-
-        if schedule_opts["use_calendar"]:
-            if calendar_dt is None:
-                raise ValueError("請在月曆頁籤選擇日期與時間。")
-            if calendar_dt <= now:
-                raise ValueError("排程時間必須晚於目前時間。")
-            desc = f"單次排程：{calendar_dt:%Y-%m-%d %H:%M}"
-            self.scheduler.add_job(
-                self._run_scheduled_send,
-                trigger="date",
-                run_date=calendar_dt,
-                args=[payload, desc],
-                id=f"once-{uuid4()}",
-                replace_existing=False,
-            )
-            descriptions.append(desc)
-
-        if schedule_opts["daily"]:
-            desc = f"每日 {hour:02d}:{minute:02d}"
-            trigger = CronTrigger(hour=hour, minute=minute)
-            self.scheduler.add_job(
-                self._run_scheduled_send,
-                trigger=trigger,
-                args=[payload, desc],
-                id=f"daily-{uuid4()}",
-                replace_existing=False,
-            )
-            descriptions.append(desc)
-
-        if schedule_opts["weekday"]:
-            desc = f"週一至週五 {hour:02d}:{minute:02d}"
-            trigger = CronTrigger(day_of_week="mon-fri", hour=hour, minute=minute)
-            self.scheduler.add_job(
-                self._run_scheduled_send,
-                trigger=trigger,
-                args=[payload, desc],
-                id=f"weekday-{uuid4()}",
-                replace_existing=False,
-            )
-            descriptions.append(desc)
+        self.progress.notify("info", "Success", "Email sent successfully!")
+        return "✅ Sent successfully."
 
-        if not descriptions:
-            raise ValueError("請至少選擇一種排程方式。")
+    def _remember_recipients(self, recipients: list[str]) -> None:
+        """將收件者記入通訊錄，提高之後自動完成的排序。"""
 
-        return descriptions
+        if self.contacts is not None:
+            self.contacts.record(recipients)
 
-    def _run_scheduled_send(self, payload: dict, job_desc: str) -> None:
-        """供 APScheduler 呼叫的背景寄信任務。"""
+    def show_jobs(self) -> None:
+        """列出目前的排程（本機或 daemon 端）。"""
 
         try:
-            log_info(f"📅 [排程觸發] {job_desc} → 目的地 {payload['to_addrs']}")
-            send_email(payload["to_addrs"], payload["subject"], payload["body"], attachments=payload["attachments"])
-            log_info(f"✅ [排程完成] {job_desc}")
+            jobs = self.schedules.list_jobs()
         except Exception as exc:  # noqa: BLE001
             log_exception(exc)
+            messagebox.showerror("排程清單", f"無法取得排程：\n{exc}")
+            return
+        if not jobs:
+            messagebox.showinfo("排程清單", "目前沒有任何排程。")
+            return
+        lines = []
+        for job in jobs:
+            next_run = f"{job['next_run_time']:%Y-%m-%d %H:%M}" if job["next_run_time"] else "已暫停"
+            lines.append(f"• {job['desc']}（下次 {next_run}）→ {', '.join(job['to_addrs'])}：{job['subject']}")
+        source = "daemon" if self._remote_schedules else "本機"
+        messagebox.showinfo(f"排程清單（{source}）", "\n".join(lines))
 
     def _on_close(self):
-        """視窗關閉時停止排程器並釋放資源。"""
+        """視窗關閉時停止本機排程器並釋放資源（daemon 中的排程不受影響）。"""
 
         try:
-            self.scheduler.shutdown(wait=False)
+            self.schedules.shutdown(wait=False)
         except Exception:
             pass
         self.destroy()
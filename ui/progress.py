@@ -0,0 +1,121 @@
+"""寄信進度通道：工作執行緒只累加計數，Tk 執行緒以固定頻率讀取並重繪。"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+# 進度重繪間隔（毫秒），約每秒 10 格；再多的事件也只會觸發這麼多次 UI 更新
+FRAME_INTERVAL_MS = 100
+
+
+@dataclass(frozen=True)
+class ProgressSnapshot:
+    """某一時間點的進度，供 UI 重繪使用。"""
+
+    total: int
+    sent: int
+    failed: int
+    bytes_sent: int
+    elapsed: float
+    status: str
+    finished: bool
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.total - self.sent - self.failed)
+
+    @property
+    def fraction(self) -> float:
+        if self.total <= 0:
+            return 1.0 if self.finished else 0.0
+        return min(1.0, (self.sent + self.failed) / self.total)
+
+    @property
+    def bytes_per_sec(self) -> float:
+        return self.bytes_sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> float | None:
+        """預估剩餘秒數，尚無完成項目時回傳 None。"""
+        done = self.sent + self.failed
+        if self.finished or done == 0:
+            return None
+        return self.elapsed / done * self.remaining
+
+
+class ProgressChannel:
+    """執行緒安全的進度累加器與通知佇列，不直接觸碰任何 Tk 元件。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._notices: deque[tuple[str, str, str]] = deque()
+        self.reset()
+
+    # -- 工作執行緒端 -----------------------------------------------------
+    def reset(self, total: int = 0, status: str = "") -> None:
+        with self._lock:
+            self._total = total
+            self._sent = 0
+            self._failed = 0
+            self._bytes = 0
+            self._status = status
+            self._started = time.monotonic()
+            self._finished = False
+            self._notices.clear()
+
+    def add_total(self, count: int) -> None:
+        with self._lock:
+            self._total += count
+
+    def record(self, *, sent: int = 0, failed: int = 0, nbytes: int = 0) -> None:
+        with self._lock:
+            self._sent += sent
+            self._failed += failed
+            self._bytes += nbytes
+
+    def set_status(self, text: str) -> None:
+        with self._lock:
+            self._status = text
+
+    def notify(self, kind: str, title: str, text: str) -> None:
+        """排入一則對話框通知（kind 為 info / warning / error），由 UI 執行緒顯示。"""
+        self._notices.append((kind, title, text))
+
+    def finish(self, status: str | None = None) -> None:
+        with self._lock:
+            if status is not None:
+                self._status = status
+            self._finished = True
+
+    # -- UI 執行緒端 ------------------------------------------------------
+    def snapshot(self) -> ProgressSnapshot:
+        with self._lock:
+            return ProgressSnapshot(
+                total=self._total,
+                sent=self._sent,
+                failed=self._failed,
+                bytes_sent=self._bytes,
+                elapsed=time.monotonic() - self._started,
+                status=self._status,
+                finished=self._finished,
+            )
+
+    def drain_notices(self) -> list[tuple[str, str, str]]:
+        notices = []
+        while self._notices:
+            notices.append(self._notices.popleft())
+        return notices
+
+
+def format_progress(snap: ProgressSnapshot) -> str:
+    """組合進度列下方的說明文字。"""
+
+    parts = [f"已寄出 {snap.sent}", f"失敗 {snap.failed}", f"剩餘 {snap.remaining}"]
+    if snap.bytes_sent:
+        parts.append(f"{snap.bytes_per_sec / 1024:.1f} KB/s")
+    if snap.eta is not None:
+        parts.append(f"預估剩餘 {snap.eta:.0f} 秒")
+    return " · ".join(parts)
@@ -4,11 +4,23 @@ from __future__ import annotations
 
 import customtkinter as ctk
 
+from .autocomplete import RecipientAutocomplete
+from .progress import ProgressSnapshot, format_progress
+
 
 class ComposeTab:
     """封裝寄信頁籤元素，提供資料讀取與狀態控制。"""
 
-    def __init__(self, parent: ctk.CTkFrame, on_send, on_schedule_change=None):
+    def __init__(
+        self,
+        parent: ctk.CTkFrame,
+        on_send,
+        on_schedule_change=None,
+        on_list_jobs=None,
+        on_profile_toggle=None,
+        profiling_enabled: bool = False,
+        contacts=None,
+    ):
         self.parent = parent
         self._schedule_change_callback = on_schedule_change
         self._suppress_schedule_event = False
@@ -20,6 +32,8 @@ class ComposeTab:
         ctk.CTkLabel(parent, text="To:").grid(row=0, column=0, padx=10, pady=10, sticky="e")
         self.to_entry = ctk.CTkEntry(parent, width=400, placeholder_text="someone@example.com")
         self.to_entry.grid(row=0, column=1, padx=10, pady=10, sticky="ew")
+        # 依寄送紀錄與通訊錄自動完成（通訊錄在背景載入）
+        self.autocomplete = RecipientAutocomplete(self.to_entry, contacts) if contacts is not None else None
 
         # 主旨欄位
         ctk.CTkLabel(parent, text="Subject:").grid(row=1, column=0, padx=10, pady=10, sticky="e")
@@ -48,14 +62,35 @@ class ComposeTab:
         self.send_btn = ctk.CTkButton(status_row, text="Send", command=on_send)
         self.send_btn.grid(row=0, column=1, padx=(10, 0), sticky="e")
 
+        # 效能剖析開關（寫出 logs/profiles/*.pstats）
+        if on_profile_toggle:
+            self.profile_var = ctk.BooleanVar(value=profiling_enabled)
+            ctk.CTkSwitch(
+                status_row,
+                text="Profiling",
+                variable=self.profile_var,
+                command=lambda: on_profile_toggle(self.profile_var.get()),
+            ).grid(row=0, column=2, padx=(10, 0), sticky="e")
+
+        # 進度列：由主視窗以固定頻率更新
+        self.progress_bar = ctk.CTkProgressBar(status_row)
+        self.progress_bar.set(0)
+        self.progress_bar.grid(row=1, column=0, columnspan=3, pady=(6, 0), sticky="ew")
+        self.progress_var = ctk.StringVar(value="")
+        ctk.CTkLabel(status_row, textvariable=self.progress_var).grid(row=2, column=0, columnspan=3, sticky="w")
+
         # 排程設定
         self.schedule_frame = ctk.CTkFrame(parent)
         self.schedule_frame.grid(row=5, column=1, padx=10, pady=(5, 10), sticky="ew")
         self.schedule_frame.grid_columnconfigure(1, weight=1)
 
         ctk.CTkLabel(self.schedule_frame, text="排程設定", font=ctk.CTkFont(weight="bold")).grid(
-            row=0, column=0, columnspan=3, sticky="w"
+            row=0, column=0, columnspan=2, sticky="w"
         )
+        if on_list_jobs:
+            ctk.CTkButton(self.schedule_frame, text="排程清單", width=90, command=on_list_jobs).grid(
+                row=0, column=2, sticky="e"
+            )
 
         self.schedule_once_var = ctk.BooleanVar(value=False)
         self.daily_var = ctk.BooleanVar(value=False)
@@ -123,6 +158,11 @@ class ComposeTab:
     def set_status(self, text: str) -> None:
         self.status_var.set(text)
 
+    def update_progress(self, snapshot: ProgressSnapshot) -> None:
+        self.status_var.set(snapshot.status or self.status_var.get())
+        self.progress_bar.set(snapshot.fraction)
+        self.progress_var.set(format_progress(snapshot) if snapshot.total else "")
+
     def disable_send_button(self) -> None:
         self.send_btn.configure(state="disabled")
 
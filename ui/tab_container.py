@@ -2,6 +2,9 @@
 
 from __future__ import annotations
 
+from dataclasses import dataclass
+from datetime import datetime
+
 import customtkinter as ctk
 
 from .tab_compose import ComposeTab
@@ -9,10 +12,30 @@ from .tab_attachments import AttachmentTab
 from .tab_calendar import CalendarTab
 
 
+@dataclass(frozen=True)
+class FormSnapshot:
+    """在 Tk 執行緒擷取的表單內容，背景執行緒只讀取這份快照。"""
+
+    recipients_raw: str
+    subject: str
+    body: str
+    attachments: list[str]
+    schedule_options: dict
+    calendar_datetime: datetime | None
+
+
 class TabContainer:
     """建立 TabView 並整合各個頁籤的對外介面。"""
 
-    def __init__(self, master: ctk.CTkFrame, on_send):
+    def __init__(
+        self,
+        master: ctk.CTkFrame,
+        on_send,
+        on_list_jobs=None,
+        on_profile_toggle=None,
+        profiling_enabled: bool = False,
+        contacts=None,
+    ):
         self.tabview = ctk.CTkTabview(master)
         compose_frame = self.tabview.add("寄信")
         attachment_frame = self.tabview.add("附件")
@@ -23,6 +46,10 @@ class TabContainer:
             compose_frame,
             on_send,
             on_schedule_change=self._handle_schedule_mode_change,
+            on_list_jobs=on_list_jobs,
+            on_profile_toggle=on_profile_toggle,
+            profiling_enabled=profiling_enabled,
+            contacts=contacts,
         )
         self.attachment_tab = AttachmentTab(attachment_frame, self._handle_attachment_change)
         self.calendar_tab = CalendarTab(calendar_frame)
@@ -32,6 +59,18 @@ class TabContainer:
         self.tabview.grid(*args, **kwargs)
 
     # -- 對外 API --------------------------------------------------------
+    def snapshot_form(self) -> FormSnapshot:
+        """一次讀取所有欄位（須在 Tk 執行緒呼叫）。"""
+
+        return FormSnapshot(
+            recipients_raw=self.get_recipients_raw(),
+            subject=self.get_subject(),
+            body=self.get_body(),
+            attachments=self.get_attachments(),
+            schedule_options=self.get_schedule_options(),
+            calendar_datetime=self.get_calendar_datetime(),
+        )
+
     def get_recipients_raw(self) -> str:
         return self.compose_tab.get_recipients_raw()
 
@@ -53,6 +92,9 @@ class TabContainer:
     def set_status(self, text: str) -> None:
         self.compose_tab.set_status(text)
 
+    def update_progress(self, snapshot) -> None:
+        self.compose_tab.update_progress(snapshot)
+
     def disable_send_button(self) -> None:
         self.compose_tab.disable_send_button()
 